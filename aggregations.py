@@ -0,0 +1,106 @@
+from sqlalchemy import inspect
+from db_operations import build_crash_filters, make_statement
+from factors import UNSPECIFIED, factor_table, factor_values_table, top_per_group
+from result_cache import cached_read_sql
+from rollups import MEASURES, ROLLUP_KEYS, UNKNOWN_BOROUGH, pick_rollup, rollup_table
+from schema import GRAIN_EXPRESSIONS
+
+# Plain columns that can be grouped on as they are
+GROUP_COLUMNS = ("BOROUGH", "ZIP_CODE")
+
+DAY_NAMES = {1: "Sunday", 2: "Monday", 3: "Tuesday", 4: "Wednesday", 5: "Thursday", 6: "Friday", 7: "Saturday"}
+
+
+def crash_counts(engine, group_by, borough=None, start_date=None, end_date=None, zip_code=None,
+                 table_name="crash_data", use_rollups=True):
+    """
+    Counts crashes and sums the casualties per group, the GROUP BY runs in the database.
+    When the grain and the filters allow it the rollup tables are read instead of the raw rows.
+    :param engine: The SQLAlchemy engine object
+    :param group_by: List of grains (YEAR, MONTH, DAY, DAY_OF_WEEK, HOUR) and/or BOROUGH, ZIP_CODE
+    :param borough: A borough or a list of boroughs
+    :param start_date: Keep crashes on or after this date
+    :param end_date: Keep crashes before this date (exclusive)
+    :param zip_code: A zip code or a list of zip codes
+    :param table_name: The table name
+    :param use_rollups: Read the rollup tables when they can answer the query
+    :return : returns one row per group with CRASHES, INJURED, KILLS and CASUALTIES
+    """
+    expressions = GRAIN_EXPRESSIONS["mysql" if engine.dialect.name == "mysql" else "sqlite"]
+    rollup = pick_rollup(group_by, zip_code, start_date, end_date) if use_rollups else None
+    if rollup is not None and not inspect(engine).has_table(rollup_table(table_name, rollup)):
+        rollup = None
+
+    select_list = []
+    for grain in group_by:
+        if rollup is not None and grain in ROLLUP_KEYS[rollup]:
+            select_list.append(grain)
+        elif grain in expressions:
+            expression = expressions[grain]
+            if rollup is not None:
+                expression = expression.replace("CRASH_DATE", "DAY")
+            select_list.append(f"{expression} AS {grain}")
+        elif grain in GROUP_COLUMNS:
+            select_list.append(grain)
+        else:
+            raise ValueError(f"Unknown grain {grain!r}")
+    group_list = ", ".join(group_by)
+
+    if rollup is None:
+        source = table_name
+        measures = ("COUNT(*) AS CRASHES, SUM(NUMBER_OF_INJURED) AS INJURED, "
+                    "SUM(NUMBER_OF_KILLS) AS KILLS, SUM(NUMBER_OF_CASUALTIES) AS CASUALTIES")
+        conditions, params, expanding = build_crash_filters(borough, start_date, end_date, zip_code)
+    else:
+        source = rollup_table(table_name, rollup)
+        measures = ", ".join(f"SUM({measure}) AS {measure}" for measure in MEASURES)
+        conditions, params, expanding = build_crash_filters(borough, start_date, end_date, zip_code,
+                                                            date_column="DAY", date_format="%Y-%m-%d")
+    query = f"SELECT {', '.join(select_list)}, {measures} FROM {source}"
+    statement = make_statement(query, conditions, expanding, f" GROUP BY {group_list} ORDER BY {group_list}")
+    # The rollups change with the crash table, so they share its version in the cache
+    counts = cached_read_sql(engine, statement, params, table_name)
+    if rollup is not None:
+        # Put back the missing values the rollup keys can't hold
+        if "BOROUGH" in counts.columns:
+            counts["BOROUGH"] = counts["BOROUGH"].replace(UNKNOWN_BOROUGH, None)
+        if "ZIP_CODE" in counts.columns:
+            counts["ZIP_CODE"] = counts["ZIP_CODE"].replace("", None)
+        # Missing values sort first, like the NULLs of the raw query
+        counts = counts.sort_values(list(group_by), na_position="first", ignore_index=True)
+    return counts
+
+
+def top_factors(engine, kind="FACTOR", k=10, group_by=None, borough=None, start_date=None, end_date=None,
+                zip_code=None, table_name="crash_data", include_unspecified=False):
+    """
+    Counts the contributing factors or vehicle types of the matching crashes, the counting runs in the
+    database on the factor table
+    :param engine: The SQLAlchemy engine object
+    :param kind: FACTOR for the contributing factors, VEHICLE for the vehicle type codes
+    :param k: Number of values to keep per group
+    :param group_by: List of grains (YEAR, MONTH, DAY, DAY_OF_WEEK, HOUR) and/or BOROUGH, ZIP_CODE
+    :param borough: A borough or a list of boroughs
+    :param start_date: Keep crashes on or after this date
+    :param end_date: Keep crashes before this date (exclusive)
+    :param zip_code: A zip code or a list of zip codes
+    :param table_name: The crash table
+    :param include_unspecified: Also count 'Unspecified'
+    :return : returns the k most frequent values per group with their COUNT
+    """
+    group_by = list(group_by or [])
+    expressions = GRAIN_EXPRESSIONS["mysql" if engine.dialect.name == "mysql" else "sqlite"]
+    select_list = [f"{expressions[grain]} AS {grain}" if grain in expressions else grain for grain in group_by]
+    query = (f"SELECT {''.join(column + ', ' for column in select_list)}v.VALUE AS VALUE, COUNT(*) AS COUNT "
+             f"FROM {factor_table(table_name)} f "
+             f"JOIN {factor_values_table(table_name)} v ON v.VALUE_ID = f.VALUE_ID "
+             f"JOIN {table_name} c ON c.COLLISION_ID = f.COLLISION_ID")
+    conditions, params, expanding = build_crash_filters(borough, start_date, end_date, zip_code)
+    conditions.append("f.KIND = :kind")
+    params["kind"] = kind
+    if not include_unspecified:
+        conditions.append("v.VALUE <> :unspecified")
+        params["unspecified"] = UNSPECIFIED
+    statement = make_statement(query, conditions, expanding, f" GROUP BY {', '.join(group_by + ['v.VALUE'])}")
+    counts = cached_read_sql(engine, statement, params, table_name)
+    return top_per_group(counts, group_by, k)
@@ -1,8 +1,12 @@
+import os
 import numpy as np
 from sklearn.cluster import DBSCAN
 from sklearn.preprocessing import StandardScaler
 import matplotlib.pyplot as plt
+from clustering import IncrementalDBSCAN, cluster_profile, dbscan_haversine, dbscan_sweep, haversine_sweep
 from db_operations import create_connection, pull_data_from_db
+from instrumentation import span
+from plotting import finish_figure
 
 
 def plot_raw_data(data):
@@ -15,42 +19,98 @@ def plot_raw_data(data):
     plt.xlabel('Longitude')
     plt.ylabel('Latitude')
     plt.legend()
-    plt.show()
+    finish_figure("raw_data")
 
 
-def Perform_DBSCAN(data, eps, minpts):
+def Perform_DBSCAN(data, eps, minpts, haversine=False, n_jobs=1):
     """
     This function performs DBSCAN using sklearn package
+    :param eps: Neighbourhood radius, in standardised units or in metres when haversine is True
+    :param haversine: Cluster the coordinates with the haversine engine from clustering.py
+    :param n_jobs: Worker processes of the haversine engine
     """
     if data.empty:
         print("No data available for clustering")
         return data
 
-    features = data[['LATITUDE', 'LONGITUDE']]
-    scaler = StandardScaler()
-    features = scaler.fit_transform(features)
+    with span("Perform_DBSCAN", rows_in=len(data), eps=eps, min_samples=minpts, haversine=haversine) as stage:
+        if haversine:
+            labels = dbscan_haversine(data['LATITUDE'], data['LONGITUDE'], eps, minpts, n_jobs)
+        else:
+            features = data[['LATITUDE', 'LONGITUDE']]
+            scaler = StandardScaler()
+            features = scaler.fit_transform(features)
 
-    db = DBSCAN(eps=eps, min_samples=minpts).fit(features)
-    labels = db.labels_
+            db = DBSCAN(eps=eps, min_samples=minpts).fit(features)
+            labels = db.labels_
+        stage.set(clusters=int(labels.max() + 1), noise=int((labels == -1).sum()))
 
     data = data.copy()  # Create a copy to avoid SettingWithCopyWarning
     data['CLUSTER'] = labels
     return data
 
+
+def Sweep_DBSCAN(data, eps_values, min_samples_values, n_jobs=1, haversine=False):
+    """
+    Runs DBSCAN on the coordinates for every eps and min_samples combination,
+    sharing one neighbour graph between all of them
+    :param eps_values: Neighbourhood radii, in standardised units or in metres when haversine is True
+    :param n_jobs: Number of worker processes
+    :param haversine: Sweep the coordinates on the haversine metric from clustering.py
+    :return : returns the summary of every combination and a dict of labels keyed by (eps, min_samples)
+    """
+    if haversine:
+        return haversine_sweep(data['LATITUDE'], data['LONGITUDE'], eps_values, min_samples_values, n_jobs=n_jobs,
+                               return_labels=True)
+    features = StandardScaler().fit_transform(data[['LATITUDE', 'LONGITUDE']])
+    return dbscan_sweep(features, eps_values, min_samples_values, n_jobs=n_jobs, return_labels=True)
+
+def Incremental_DBSCAN(engine, table_name, state_path, eps_m, minpts, borough=None):
+    """
+    Adds the crashes loaded since the last run to a saved incremental DBSCAN state, only the new
+    crashes are pulled and clustered. The state remembers the highest COLLISION_ID it has seen, so
+    late reports of old crashes are picked up too. Corrections of crashes already in the state keep
+    their first position, points can't be removed from it.
+    :param state_path: Pickle file of the state, created on the first run
+    :param eps_m: Neighbourhood radius in metres
+    :param borough: Borough filter, keep one state file per filter
+    :return : returns the new crashes with their CLUSTER and the updated state
+    """
+    state = IncrementalDBSCAN.load(state_path) if os.path.exists(state_path) else None
+    if state is not None and (state.eps_m, state.min_samples) != (eps_m, minpts):
+        print(f"{state_path} was built with eps={state.eps_m}, min_samples={state.min_samples}, starting over")
+        state = None
+    if state is not None and state.watermark is not None and not isinstance(state.watermark, (int, np.integer)):
+        print(f"{state_path} was keyed on crash dates, starting over")
+        state = None
+    if state is None:
+        state = IncrementalDBSCAN(eps_m, minpts)
+
+    data = pull_data_from_db(engine, table_name, borough=borough, after_collision_id=state.watermark)
+    if data.empty:
+        print("No new crashes to cluster")
+        return data, state
+
+    data = data.copy()
+    data['CLUSTER'] = state.insert(data['LATITUDE'], data['LONGITUDE'])
+    state.watermark = int(data['COLLISION_ID'].max())
+    state.save(state_path)
+    print(f"Clustered {len(data)} new crashes, {state.n_rows} crashes in {state.n_clusters} clusters so far")
+    return data, state
+
 def plot_clusters(data, eps, minpts):
     """
     Plots the clusters with longitude and latitude on the x and y axis.
     """
     plt.figure(figsize=(10, 8))
-    unique_clusters = set(data['CLUSTER'])
-    colors = [plt.cm.Spectral(each) for each in np.linspace(0, 1, len(unique_clusters))]
+    clusters = data.groupby('CLUSTER', sort=True)
+    colors = [plt.cm.Spectral(each) for each in np.linspace(0, 1, clusters.ngroups)]
 
-    for cluster, color in zip(unique_clusters, colors):
+    for (cluster, clustered_points), color in zip(clusters, colors):
         if cluster == -1:
             # Black used for noise.
             color = [0, 0, 0, 1]
 
-        clustered_points = data[data['CLUSTER'] == cluster]
         plt.plot(clustered_points['LONGITUDE'], clustered_points['LATITUDE'], 'o', markerfacecolor=tuple(color),
                  markeredgecolor='k', markersize=6, label=f'Cluster {cluster}')
 
@@ -58,69 +118,47 @@ def plot_clusters(data, eps, minpts):
     plt.xlabel('Longitude')
     plt.ylabel('Latitude')
     plt.legend(loc='best')
-    plt.show()
+    finish_figure(f"dbscan_{eps}_{minpts}")
 
 
 if __name__ == "__main__":
     try:
-        # MySQL database connection details
-        host_name = "localhost"
-        user_name = "root"
-        user_password = "nc8121"
-        db_name = "nyc_crash_data"
         table_name = "crash_data"
 
-        # Create a connection to the MySQL database
-        engine = create_connection(host_name, user_name, user_password, db_name)
+        engine = create_connection()
 
-        # Pull data from the database
-        db_data = pull_data_from_db(engine)
+        # Pull the Queens crashes of 2019, the filters run in the database
+        data_2019 = pull_data_from_db(engine, table_name, borough="QUEENS",
+                                      start_date="2019-01-01", end_date="2020-01-01")
 
-        # Ensure 'BOROUGH' column exists
-        if 'BOROUGH' not in db_data.columns:
-            print("The 'BOROUGH' column is missing in the data.")
+        if data_2019.empty:
+            print("No data available for Queens.")
         else:
-            # Filter data for Brooklyn
-            brooklyn_data = db_data[db_data["BOROUGH"] == "QUEENS"].copy()
-            data_2019 = brooklyn_data[brooklyn_data['CRASH_DATE'].dt.year == 2019].copy()
-
-            if data_2019.empty:
-                print("No data available for Brooklyn.")
-            else:
-                # Plot raw data before clustering
-                plot_raw_data(data_2019)
-
-                # Define the ranges for eps and min_samples
-                eps_values = [0.1]
-                min_samples_values = [20]
-
-                # Iterate over combinations of eps and min_samples
-                for eps in eps_values:
-                    for minpts in min_samples_values:
-                        # Perform DBSCAN on the filtered Brooklyn data
-                        print(f"dbscan with values, eps: {eps}, minpts: {minpts}")
-                        clustered_data = Perform_DBSCAN(data_2019, eps, minpts)
-
-                        if not clustered_data.empty:
-
-                            print(clustered_data.head())
-
-                            # Show the unique clusters and their counts
-                            unique_clusters = clustered_data['CLUSTER'].unique()
-                            print(f"\nUnique clusters identified (eps={eps}, min_samples={minpts}): {unique_clusters}")
-                            cluster_counts = clustered_data['CLUSTER'].value_counts().sort_index()
-                            print(f"\nCluster counts (eps={eps}, min_samples={minpts}):")
-                            print(cluster_counts)
-
-                            # Show the number of clusters and noise points
-                            n_clusters = len(set(clustered_data['CLUSTER'])) - (
-                                1 if -1 in clustered_data['CLUSTER'] else 0)
-                            n_noise = list(clustered_data['CLUSTER']).count(-1)
-                            print(f"\nEstimated number of clusters (eps={eps}, min_samples={minpts}): {n_clusters}")
-                            print(f"Estimated number of noise points (eps={eps}, min_samples={minpts}): {n_noise}")
-
-                            # Plot the clusters for each combination
-                            plot_clusters(clustered_data, eps, minpts)
+            # Plot raw data before clustering
+            plot_raw_data(data_2019)
+
+            # Define the ranges for eps and min_samples
+            eps_values = [0.1]
+            min_samples_values = [20]
+
+            # Cluster every combination from one neighbour graph
+            summary, sweep_labels = Sweep_DBSCAN(data_2019, eps_values, min_samples_values)
+            print(summary.to_string(index=False))
+
+            for (eps, minpts), labels in sweep_labels.items():
+                print(f"dbscan with values, eps: {eps}, minpts: {minpts}")
+                clustered_data = data_2019.copy()
+                clustered_data['CLUSTER'] = labels
+
+                print(clustered_data.head())
+
+                # Show the size, location and casualties of every cluster
+                profile = cluster_profile(clustered_data)
+                print(f"\nCluster profile (eps={eps}, min_samples={minpts}):")
+                print(profile)
+
+                # Plot the clusters for each combination
+                plot_clusters(clustered_data, eps, minpts)
     except Exception as e:
         print(f"An error occurred: {e}")
         if engine:
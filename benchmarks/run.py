@@ -0,0 +1,242 @@
+"""
+Times and memory-profiles the pipeline on synthetic collisions and writes the results as JSON.
+
+Every step runs --repeat times for the timings, then once more under tracemalloc for the peak
+memory (Python objects and numpy arrays, not the database's own allocations). The database is a
+temporary SQLite file unless a SQLAlchemy url is given:
+    python benchmarks/run.py --rows 10000 100000 1000000
+    python benchmarks/run.py --rows 100000 --baseline benchmarks/results/previous.json
+Steps more than --threshold times slower than in the baseline are reported and make the run exit 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sqlalchemy import create_engine
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from analyze_data import Perform_DBSCAN  # noqa: E402
+from cleaning import clean_collisions  # noqa: E402
+from crash_dataset import CrashDataset  # noqa: E402
+from db_operations import create_table_if_not_exists, drop_table_if_exists, pull_data_from_db, \
+    push_data_to_db  # noqa: E402
+from factors import count_factors  # noqa: E402
+from heat_grid import bin_points  # noqa: E402
+from push_data import data_preprocessing, read_csv_chunks  # noqa: E402
+from result_cache import invalidate_cache  # noqa: E402
+from synthetic import write_collisions_csv  # noqa: E402
+from time_series import count_series, max_windows, top_windows  # noqa: E402
+from vis import fetch_day_of_week_data, fetch_hourly_crash_data  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def measure(function, repeat=3, memory=True, setup=None):
+    """
+    Times function and measures its peak memory
+    :param function: The step, called with the arguments returned by setup
+    :param repeat: Number of timed runs
+    :param memory: Run once more under tracemalloc for the peak memory
+    :param setup: Builds fresh arguments before every run, not timed
+    :return : returns the result of the last run and a dict of measurements
+    """
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function(*args)
+            seconds.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        args = setup() if setup else ()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracemalloc.start()
+            try:
+                function(*args)
+                peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            finally:
+                tracemalloc.stop()
+    return result, {"seconds_min": min(seconds), "seconds_median": statistics.median(seconds),
+                    "repeat": repeat, "peak_mb": peak_mb}
+
+
+def eda_frame(raw):
+    """
+    The crashes the ram/ scripts analyse: raw column names, a datetime CRASH DATE and no crashes
+    without coordinates or zip code
+    """
+    return clean_collisions(raw)[0]
+
+
+def run_suite(rows, engine, table_name="crash_data_bench", repeat=3, memory=True, cluster_rows=50000, seed=0):
+    """
+    Runs every step on rows synthetic collisions
+    :param rows: Number of raw collisions
+    :param engine: The SQLAlchemy engine object, the table is dropped and recreated
+    :param cluster_rows: Largest number of crashes clustered, DBSCAN runs on a sample above it
+    :return : returns one dict per step
+    """
+    results = []
+
+    def record(step, function, rows_in, setup=None):
+        result, measured = measure(function, repeat, memory, setup)
+        rows_out = len(result) if hasattr(result, "__len__") else None
+        results.append({"step": step, "rows": rows, "rows_in": rows_in, "rows_out": rows_out, **measured,
+                        "rows_per_sec": rows_in / measured["seconds_min"] if measured["seconds_min"] else None})
+        print(f"{rows:>10} {step:<22} {measured['seconds_min']:9.3f}s"
+              + (f" {measured['peak_mb']:9.1f} MB" if measured["peak_mb"] is not None else ""))
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "collisions.csv")
+        write_collisions_csv(csv_path, rows, seed=seed)
+        raw = record("read_csv", lambda: pd.concat(read_csv_chunks(csv_path), ignore_index=True), rows)
+        # The ram/ scripts read every column, the street names included
+        eda = eda_frame(pd.read_csv(csv_path, dtype={"ZIP CODE": str}, low_memory=False))
+
+    cleaned = record("data_preprocessing", data_preprocessing, len(raw), setup=lambda: (raw.copy(),))
+
+    def fresh_table():
+        with contextlib.redirect_stdout(io.StringIO()):
+            drop_table_if_exists(engine, table_name)
+            create_table_if_not_exists(engine, table_name)
+        return ()
+    record("push_data_to_db", lambda: push_data_to_db(cleaned, engine, table_name, bulk=True) or cleaned,
+           len(cleaned), setup=fresh_table)
+
+    crashes = record("pull_data_from_db", lambda: pull_data_from_db(engine, table_name, use_cache=False),
+                     len(cleaned))
+    queens = record("pull_filtered", lambda: pull_data_from_db(engine, table_name, borough="QUEENS",
+                                                               start_date="2019-01-01", end_date="2020-01-01",
+                                                               use_cache=False), len(crashes))
+
+    sample = queens if len(queens) <= cluster_rows else queens.sample(cluster_rows, random_state=seed)
+    record("dbscan_standardised", lambda: Perform_DBSCAN(sample, 0.1, 20), len(sample))
+    record("dbscan_haversine", lambda: Perform_DBSCAN(sample, 100, 20, haversine=True), len(sample))
+
+    # The day of week and hourly charts of vis.py, the result cache is emptied so the database does the work
+    record("vis_day_of_week", lambda: fetch_day_of_week_data(engine, "BROOKLYN", table_name=table_name),
+           len(crashes), setup=lambda: invalidate_cache(table_name) or ())
+    record("vis_hourly", lambda: fetch_hourly_crash_data(engine, "BROOKLYN", table_name=table_name),
+           len(crashes), setup=lambda: invalidate_cache(table_name) or ())
+
+    # The aggregations behind the ram/EDA.py charts
+    dataset = record("eda_crash_dataset", lambda: CrashDataset(eda), len(eda))
+    record("eda_top_zip_street", lambda: pd.concat([eda["ZIP CODE"].value_counts()[:10],
+                                                    eda["ON STREET NAME"].value_counts()[:10]]), len(eda))
+    record("eda_factors", lambda: pd.concat([count_factors(eda, "FACTOR", 10), count_factors(eda, "VEHICLE", 10)]),
+           len(eda))
+    brooklyn = dataset.select("BROOKLYN").to_frame()
+    record("eda_time_series", lambda: pd.concat([max_windows(count_series(brooklyn, "D"), 100),
+                                                 top_windows(count_series(eda, "D"), k=12)]), len(eda))
+    record("eda_heat_grid", lambda: bin_points(eda, group_column="ZIP CODE"), len(eda))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        drop_table_if_exists(engine, table_name)
+    invalidate_cache(table_name)
+    return results
+
+
+def cli_startup(repeat=3):
+    """
+    Time to first work of `cli.py ingest`: a fresh interpreter importing what the subcommand needs
+    :return : returns one dict per subcommand, in the format of run_suite
+    """
+    command = [sys.executable, os.path.join(REPO_ROOT, "cli.py"), "--startup-only", "ingest", "unused.csv"]
+    _, measured = measure(lambda: subprocess.run(command, check=True, capture_output=True), repeat, memory=False)
+    print(f"{0:>10} {'cli_ingest_startup':<22} {measured['seconds_min']:9.3f}s")
+    return [{"step": "cli_ingest_startup", "rows": 0, "rows_in": None, "rows_out": None, **measured,
+             "rows_per_sec": None}]
+
+
+def environment():
+    """
+    Versions and machine the results were measured with
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "numpy": np.__version__, "pandas": pd.__version__,
+            "sklearn": sklearn.__version__}
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the ratio of every step's time to the baseline's
+    :return : returns the steps slower than threshold times the baseline
+    """
+    previous = {(entry["step"], entry["rows"]): entry["seconds_min"] for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry["step"], entry["rows"]))
+        if not before:
+            continue
+        ratio = entry["seconds_min"] / before
+        flag = ""
+        if ratio > threshold:
+            regressions.append(entry["step"])
+            flag = "  REGRESSION"
+        print(f"{entry['rows']:>10} {entry['step']:<22} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--cluster-rows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="SQLAlchemy url, defaults to a temporary SQLite file")
+    parser.add_argument("--table", default="crash_data_bench")
+    parser.add_argument("--output", help="JSON file, defaults to benchmarks/results/<time>.json")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    started = time.strftime("%Y%m%d-%H%M%S")
+    results = cli_startup(args.repeat)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(args.url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        for rows in args.rows:
+            results.extend(run_suite(rows, engine, args.table, args.repeat, not args.no_memory,
+                                     args.cluster_rows, args.seed))
+        database = engine.dialect.name
+        engine.dispose()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{started}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump({"started": started, "database": database, "seed": args.seed, "environment": environment(),
+                   "results": results}, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} steps slower than {args.threshold}x the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
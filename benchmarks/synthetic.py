@@ -0,0 +1,232 @@
+"""
+Generates synthetic collisions shaped like Vehicle_Collisions.csv, same columns and formats.
+
+Boroughs, zip codes, streets, factors and vehicle types follow skewed (Zipf-like) frequencies,
+coordinates are drawn around a few hotspots per zip code so DBSCAN finds real clusters, and the
+borough, zip code and coordinates are missing or zero about as often as in the city's file.
+The output only depends on the seed and the chunk size:
+    python benchmarks/synthetic.py --rows 1000000 --output synthetic_collisions.csv
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    "CRASH DATE", "CRASH TIME", "BOROUGH", "ZIP CODE", "LATITUDE", "LONGITUDE", "LOCATION",
+    "ON STREET NAME", "CROSS STREET NAME", "OFF STREET NAME",
+    "NUMBER OF PERSONS INJURED", "NUMBER OF PERSONS KILLED", "NUMBER OF PEDESTRIANS INJURED",
+    "NUMBER OF PEDESTRIANS KILLED", "NUMBER OF CYCLIST INJURED", "NUMBER OF CYCLIST KILLED",
+    "NUMBER OF MOTORIST INJURED", "NUMBER OF MOTORIST KILLED",
+    *[f"CONTRIBUTING FACTOR VEHICLE {slot}" for slot in range(1, 6)],
+    "COLLISION_ID",
+    *[f"VEHICLE TYPE CODE {slot}" for slot in range(1, 6)],
+]
+
+# Share of the crashes, centre and zip code ranges of every borough
+BOROUGH_LAYOUT = {
+    "BROOKLYN": (0.31, (40.6500, -73.9496), [(11201, 11256)]),
+    "QUEENS": (0.27, (40.7282, -73.7949), [(11004, 11005), (11101, 11109), (11351, 11436), (11691, 11697)]),
+    "MANHATTAN": (0.19, (40.7831, -73.9712), [(10001, 10040), (10065, 10075), (10128, 10128), (10280, 10282)]),
+    "BRONX": (0.18, (40.8448, -73.8648), [(10451, 10475)]),
+    "STATEN ISLAND": (0.05, (40.5795, -74.1502), [(10301, 10314)]),
+}
+
+MAJOR_STREETS = [
+    "BROADWAY", "ATLANTIC AVENUE", "3 AVENUE", "NORTHERN BOULEVARD", "BELT PARKWAY", "LONG ISLAND EXPRESSWAY",
+    "FLATBUSH AVENUE", "LINDEN BOULEVARD", "QUEENS BOULEVARD", "GRAND CENTRAL PKWY", "BROOKLYN QUEENS EXPRESSWAY",
+    "MAJOR DEEGAN EXPRESSWAY", "CROSS BRONX EXPY", "2 AVENUE", "ROCKAWAY BOULEVARD", "FDR DRIVE",
+    "EASTERN PARKWAY", "OCEAN PARKWAY", "HYLAN BOULEVARD", "GRAND CONCOURSE", "JAMAICA AVENUE",
+    "BRUCKNER BOULEVARD", "HILLSIDE AVENUE", "NOSTRAND AVENUE", "KINGS HIGHWAY", "CONEY ISLAND AVENUE",
+]
+
+FACTORS = [
+    "Driver Inattention/Distraction", "Failure to Yield Right-of-Way", "Following Too Closely",
+    "Backing Unsafely", "Passing or Lane Usage Improper", "Passing Too Closely", "Unsafe Lane Changing",
+    "Other Vehicular", "Turning Improperly", "Traffic Control Disregarded", "Driver Inexperience",
+    "Unsafe Speed", "Alcohol Involvement", "Reaction to Uninvolved Vehicle", "View Obstructed/Limited",
+    "Pavement Slippery", "Aggressive Driving/Road Rage", "Oversized Vehicle", "Pedestrian/Bicyclist/Other Pedestrian Error/Confusion",
+    "Fatigued/Drowsy", "Brakes Defective", "Glare", "Steering Failure", "Cell Phone (hand-Held)",
+]
+
+VEHICLES = [
+    "Sedan", "Station Wagon/Sport Utility Vehicle", "Taxi", "Pick-up Truck", "Box Truck", "Bus", "Bike",
+    "Tractor Truck Diesel", "Van", "Motorcycle", "E-Bike", "Ambulance", "Dump", "Convertible", "E-Scooter",
+    "Garbage or Refuse", "Carry All", "Flat Bed", "Moped", "Tow Truck / Wrecker",
+]
+
+UNSPECIFIED = "Unspecified"
+
+# Share of the crashes with something in each factor and vehicle slot, and with an 'Unspecified' factor
+SLOT_FILL = [0.997, 0.78, 0.08, 0.02, 0.007]
+UNSPECIFIED_SHARE = [0.27, 0.85, 0.9, 0.9, 0.9]
+
+# Mean number of people per crash of every injury column and chance of a death
+INJURY_RATES = {
+    "PERSONS": (0.28, 0.0012),
+    "PEDESTRIANS": (0.05, 0.0006),
+    "CYCLIST": (0.025, 0.0001),
+    "MOTORIST": (0.2, 0.0005),
+}
+
+# Relative number of crashes per hour of the day, rush hours peak
+HOUR_WEIGHTS = np.array([2.6, 1.5, 1.2, 1.0, 1.2, 1.6, 2.4, 3.6, 5.1, 4.9, 4.6, 4.8,
+                         5.2, 5.4, 6.3, 6.6, 6.9, 6.8, 5.9, 4.8, 4.1, 3.7, 3.4, 2.9])
+
+
+def zipf_weights(count, exponent=1.1, rng=None):
+    """
+    Zipf-like probabilities of count values, in a random order when rng is given
+    """
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    if rng is not None:
+        weights = rng.permutation(weights)
+    return weights / weights.sum()
+
+
+class CollisionLayout:
+    """
+    The fixed part of the synthetic city: zip codes with their popularity and hotspots, streets,
+    and the crash rate of every day. Chunks drawn from the same layout share it.
+    """
+
+    def __init__(self, seed=0, start_date="2019-01-01", end_date="2020-11-01", hotspots_per_zip=4):
+        rng = np.random.default_rng(seed)
+        boroughs, zips, zip_boroughs, zip_weights, centres = [], [], [], [], []
+        for number, (borough, (share, centre, ranges)) in enumerate(BOROUGH_LAYOUT.items()):
+            borough_zips = np.concatenate([np.arange(low, high + 1) for low, high in ranges])
+            boroughs.append(borough)
+            zips.append(borough_zips)
+            zip_boroughs.append(np.full(len(borough_zips), number))
+            zip_weights.append(share * zipf_weights(len(borough_zips), 1.0, rng))
+            centres.append(np.asarray(centre) + rng.normal(0, [0.03, 0.035], (len(borough_zips), 2)))
+        self.boroughs = np.array(boroughs, dtype=object)
+        self.zip_codes = np.concatenate(zips)
+        self.zip_boroughs = np.concatenate(zip_boroughs)
+        self.zip_weights = np.concatenate(zip_weights)
+        zip_centres = np.concatenate(centres)
+
+        # A few hotspots (busy intersections) around every zip code centre, the busiest first
+        self.hotspots = zip_centres[:, None, :] + rng.normal(0, 0.008, (len(self.zip_codes), hotspots_per_zip, 2))
+        self.hotspot_weights = zipf_weights(hotspots_per_zip, 1.0)
+
+        numbered = [f"{number} {kind}" for number in range(1, 240) for kind in ("STREET", "AVENUE")]
+        self.streets = np.array(MAJOR_STREETS + numbered, dtype=object)
+        self.street_weights = zipf_weights(len(self.streets), 1.05)
+        self.factor_weights = zipf_weights(len(FACTORS), 1.3)
+        self.vehicle_weights = zipf_weights(len(VEHICLES), 1.6)
+
+        # Fewer crashes on weekends and after the March 2020 lockdown
+        self.days = pd.date_range(start_date, pd.Timestamp(end_date) - pd.Timedelta(days=1), freq="D")
+        day_weights = np.where(self.days.dayofweek >= 5, 0.85, 1.0)
+        day_weights = day_weights * np.where(self.days >= pd.Timestamp("2020-03-20"), 0.5, 1.0)
+        self.day_weights = day_weights / day_weights.sum()
+        self.day_text = np.array(self.days.strftime("%m/%d/%Y"), dtype=object)
+        self.minute_text = np.array([f"{minute // 60}:{minute % 60:02d}" for minute in range(24 * 60)], dtype=object)
+
+
+def generate_collisions(rows, seed=0, layout=None, first_id=4000000):
+    """
+    Draws synthetic collisions with the columns and formats of Vehicle_Collisions.csv
+    :param rows: Number of collisions
+    :param seed: Seed of this batch, the layout has its own seed
+    :param layout: CollisionLayout, the default layout when None
+    :param first_id: COLLISION_ID of the first row
+    :return : returns a DataFrame of raw collisions
+    """
+    layout = layout or CollisionLayout()
+    rng = np.random.default_rng(seed)
+
+    zip_index = rng.choice(len(layout.zip_codes), rows, p=layout.zip_weights)
+    hotspot = rng.choice(len(layout.hotspot_weights), rows, p=layout.hotspot_weights)
+    points = layout.hotspots[zip_index, hotspot] + rng.normal(0, 0.0025, (rows, 2))
+    # A quarter of the crashes happen away from the hotspots, spread over the zip code
+    spread = rng.random(rows) < 0.25
+    points[spread] = layout.hotspots[zip_index[spread], 0] + rng.normal(0, 0.012, (int(spread.sum()), 2))
+    lat, lon = points[:, 0].round(7), points[:, 1].round(7)
+
+    missing_point = rng.random(rows)
+    lat = np.where(missing_point < 0.06, np.nan, np.where(missing_point < 0.075, 0.0, lat))
+    lon = np.where(missing_point < 0.06, np.nan, np.where(missing_point < 0.075, 0.0, lon))
+    location = pd.Series("(" + pd.Series(lat).astype(str) + ", " + pd.Series(lon).astype(str) + ")")
+    location[np.isnan(lat)] = None
+
+    # The borough and zip code are left empty together for about a third of the crashes
+    no_borough = rng.random(rows) < 0.32
+    no_zip = no_borough & (rng.random(rows) < 0.95)
+    borough = np.where(no_borough, None, layout.boroughs[layout.zip_boroughs[zip_index]])
+    zip_code = np.where(no_zip, None, layout.zip_codes[zip_index].astype(str).astype(object))
+
+    street = layout.streets[rng.choice(len(layout.streets), rows, p=layout.street_weights)]
+    cross_street = layout.streets[rng.choice(len(layout.streets), rows, p=layout.street_weights)]
+    off_street = rng.random(rows) < 0.2
+    data = {
+        "CRASH DATE": layout.day_text[rng.choice(len(layout.days), rows, p=layout.day_weights)],
+        "CRASH TIME": layout.minute_text[rng.choice(24, rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum()) * 60
+                                         + rng.integers(0, 60, rows)],
+        "BOROUGH": borough,
+        "ZIP CODE": zip_code,
+        "LATITUDE": lat,
+        "LONGITUDE": lon,
+        "LOCATION": location.to_numpy(dtype=object),
+        "ON STREET NAME": np.where(off_street, None, street),
+        "CROSS STREET NAME": np.where(off_street | (rng.random(rows) < 0.3), None, cross_street),
+        "OFF STREET NAME": np.where(off_street, street, None),
+    }
+    for who, (injured, killed) in INJURY_RATES.items():
+        data[f"NUMBER OF {who} INJURED"] = rng.poisson(injured, rows)
+        data[f"NUMBER OF {who} KILLED"] = (rng.random(rows) < killed).astype(np.int64)
+
+    factors = np.array(FACTORS, dtype=object)
+    vehicles = np.array(VEHICLES, dtype=object)
+    for slot, (fill, unspecified) in enumerate(zip(SLOT_FILL, UNSPECIFIED_SHARE), start=1):
+        filled = rng.random(rows) < fill
+        factor = np.where(rng.random(rows) < unspecified, UNSPECIFIED,
+                          factors[rng.choice(len(factors), rows, p=layout.factor_weights)])
+        data[f"CONTRIBUTING FACTOR VEHICLE {slot}"] = np.where(filled, factor, None)
+        vehicle = vehicles[rng.choice(len(vehicles), rows, p=layout.vehicle_weights)]
+        data[f"VEHICLE TYPE CODE {slot}"] = np.where(filled & (rng.random(rows) < 0.97), vehicle, None)
+    data["COLLISION_ID"] = np.arange(first_id, first_id + rows, dtype=np.int64)
+    return pd.DataFrame(data)[COLUMNS]
+
+
+def iter_collisions(rows, chunk_size=500000, seed=0, layout=None):
+    """
+    generate_collisions in chunks of at most chunk_size rows, every chunk has its own child seed
+    :return : returns an iterator over DataFrames
+    """
+    layout = layout or CollisionLayout(seed)
+    seeds = np.random.SeedSequence(seed).spawn((rows + chunk_size - 1) // chunk_size)
+    for number, child in enumerate(seeds):
+        first = number * chunk_size
+        yield generate_collisions(min(chunk_size, rows - first), child, layout, 4000000 + first)
+
+
+def write_collisions_csv(path, rows, chunk_size=500000, seed=0):
+    """
+    Writes synthetic collisions to a csv file without holding them all in memory
+    :return : returns the number of rows written
+    """
+    written = 0
+    for chunk in iter_collisions(rows, chunk_size, seed):
+        chunk.to_csv(path, mode="w" if written == 0 else "a", header=written == 0, index=False)
+        written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--output", default="synthetic_collisions.csv")
+    parser.add_argument("--chunk-size", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = write_collisions_csv(args.output, args.rows, args.chunk_size, args.seed)
+    print(f"Wrote {rows} rows to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
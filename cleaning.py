@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# CRASH DATE and CRASH TIME together are "%m/%d/%Y %H:%M", they are parsed separately so every
+# distinct day and minute is only parsed once
+DATE_FORMAT = "%m/%d/%Y"
+TIME_FORMAT = "%H:%M"
+
+# Rows failing a rule are dropped: (name, column, check). A row failing several rules is counted
+# under the first one. The date rule runs on CRASH DATE once it has been parsed with the time.
+RULES = [
+    ("missing_latitude", "LATITUDE", "missing"),
+    ("zero_latitude", "LATITUDE", "zero"),
+    ("missing_zip_code", "ZIP CODE", "missing"),
+    ("invalid_date", "CRASH DATE", "missing"),
+]
+
+CHECKS = {
+    "missing": lambda column: column.isna().to_numpy(),
+    "zero": lambda column: (column == 0).to_numpy(dtype=bool, na_value=False),
+}
+
+# Derived columns and the columns they add up, a missing count adds 0. Earlier derived columns can
+# be used by later ones.
+DERIVED_SUMS = {
+    "NUMBER OF KILLS": ["NUMBER OF PERSONS KILLED", "NUMBER OF CYCLIST KILLED", "NUMBER OF PEDESTRIANS KILLED",
+                        "NUMBER OF MOTORIST KILLED"],
+    "NUMBER OF INJURED": ["NUMBER OF PERSONS INJURED", "NUMBER OF PEDESTRIANS INJURED",
+                          "NUMBER OF MOTORIST INJURED", "NUMBER OF CYCLIST INJURED"],
+    "NUMBER OF CASUALTIES": ["NUMBER OF KILLS", "NUMBER OF INJURED"],
+}
+
+
+def parse_crash_dates(dates, times):
+    """
+    Parses the CRASH DATE and CRASH TIME columns into one datetime column
+    :param dates: 'MM/DD/YYYY' strings
+    :param times: 'HH:MM' strings
+    :return : returns the datetimes, NaT where either part is missing or invalid
+    """
+    days = pd.to_datetime(dates, format=DATE_FORMAT, errors="coerce", cache=True)
+    codes, distinct_times = pd.factorize(times)
+    offsets = pd.to_datetime(pd.Series(distinct_times, dtype=object), format=TIME_FORMAT, errors="coerce")
+    offsets = (offsets - pd.Timestamp("1900-01-01")).to_numpy()
+    # Missing times have the code -1, they take the NaT appended at the end
+    offsets = np.append(offsets, np.timedelta64("NaT")).astype(f"timedelta64[{np.datetime_data(days.dtype)[0]}]")
+    return days + offsets[codes]
+
+
+def clean_collisions(data, columns=None, rules=RULES, sums=DERIVED_SUMS):
+    """
+    Cleans the raw crashes in one pass: CRASH DATE is parsed together with CRASH TIME, the rows
+    failing a rule are dropped with a single mask and the derived counts are added
+    :param data: The raw crashes with the csv column names, it is not modified
+    :param columns: Raw columns to keep besides the derived ones, all of them when None
+    :param rules: The (name, column, check) rules, see RULES
+    :param sums: The derived columns, see DERIVED_SUMS
+    :return : returns the cleaned crashes with a fresh index and the number of rows dropped by every rule
+    """
+    crash_dates = parse_crash_dates(data["CRASH DATE"], data["CRASH TIME"])
+
+    keep = np.ones(len(data), dtype=bool)
+    rejected = {}
+    for name, column, check in rules:
+        values = crash_dates if column == "CRASH DATE" else data[column]
+        failed = CHECKS[check](values) & keep
+        rejected[name] = int(failed.sum())
+        keep &= ~failed
+
+    selected = list(data.columns) if columns is None else [column for column in columns if column in data.columns]
+    cleaned = data[selected][keep].reset_index(drop=True)
+    cleaned["CRASH DATE"] = crash_dates[keep].reset_index(drop=True)
+
+    derived = {}
+    for name, parts in sums.items():
+        values = [derived[part] if part in derived else data[part].to_numpy(dtype="float32", na_value=np.nan)[keep]
+                  for part in parts]
+        derived[name] = np.nansum(np.column_stack(values), axis=1)
+        cleaned[name] = derived[name]
+    return cleaned, rejected
@@ -0,0 +1,224 @@
+"""
+Command line entry point of the crash analysis.
+
+    python cli.py ingest Vehicle_Collisions.csv [--full]
+    python cli.py pull --borough QUEENS --start 2019-01-01 --end 2020-01-01 --output queens.csv
+    python cli.py cluster --borough QUEENS --start 2019-01-01 --end 2020-01-01 --eps 0.1 --min-samples 20
+    python cli.py eda Vehicle_Collisions.csv --charts results
+    python cli.py report [--force]
+
+The database comes from the CRASH_DB_* environment variables or --url. Every subcommand imports
+what it needs when it runs, so an ingest never loads sklearn, matplotlib or folium.
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds from the start of the CLI to the first piece of work a subcommand does
+STARTUP_TARGETS = {"ingest": 1.0, "pull": 1.0}
+
+
+class StartupOnly(Exception):
+    """
+    Raised by first_work with --startup-only, ends the subcommand once its imports are done
+    """
+
+
+def first_work(args):
+    """
+    Called by every subcommand once its imports are done: reports the time to first work, and with
+    --startup-only stops there
+    """
+    elapsed = time.perf_counter() - _STARTED
+    target = STARTUP_TARGETS.get(args.command)
+    if args.timing or (target is not None and elapsed > target):
+        over = f", over the {target:.2f}s target" if target is not None and elapsed > target else ""
+        print(f"{args.command}: {elapsed:.3f}s to first work{over}", file=sys.stderr)
+    if args.startup_only:
+        raise StartupOnly()
+
+
+def connect(args):
+    """
+    The shared engine of the database given by --url, or by the CRASH_DB_* environment variables
+    """
+    if args.url:
+        from engine_factory import get_engine
+        return get_engine(args.url)
+    from db_operations import create_connection
+    return create_connection()
+
+
+def run_ingest(args):
+    from db_operations import create_table_if_not_exists, drop_table_if_exists, refresh_watermark
+    from push_data import incremental_csv_to_db, parallel_csv_to_db
+    from schema import migrate_crash_table
+    first_work(args)
+
+    engine = connect(args)
+    if args.full:
+        # Drop the table and reload the whole history, the chunks are cleaned in parallel
+        drop_table_if_exists(engine, args.table)
+        create_table_if_not_exists(engine, args.table)
+        parallel_csv_to_db(args.csv_path, engine, args.table, args.chunk_size, args.workers, args.writers)
+        refresh_watermark(engine, args.table)
+    else:
+        # Only new or changed crashes are written, older tables are moved to the compact schema first
+        migrate_crash_table(engine, args.table)
+        create_table_if_not_exists(engine, args.table)
+        incremental_csv_to_db(args.csv_path, engine, args.table, args.chunk_size)
+
+
+def pull(args, engine, columns=None):
+    from db_operations import pull_data_from_db
+    return pull_data_from_db(engine, args.table, columns=columns, borough=args.borough, start_date=args.start,
+                             end_date=args.end, zip_code=args.zip_code, limit=args.limit)
+
+
+def run_pull(args):
+    import db_operations  # noqa: F401
+    first_work(args)
+
+    data = pull(args, connect(args), args.columns)
+    if args.output:
+        if args.output.endswith(".parquet"):
+            data.to_parquet(args.output, index=False)
+        else:
+            data.to_csv(args.output, index=False)
+        print(f"Wrote {len(data)} crashes to {args.output}")
+    else:
+        print(data.head(args.show))
+        print(f"{len(data)} crashes")
+
+
+def run_cluster(args):
+    from analyze_data import Incremental_DBSCAN, Perform_DBSCAN, Sweep_DBSCAN, plot_clusters
+    from clustering import cluster_profile
+    first_work(args)
+
+    engine = connect(args)
+    if args.incremental:
+        data, _ = Incremental_DBSCAN(engine, args.table, args.incremental, args.eps, args.min_samples,
+                                     args.borough)
+    elif len(args.eps_values) > 1 or len(args.min_samples_values) > 1:
+        data = pull(args, engine)
+        summary, _ = Sweep_DBSCAN(data, args.eps_values, args.min_samples_values, args.jobs, args.haversine)
+        print(summary.to_string(index=False))
+        return
+    else:
+        data = Perform_DBSCAN(pull(args, engine), args.eps, args.min_samples, args.haversine, args.jobs)
+    if data.empty:
+        return
+    print(cluster_profile(data))
+    if args.plot:
+        plot_clusters(data, args.eps, args.min_samples)
+
+
+def run_eda(args):
+    sys.path.insert(0, os.path.join(REPO_ROOT, "ram"))
+    import script
+    first_work(args)
+
+    script.main(args.csv_path)
+
+
+def run_report(args):
+    import report
+    first_work(args)
+
+    status = report.build_report(report.report_charts(connect(args), args.table, csv_path=args.csv), args.output,
+                                 args.jobs, args.force)
+    for name, state in status.items():
+        print(f"{name}: {state}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="SQLAlchemy url of the database, the CRASH_DB_* variables when not given")
+    parser.add_argument("--table", default="crash_data")
+    parser.add_argument("--spans", help="append timing spans to this JSON lines file, '-' for stderr")
+    parser.add_argument("--profile", help="comma separated stages to run under cProfile")
+    parser.add_argument("--charts", help="save the charts to this directory instead of showing them")
+    parser.add_argument("--timing", action="store_true", help="print the time to first work")
+    parser.add_argument("--startup-only", action="store_true", help="stop once the imports are done")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="load the csv file into the database")
+    ingest.add_argument("csv_path")
+    ingest.add_argument("--full", action="store_true", help="drop the table and reload everything")
+    ingest.add_argument("--chunk-size", type=int, default=100000)
+    ingest.add_argument("--workers", type=int, help="cleaning processes for --full, one per core by default")
+    ingest.add_argument("--writers", type=int, default=2)
+
+    def add_filters(command):
+        command.add_argument("--borough", nargs="+")
+        command.add_argument("--start", help="first day, e.g. 2019-01-01")
+        command.add_argument("--end", help="day after the last one")
+        command.add_argument("--zip-code", nargs="+")
+        command.add_argument("--limit", type=int)
+
+    pull_command = commands.add_parser("pull", help="read crashes from the database")
+    add_filters(pull_command)
+    pull_command.add_argument("--columns", nargs="+")
+    pull_command.add_argument("--output", help=".csv or .parquet file, the first rows are printed otherwise")
+    pull_command.add_argument("--show", type=int, default=10)
+
+    cluster = commands.add_parser("cluster", help="run DBSCAN on crashes from the database")
+    add_filters(cluster)
+    cluster.add_argument("--eps", dest="eps_values", type=float, nargs="+",
+                         help="several values run a sweep, 0.1 on the standardised coordinates by default, "
+                              "required in metres with --haversine or --incremental")
+    cluster.add_argument("--min-samples", dest="min_samples_values", type=int, nargs="+", default=[20])
+    cluster.add_argument("--haversine", action="store_true", help="eps in metres on the haversine engine")
+    cluster.add_argument("--incremental", metavar="STATE", help="add new crashes to this saved state, eps in metres")
+    cluster.add_argument("--jobs", type=int, default=1)
+    cluster.add_argument("--plot", action="store_true")
+
+    eda = commands.add_parser("eda", help="run the exploratory analysis of ram/ on the csv file")
+    eda.add_argument("csv_path")
+
+    report_command = commands.add_parser("report", help="draw every chart of the report to files")
+    report_command.add_argument("--output", default="results")
+    report_command.add_argument("--jobs", type=int)
+    report_command.add_argument("--force", action="store_true", help="redraw unchanged charts too")
+    report_command.add_argument("--csv", help="Vehicle_Collisions csv file, adds the charts of ram/")
+
+    args = parser.parse_args(argv)
+    if args.command == "cluster":
+        if args.eps_values is None:
+            # The default is a distance in standard deviations, as metres it would be a 10 cm radius
+            if args.haversine or args.incremental:
+                parser.error("--haversine and --incremental need --eps in metres, e.g. --eps 100")
+            args.eps_values = [0.1]
+        args.eps, args.min_samples = args.eps_values[0], args.min_samples_values[0]
+        # A sweep only prints the summary of every combination, plot one of them on its own
+        if args.plot and (len(args.eps_values) > 1 or len(args.min_samples_values) > 1):
+            parser.error("--plot needs a single --eps and --min-samples value")
+    return args
+
+
+COMMANDS = {"ingest": run_ingest, "pull": run_pull, "cluster": run_cluster, "eda": run_eda, "report": run_report}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.spans or args.profile:
+        from instrumentation import configure
+        configure(args.spans or "-", args.profile.split(",") if args.profile else None)
+    if args.charts:
+        from plotting import set_report_dir
+        set_report_dir(args.charts)
+    try:
+        COMMANDS[args.command](args)
+    except StartupOnly:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,597 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import silhouette_score
+from sklearn.neighbors import BallTree, radius_neighbors_graph
+from instrumentation import span
+
+# Mean earth radius, sklearn's haversine distances are on the unit sphere
+EARTH_RADIUS_M = 6371008.8
+
+
+def collapse_rows(features):
+    """
+    Collapses identical feature rows into weighted points. The unique rows keep the order of their
+    first occurrence, so DBSCAN labels them in the same order as it would label the raw rows.
+    :param features: 2d array of features
+    :return : returns the unique rows, their weights and the index of every raw row's unique row
+    """
+    unique, first, inverse, counts = np.unique(features, axis=0, return_index=True,
+                                               return_inverse=True, return_counts=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return unique[order], counts[order], rank[inverse.ravel()]
+
+
+def collapse_duplicates(lat, lon):
+    """
+    Collapses points sharing the exact same coordinates, many crashes happen at the same intersection.
+    :param lat: Latitudes in degrees
+    :param lon: Longitudes in degrees
+    :return : returns the unique points in radians, their weights and the index of every raw point's unique point
+    """
+    coordinates = np.column_stack([np.asarray(lat, dtype="float64"), np.asarray(lon, dtype="float64")])
+    unique, weights, inverse = collapse_rows(coordinates)
+    return np.radians(unique), weights, inverse
+
+
+def _grid_cells(points, eps, cell_m):
+    """
+    Assigns every point to a grid cell and returns the cell ids and the halo width in radians.
+    Cells are at least as wide as the halo, so a cell and its halo fit in its 3x3 block of cells.
+    """
+    max_lat = np.abs(points[:, 0]).max()
+    lat_halo = 2 * eps * 1.01
+    lon_halo = lat_halo / np.cos(min(max_lat + lat_halo, np.radians(89)))
+    cell_lat = max(cell_m / EARTH_RADIUS_M, lat_halo)
+    cell_lon = max(cell_lat / np.cos(min(max_lat, np.radians(89))), lon_halo)
+    cell_ids = np.floor((points - points.min(axis=0)) / [cell_lat, cell_lon]).astype(np.int64)
+    return cell_ids, (cell_lat, cell_lon), (lat_halo, lon_halo)
+
+
+def _cluster_cell(context, weights, owned, eps, min_samples):
+    """
+    Runs the DBSCAN neighbourhood step on one cell plus its halo of 2 * eps. Core status is exact for
+    the owned points and for every point within eps of them, so the cell can report
+    - the core flag of its owned points
+    - the edges from its owned points to their core neighbours
+    All indices are positions in context.
+    """
+    tree = BallTree(context, metric="haversine")
+    owned_positions = np.flatnonzero(owned)
+    owned_neighbourhoods = tree.query_radius(context[owned_positions], eps)
+    lengths = np.fromiter(map(len, owned_neighbourhoods), dtype=np.intp, count=len(owned_positions))
+    sources = np.repeat(owned_positions, lengths)
+    targets = np.concatenate(owned_neighbourhoods)
+
+    # Core status of the owned points and of everything they reach
+    needed = np.unique(targets)
+    neighbourhoods = tree.query_radius(context[needed], eps)
+    needed_lengths = np.fromiter(map(len, neighbourhoods), dtype=np.intp, count=len(needed))
+    starts = np.concatenate([[0], np.cumsum(needed_lengths)[:-1]])
+    neighbour_weights = np.add.reduceat(weights[np.concatenate(neighbourhoods)], starts)
+    is_core = np.zeros(len(context), dtype=bool)
+    is_core[needed] = neighbour_weights >= min_samples
+
+    keep = is_core[targets] & (sources != targets)
+    return is_core[owned_positions], sources[keep], targets[keep]
+
+
+def _cell_task(args):
+    context_index, context, weights, owned, eps, min_samples = args
+    owned_core, sources, targets = _cluster_cell(context, weights, owned, eps, min_samples)
+    return context_index[owned], owned_core, context_index[sources], context_index[targets]
+
+
+def _cell_tasks(points, weights, eps, min_samples, cell_m):
+    """
+    Yields the arguments of one _cell_task per occupied grid cell
+    """
+    cell_ids, (cell_lat, cell_lon), (lat_halo, lon_halo) = _grid_cells(points, eps, cell_m)
+    # Row-major cell keys, the width leaves empty columns around the grid for the neighbour lookups
+    width = cell_ids[:, 1].max() + 3
+    keys = cell_ids[:, 0] * width + cell_ids[:, 1]
+    order = np.argsort(keys, kind="stable")
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    blocks = {key: order[start:end] for key, start, end in zip(unique_keys, starts, ends)}
+    origin = points.min(axis=0)
+    for key in unique_keys:
+        owned_index = blocks[key]
+        row, column = cell_ids[owned_index[0]]
+        candidates = [blocks.get(neighbour_row * width + neighbour_column)
+                      for neighbour_row in (row - 1, row, row + 1)
+                      for neighbour_column in (column - 1, column, column + 1)]
+        candidates = np.concatenate([block for block in candidates if block is not None])
+        low = origin + [row * cell_lat - lat_halo, column * cell_lon - lon_halo]
+        high = origin + [(row + 1) * cell_lat + lat_halo, (column + 1) * cell_lon + lon_halo]
+        inside = np.all((points[candidates] >= low) & (points[candidates] <= high), axis=1)
+        context_index = np.sort(candidates[inside])
+        owned = np.isin(context_index, owned_index)
+        yield context_index, points[context_index], weights[context_index], owned, eps, min_samples
+
+
+def _partitioned_dbscan(points, weights, eps, min_samples, n_jobs, cell_m):
+    """
+    DBSCAN over overlapping grid cells clustered in parallel, the cells' core flags and core edges
+    are merged into the same labels sklearn's sequential DBSCAN produces
+    """
+    n_points = len(points)
+    is_core = np.zeros(n_points, dtype=bool)
+    sources, targets = [], []
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        for owned_index, owned_core, cell_sources, cell_targets in executor.map(
+                _cell_task, _cell_tasks(points, weights, eps, min_samples, cell_m), chunksize=4):
+            is_core[owned_index] = owned_core
+            sources.append(cell_sources)
+            targets.append(cell_targets)
+    return label_clusters(is_core, np.concatenate(sources), np.concatenate(targets))
+
+
+def label_clusters(is_core, sources, targets):
+    """
+    Turns DBSCAN core flags and neighbour edges into the labels sklearn's sequential DBSCAN produces
+    :param is_core: Core flag of every point
+    :param sources: Edge start points
+    :param targets: Edge end points, every target must be a core point
+    :return : returns the cluster label of every point, -1 for noise
+    """
+    n_points = len(is_core)
+    # Clusters are the connected components of the core points
+    core_edges = is_core[sources]
+    graph = coo_matrix((np.ones(core_edges.sum(), dtype=np.int8), (sources[core_edges], targets[core_edges])),
+                       shape=(n_points, n_points))
+    _, components = connected_components(graph, directed=False)
+
+    # sklearn numbers the clusters in the order of their first core point
+    core_index = np.flatnonzero(is_core)
+    first_core = np.full(components.max() + 1, n_points)
+    np.minimum.at(first_core, components[core_index], core_index)
+    cluster_components = np.flatnonzero(first_core < n_points)
+    cluster_numbers = np.full(len(first_core), -1)
+    cluster_numbers[cluster_components[np.argsort(first_core[cluster_components])]] = np.arange(len(cluster_components))
+
+    labels = np.full(n_points, -1)
+    labels[core_index] = cluster_numbers[components[core_index]]
+    # A border point joins the first cluster that reaches it, the one with the lowest number
+    border_edges = ~core_edges
+    border_labels = np.full(n_points, n_points)
+    np.minimum.at(border_labels, sources[border_edges], labels[targets[border_edges]])
+    is_border = ~is_core & (border_labels < n_points)
+    labels[is_border] = border_labels[is_border]
+    return labels
+
+
+def dbscan_haversine(lat, lon, eps_m, min_samples, n_jobs=1, cell_m=2000):
+    """
+    DBSCAN on geographic coordinates with a haversine ball tree. Duplicate coordinates are clustered
+    once as weighted points. With n_jobs > 1 space is split into overlapping grid cells that are
+    clustered in parallel and merged, the labels are identical to the n_jobs=1 result.
+    :param lat: Latitudes in degrees
+    :param lon: Longitudes in degrees
+    :param eps_m: Neighbourhood radius in metres
+    :param min_samples: Number of crashes within eps_m that make a core point
+    :param n_jobs: Number of worker processes, None for one per core
+    :param cell_m: Grid cell size in metres for the parallel mode
+    :return : returns the cluster label of every point, -1 for noise
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    with span("dbscan_haversine", eps_m=eps_m, min_samples=min_samples, n_jobs=n_jobs) as stage:
+        points, weights, inverse = collapse_duplicates(lat, lon)
+        stage.set(rows_in=len(inverse), unique_points=len(points))
+        if len(points) == 0:
+            return np.empty(0, dtype=np.intp)
+        eps = eps_m / EARTH_RADIUS_M
+        if n_jobs == 1:
+            labels = DBSCAN(eps=eps, min_samples=min_samples, metric="haversine",
+                            algorithm="ball_tree").fit(points, sample_weight=weights).labels_
+        else:
+            labels = _partitioned_dbscan(points, weights, eps, min_samples, n_jobs, cell_m)
+        stage.set(clusters=int(labels.max() + 1), noise=int(weights[labels == -1].sum()))
+        return labels[inverse]
+
+
+# Neighbour graph edges and weights shared with the sweep workers, set once per process by _init_sweep
+_sweep_state = {}
+
+
+def _init_sweep(sources, targets, distances, weights):
+    _sweep_state.update(sources=sources, targets=targets, distances=distances, weights=weights)
+
+
+def _sweep_task(args):
+    """
+    Clusters every min_samples value at one eps from the shared neighbour graph
+    """
+    eps, min_samples_values = args
+    weights = _sweep_state["weights"]
+    within = _sweep_state["distances"] <= eps
+    sources = _sweep_state["sources"][within]
+    targets = _sweep_state["targets"][within]
+    # Weight of every neighbourhood, the point itself included
+    neighbour_weights = weights + np.bincount(sources, weights=weights[targets], minlength=len(weights))
+    fits = []
+    for min_samples in min_samples_values:
+        is_core = neighbour_weights >= min_samples
+        to_core = is_core[targets]
+        fits.append((min_samples, label_clusters(is_core, sources[to_core], targets[to_core])))
+    return eps, fits
+
+
+def _quality(features, labels, metric, sample_size, random_state):
+    """
+    Silhouette score of a sample of the clustered (non noise) rows, NaN with fewer than two clusters
+    """
+    clustered = np.flatnonzero(labels >= 0)
+    if len(np.unique(labels[clustered])) < 2:
+        return float("nan")
+    if len(clustered) > sample_size:
+        clustered = np.random.default_rng(random_state).choice(clustered, sample_size, replace=False)
+    if len(np.unique(labels[clustered])) < 2:
+        return float("nan")
+    return silhouette_score(features[clustered], labels[clustered], metric=metric)
+
+
+def dbscan_sweep(features, eps_values, min_samples_values, metric="euclidean", n_jobs=1,
+                 silhouette_sample=2000, random_state=0, return_labels=False):
+    """
+    Runs DBSCAN for every (eps, min_samples) combination from a single radius-neighbour graph built
+    at the largest eps, instead of rebuilding every neighbourhood per combination
+    :param features: 2d array of features, radians for the haversine metric
+    :param eps_values: Neighbourhood radii in the units of the metric
+    :param min_samples_values: min_samples values
+    :param metric: Distance metric of the neighbour graph
+    :param n_jobs: Number of worker processes, None for one per core
+    :param silhouette_sample: Number of rows the silhouette score is computed on
+    :param random_state: Seed of the silhouette sample
+    :param return_labels: Also return the labels of every combination
+    :return : returns a summary with the cluster count, noise count and silhouette score per combination,
+              and with return_labels a dict of labels keyed by (eps, min_samples)
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    with span("dbscan_sweep", combinations=len(eps_values) * len(min_samples_values), metric=metric,
+              n_jobs=n_jobs) as stage:
+        features = np.asarray(features, dtype="float64")
+        unique, weights, inverse = collapse_rows(features)
+        graph = radius_neighbors_graph(unique, max(eps_values), mode="distance", metric=metric).tocoo()
+        stage.set(rows_in=len(features), unique_points=len(unique), edges=graph.nnz)
+        edges = (graph.row, graph.col, graph.data, weights)
+        tasks = [(eps, list(min_samples_values)) for eps in eps_values]
+
+        if n_jobs == 1:
+            _init_sweep(*edges)
+            results = map(_sweep_task, tasks)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_sweep, initargs=edges)
+            results = executor.map(_sweep_task, tasks)
+
+        rows = []
+        all_labels = {}
+        try:
+            for eps, fits in results:
+                for min_samples, unique_labels in fits:
+                    labels = unique_labels[inverse]
+                    rows.append({
+                        "eps": eps,
+                        "min_samples": min_samples,
+                        "n_clusters": int(unique_labels.max() + 1),
+                        "n_noise": int(weights[unique_labels == -1].sum()),
+                        "silhouette": _quality(features, labels, metric, silhouette_sample, random_state),
+                    })
+                    if return_labels:
+                        all_labels[(eps, min_samples)] = labels
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            _sweep_state.clear()
+
+        summary = pd.DataFrame(rows, columns=["eps", "min_samples", "n_clusters", "n_noise", "silhouette"])
+        return (summary, all_labels) if return_labels else summary
+
+
+def haversine_sweep(lat, lon, eps_values_m, min_samples_values, **kwargs):
+    """
+    dbscan_sweep on geographic coordinates with eps in metres, see dbscan_sweep for the other arguments
+    """
+    features = np.radians(np.column_stack([np.asarray(lat, dtype="float64"), np.asarray(lon, dtype="float64")]))
+    eps_by_radians = {eps_m / EARTH_RADIUS_M: eps_m for eps_m in eps_values_m}
+    result = dbscan_sweep(features, list(eps_by_radians), min_samples_values, metric="haversine", **kwargs)
+    summary, labels = result if isinstance(result, tuple) else (result, None)
+    summary["eps"] = summary["eps"].map(eps_by_radians)
+    if labels is None:
+        return summary
+    return summary, {(eps_by_radians[eps], min_samples): value for (eps, min_samples), value in labels.items()}
+
+
+class IncrementalDBSCAN:
+    """
+    Haversine DBSCAN that grows with the data. Each insert only looks at the neighbourhoods of the new
+    points and of the points they turn into cores, so its cost follows the size of the delta.
+    Cluster ids are stable between inserts, when clusters merge the oldest id is kept.
+    Border points keep the cluster they first joined, so labels can differ from a full run at the
+    borders, like they do between DBSCAN runs on differently ordered rows.
+    """
+
+    def __init__(self, eps_m, min_samples):
+        """
+        :param eps_m: Neighbourhood radius in metres
+        :param min_samples: Number of crashes within eps_m that make a core point
+        """
+        self.eps_m = eps_m
+        self.min_samples = min_samples
+        self.eps = eps_m / EARTH_RADIUS_M
+        self.watermark = None  # Free for callers to record what has been inserted
+        self.n_points = 0
+        self.n_rows = 0
+        self._next_cluster_id = 0
+        self._points = np.empty((0, 2))
+        self._weights = np.empty(0)
+        self._neighbour_weights = np.empty(0)
+        self._parent = np.empty(0, dtype=np.intp)  # Union-find over the core points
+        self._cluster_ids = np.empty(0, dtype=np.intp)  # Cluster id of every union-find root
+        self._anchors = np.empty(0, dtype=np.intp)  # Core point every point belongs to, -1 for noise
+        self._row_points = np.empty(0, dtype=np.intp)
+        self._trees = []  # (first point, end point, ball tree) over consecutive point ranges
+
+    def __setstate__(self, state):
+        # States saved before the live cluster count kept the next id in n_clusters
+        if "n_clusters" in state:
+            state["_next_cluster_id"] = state.pop("n_clusters")
+        self.__dict__.update(state)
+
+    @property
+    def n_clusters(self):
+        """
+        Number of clusters now, merged clusters count once
+        """
+        cores = np.flatnonzero(self._parent[:self.n_points] >= 0)
+        return len(np.unique(self._find(cores)))
+
+    def _grow(self, n_points, n_rows):
+        """
+        Makes room for n_points more points and n_rows more rows, doubling the buffers when they are full
+        """
+        def grown(array, size, fill):
+            if size <= len(array):
+                return array
+            bigger = np.full((max(size, 2 * len(array)),) + array.shape[1:], fill, dtype=array.dtype)
+            bigger[:len(array)] = array
+            return bigger
+
+        size = self.n_points + n_points
+        self._points = grown(self._points, size, 0.0)
+        self._weights = grown(self._weights, size, 0.0)
+        self._neighbour_weights = grown(self._neighbour_weights, size, 0.0)
+        self._parent = grown(self._parent, size, -1)
+        self._cluster_ids = grown(self._cluster_ids, size, -1)
+        self._anchors = grown(self._anchors, size, -1)
+        self._row_points = grown(self._row_points, self.n_rows + n_rows, -1)
+
+    def _add_tree(self, start, end):
+        """
+        Indexes the points start:end. The last trees are merged into the new one while they are not more
+        than twice as big, so there are O(log n) trees and every point is re-indexed O(log n) times.
+        """
+        while self._trees and self._trees[-1][1] - self._trees[-1][0] <= 2 * (end - start):
+            start = self._trees.pop()[0]
+        self._trees.append((start, end, BallTree(self._points[start:end], metric="haversine")))
+
+    def _neighbours(self, query):
+        """
+        Returns the (query position, point) pairs within eps of the query points
+        """
+        sources, targets = [], []
+        for start, _, tree in self._trees:
+            neighbourhoods = tree.query_radius(query, self.eps)
+            lengths = np.fromiter(map(len, neighbourhoods), dtype=np.intp, count=len(query))
+            sources.append(np.repeat(np.arange(len(query)), lengths))
+            targets.append(np.concatenate(neighbourhoods).astype(np.intp) + start)
+        return np.concatenate(sources), np.concatenate(targets)
+
+    def _find(self, nodes):
+        """
+        Union-find roots of core points, with path compression
+        """
+        roots = nodes
+        while True:
+            parents = self._parent[roots]
+            if np.array_equal(parents, roots):
+                break
+            roots = parents
+        self._parent[nodes] = roots
+        return roots
+
+    def _union(self, sources, targets):
+        """
+        Merges the clusters of the given core-core edges, a merged cluster keeps its oldest id and
+        clusters made only of new cores get new ids
+        """
+        if len(sources) == 0:
+            return
+        roots, index = np.unique(np.concatenate([self._find(sources), self._find(targets)]), return_inverse=True)
+        half = len(sources)
+        graph = coo_matrix((np.ones(half, dtype=np.int8), (index[:half], index[half:])), shape=(len(roots), len(roots)))
+        _, components = connected_components(graph, directed=False)
+        ids = self._cluster_ids[roots]
+        ids = np.where(ids < 0, np.iinfo(np.intp).max, ids)
+        # The root holding the oldest id of every component becomes the component's root
+        order = np.lexsort((ids, components))
+        first = np.flatnonzero(np.r_[True, components[order][1:] != components[order][:-1]])
+        new_roots = roots[order[first]]
+        self._parent[roots] = new_roots[components]
+        is_new = self._cluster_ids[new_roots] < 0
+        self._cluster_ids[new_roots[is_new]] = self._next_cluster_id + np.arange(is_new.sum())
+        self._next_cluster_id += int(is_new.sum())
+
+    def insert(self, lat, lon):
+        """
+        Adds new crashes and updates core points, clusters and borders around them
+        :param lat: Latitudes in degrees
+        :param lon: Longitudes in degrees
+        :return : returns the cluster id of every inserted crash, -1 for noise
+        """
+        with span("incremental_dbscan_insert", eps_m=self.eps_m, min_samples=self.min_samples) as stage:
+            labels = self._insert(lat, lon)
+            stage.set(rows_in=len(labels), rows_total=self.n_rows, points_total=self.n_points,
+                      clusters=self.n_clusters)
+        return labels
+
+    def _insert(self, lat, lon):
+        points, weights, inverse = collapse_duplicates(lat, lon)
+        start, end = self.n_points, self.n_points + len(points)
+        self._grow(len(points), len(inverse))
+        self._points[start:end] = points
+        self._weights[start:end] = weights
+        self._row_points[self.n_rows:self.n_rows + len(inverse)] = inverse + start
+        self.n_rows += len(inverse)
+        self.n_points = end
+        if len(points) == 0:
+            return np.empty(0, dtype=np.intp)
+        self._add_tree(start, end)
+
+        # Neighbour weights of the new points, and of the old points next to them
+        sources, targets = self._neighbours(points)
+        sources += start
+        self._neighbour_weights[start:end] = np.bincount(sources - start, weights=self._weights[targets],
+                                                         minlength=len(points))
+        old = targets < start
+        np.add.at(self._neighbour_weights, targets[old], self._weights[sources[old]])
+
+        is_core = self._parent[:end] >= 0
+        touched = np.unique(np.r_[np.arange(start, end), targets[old]])
+        new_cores = touched[(self._neighbour_weights[touched] >= self.min_samples) & ~is_core[touched]]
+        self._parent[new_cores] = new_cores
+        self._anchors[new_cores] = new_cores
+
+        # Old points that became cores need their own neighbourhoods for the merge
+        old_cores = new_cores[new_cores < start]
+        if len(old_cores):
+            core_sources, core_targets = self._neighbours(self._points[old_cores])
+            sources = np.r_[sources, old_cores[core_sources]]
+            targets = np.r_[targets, core_targets]
+        sources, targets = np.r_[sources, targets], np.r_[targets, sources]
+        is_core = self._parent[:end] >= 0
+        is_new_core = np.zeros(end, dtype=bool)
+        is_new_core[new_cores] = True
+
+        core_edges = is_core[sources] & is_core[targets] & (is_new_core[sources] | is_new_core[targets])
+        self._union(sources[core_edges], targets[core_edges])
+
+        # Noise next to a core becomes a border point of the core's cluster with the lowest id
+        border_edges = (self._anchors[sources] < 0) & is_core[targets]
+        if border_edges.any():
+            border_sources = sources[border_edges]
+            border_targets = targets[border_edges]
+            border_ids = self._cluster_ids[self._find(border_targets)]
+            order = np.lexsort((border_ids, border_sources))
+            first = np.flatnonzero(np.r_[True, border_sources[order][1:] != border_sources[order][:-1]])
+            self._anchors[border_sources[order[first]]] = border_targets[order[first]]
+        return self._point_labels(inverse + start)
+
+    def _point_labels(self, point_index):
+        anchors = self._anchors[point_index]
+        labels = np.full(len(point_index), -1)
+        clustered = anchors >= 0
+        labels[clustered] = self._cluster_ids[self._find(anchors[clustered])]
+        return labels
+
+    def labels(self):
+        """
+        :return : returns the current cluster id of every inserted crash in insertion order, -1 for noise
+        """
+        return self._point_labels(self._row_points[:self.n_rows])
+
+    def save(self, path):
+        """
+        Saves the state to a pickle file
+        """
+        with open(path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a state saved with save
+        """
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+# Profile columns and the names they go by in the cleaned SQL data and in the raw csv data
+PROFILE_COLUMNS = {
+    "ZIP_CODE": ("ZIP_CODE", "ZIP CODE"),
+    "INJURED": ("NUMBER_OF_INJURED", "NUMBER OF INJURED"),
+    "KILLS": ("NUMBER_OF_KILLS", "NUMBER OF KILLS"),
+    "CASUALTIES": ("NUMBER_OF_CASUALTIES", "NUMBER OF CASUALTIES"),
+}
+
+# Kilometres per degree of latitude
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_M / 180 / 1000
+
+
+def cluster_profile(data, labels=None, label_column="CLUSTER", include_noise=False):
+    """
+    Summarises every cluster in one pass over the labels: centroid, bounding box, point count,
+    density, summed injuries, kills and casualties and dominant zip code. The columns of the profile
+    that data has no column for are left out.
+    :param data: Crashes with LATITUDE and LONGITUDE, cleaned SQL or raw csv column names
+    :param labels: Cluster label of every row, read from label_column when None
+    :param label_column: Column holding the labels
+    :param include_noise: Also profile the noise points under label -1
+    :return : returns one row per cluster indexed by the cluster label
+    """
+    labels = np.asarray(data[label_column] if labels is None else labels)
+    keep = np.flatnonzero(labels >= 0) if not include_noise else np.arange(len(labels))
+    clusters, index = np.unique(labels[keep], return_inverse=True)
+    n_clusters = len(clusters)
+    counts = np.bincount(index, minlength=n_clusters)
+    lat = data["LATITUDE"].to_numpy(dtype="float64")[keep]
+    lon = data["LONGITUDE"].to_numpy(dtype="float64")[keep]
+
+    profile = pd.DataFrame({"COUNT": counts}, index=pd.Index(clusters, name=label_column))
+    if n_clusters == 0:
+        return profile
+    profile["LATITUDE"] = np.bincount(index, weights=lat, minlength=n_clusters) / counts
+    profile["LONGITUDE"] = np.bincount(index, weights=lon, minlength=n_clusters) / counts
+
+    # Bounding boxes from the rows sorted by cluster
+    order = np.argsort(index, kind="stable")
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    profile["MIN_LATITUDE"] = np.minimum.reduceat(lat[order], starts)
+    profile["MAX_LATITUDE"] = np.maximum.reduceat(lat[order], starts)
+    profile["MIN_LONGITUDE"] = np.minimum.reduceat(lon[order], starts)
+    profile["MAX_LONGITUDE"] = np.maximum.reduceat(lon[order], starts)
+    height = (profile["MAX_LATITUDE"] - profile["MIN_LATITUDE"]) * KM_PER_DEGREE
+    width = ((profile["MAX_LONGITUDE"] - profile["MIN_LONGITUDE"]) * KM_PER_DEGREE
+             * np.cos(np.radians(profile["LATITUDE"])))
+    profile["AREA_KM2"] = height * width
+    # Crashes per square kilometre of the bounding box, NaN for clusters on a single point or line
+    profile["DENSITY"] = profile["COUNT"] / profile["AREA_KM2"].where(profile["AREA_KM2"] > 0)
+
+    found = {name: next((column for column in columns if column in data.columns), None)
+             for name, columns in PROFILE_COLUMNS.items()}
+    for name in ("INJURED", "KILLS", "CASUALTIES"):
+        if found[name] is not None:
+            values = data[found[name]].to_numpy(dtype="float64", na_value=0)[keep]
+            profile[name] = np.bincount(index, weights=values, minlength=n_clusters)
+
+    if found["ZIP_CODE"] is not None:
+        # Most frequent zip code of every cluster, from the counts of the (cluster, zip) pairs
+        codes, zip_codes = pd.factorize(data[found["ZIP_CODE"]].to_numpy()[keep])
+        present = codes >= 0
+        dominant = np.full(n_clusters, None, dtype=object)
+        if present.any():
+            pairs, pair_counts = np.unique(index[present] * len(zip_codes) + codes[present], return_counts=True)
+            pair_clusters, pair_codes = np.divmod(pairs, len(zip_codes))
+            best = np.lexsort((-pair_counts, pair_clusters))
+            first = best[np.r_[True, pair_clusters[best][1:] != pair_clusters[best][:-1]]]
+            dominant[pair_clusters[first]] = np.asarray(zip_codes, dtype=object)[pair_codes[first]]
+        profile["ZIP_CODE"] = dominant
+    return profile
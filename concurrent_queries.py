@@ -0,0 +1,105 @@
+import asyncio
+import importlib.util
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+from engine_factory import MAX_OVERFLOW, POOL_SIZE
+from instrumentation import current_span_id, parent_span, span
+from result_cache import cached_read_sql
+
+# Queries in flight at once, as many as the pool can hand out connections without waiting
+QUERY_WORKERS = int(os.environ.get("CRASH_QUERY_WORKERS", POOL_SIZE + MAX_OVERFLOW))
+
+# Async drivers of the backends, used by async_engine
+ASYNC_DRIVERS = {"sqlite": ("aiosqlite", "aiosqlite"), "mysql": ("aiomysql", "aiomysql")}
+
+
+def engine_workers(engine, max_workers=None):
+    """
+    Queries an engine can run at once: one for an in-memory SQLite database, whose single shared
+    connection can't be used by two threads at the same time, max_workers otherwise
+    """
+    return 1 if isinstance(engine.pool, StaticPool) else max_workers
+
+
+def gather(tasks, max_workers=None):
+    """
+    Runs independent calls at the same time on a thread pool and waits for all of them. Each call
+    checks out its own connection from the engine's pool, so a batch of queries takes about as long
+    as the slowest one instead of the sum of all of them.
+    :param tasks: Dict of name -> function taking no arguments, e.g. a lambda or functools.partial
+    :param max_workers: Calls running at once, QUERY_WORKERS when None
+    :return : returns a dict of name -> result in the order of tasks, the first error is raised
+    """
+    if not tasks:
+        return {}
+    workers = min(len(tasks), max_workers or QUERY_WORKERS)
+    with span("query_batch", tasks=len(tasks), workers=workers):
+        parent = current_span_id()
+
+        def run(function):
+            with parent_span(parent):
+                return function()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query") as pool:
+            futures = {name: pool.submit(run, function) for name, function in tasks.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+
+def read_sql_many(engine, queries, table_name="crash_data", max_workers=None):
+    """
+    Runs several queries concurrently through the result cache
+    :param engine: The SQLAlchemy engine object, its pool should hold max_workers connections
+    :param queries: Dict of name -> (statement, params) or (statement, params, parse_dates)
+    :param table_name: The table the queries read
+    :param max_workers: Queries running at once, QUERY_WORKERS when None, one at a time on in-memory SQLite
+    :return : returns a dict of name -> DataFrame
+    """
+    tasks = {}
+    for name, query in queries.items():
+        statement, params, parse_dates = (tuple(query) + (None,))[:3]
+        tasks[name] = (lambda statement=statement, params=params, parse_dates=parse_dates:
+                       cached_read_sql(engine, statement, params, table_name, parse_dates))
+    return gather(tasks, engine_workers(engine, max_workers))
+
+
+def async_engine(url):
+    """
+    Creates an async engine on the async driver of the url's backend (aiosqlite, aiomysql). Both
+    the driver and greenlet are optional dependencies.
+    :param url: SQLAlchemy url or string, its driver is replaced
+    :return : returns a SQLAlchemy AsyncEngine
+    """
+    url = make_url(url)
+    driver, module = ASYNC_DRIVERS.get(url.get_backend_name(), (None, None))
+    if driver is None:
+        raise ValueError(f"No async driver known for {url.get_backend_name()}")
+    for required in (module, "greenlet"):
+        if importlib.util.find_spec(required) is None:
+            raise ImportError(f"{required} is required for async queries, install it or use read_sql_many")
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(url.set(drivername=f"{url.get_backend_name()}+{driver}"))
+
+
+async def read_sql_async(engine, statement, params=None, parse_dates=None):
+    """
+    Runs one query on an async engine, without the result cache
+    :return : returns the result as a DataFrame
+    """
+    async with engine.connect() as connection:
+        return await connection.run_sync(
+            lambda sync_connection: pd.read_sql(statement, sync_connection, params=params, parse_dates=parse_dates))
+
+
+async def read_sql_many_async(engine, queries):
+    """
+    Async version of read_sql_many for callers already running an event loop
+    :param engine: An AsyncEngine from async_engine
+    :param queries: Dict of name -> (statement, params) or (statement, params, parse_dates)
+    :return : returns a dict of name -> DataFrame
+    """
+    with span("query_batch", tasks=len(queries), workers="async"):
+        results = await asyncio.gather(*(read_sql_async(engine, *query) for query in queries.values()))
+    return dict(zip(queries, results))
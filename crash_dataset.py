@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+
+# Date parts computed once when the dataset is built, WEEKDAY is 0 for Monday like pandas' dayofweek
+DATE_PARTS = ["YEAR", "MONTH", "WEEKDAY", "HOUR"]
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    return set(value) if isinstance(value, (list, tuple, set)) else {value}
+
+
+class CrashDataset:
+    """
+    Cleaned crash rows sorted once by borough and crash date, so every (borough, year, month) partition
+    is a contiguous block of rows. Slices are kept as offset ranges into the sorted rows and are only
+    turned into DataFrames when they are used, a single range becomes a view without a copy.
+    """
+
+    def __init__(self, data, date_column=None, time_column=None, borough_column="BOROUGH"):
+        """
+        :param data: Cleaned crash rows, raw csv (CRASH DATE) or SQL (CRASH_DATE) column names
+        :param date_column: Datetime column, CRASH DATE or CRASH_DATE when None
+        :param time_column: 'HH:MM' column the hours are read from, CRASH TIME when present, otherwise
+                            the hours come from the date column
+        :param borough_column: Borough column
+        """
+        self.date_column = date_column or ("CRASH DATE" if "CRASH DATE" in data.columns else "CRASH_DATE")
+        self.borough_column = borough_column
+        if time_column is None and "CRASH TIME" in data.columns:
+            time_column = "CRASH TIME"
+
+        data = data.assign(**{borough_column: data[borough_column].astype("category")})
+        order = np.lexsort((data[self.date_column].to_numpy(), data[borough_column].cat.codes.to_numpy()))
+        self.data = data.iloc[order].reset_index(drop=True)
+
+        dates = self.data[self.date_column].dt
+        self.data["YEAR"] = dates.year.astype("int16")
+        self.data["MONTH"] = dates.month.astype("int8")
+        self.data["WEEKDAY"] = dates.dayofweek.astype("int8")
+        if time_column is not None:
+            self.data["HOUR"] = pd.to_numeric(self.data[time_column].str.split(":").str[0]).astype("int8")
+        else:
+            self.data["HOUR"] = dates.hour.astype("int8")
+
+        # Offsets where a new borough starts, crash dates are only sorted between two of them
+        codes = self.data[borough_column].cat.codes.to_numpy()
+        self.borough_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else \
+            np.empty(0, dtype=np.int64)
+
+        # One row per (borough, year, month) partition with its offsets in the sorted rows
+        keys = (self.data[borough_column].cat.codes.to_numpy(dtype=np.int64) * 10000
+                + self.data["YEAR"].to_numpy(dtype=np.int64)) * 100 + self.data["MONTH"].to_numpy(dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+        self.partitions = self.data[[borough_column, "YEAR", "MONTH"]].iloc[starts].reset_index(drop=True)
+        self.partitions["START"] = starts
+        self.partitions["END"] = np.r_[starts[1:], len(self.data)].astype(np.int64)
+
+    def __len__(self):
+        return len(self.data)
+
+    def all(self):
+        """
+        :return : returns a slice over every row
+        """
+        return CrashSlice(self, [(0, len(self.data))])
+
+    def select(self, borough=None, year=None, month=None, start_date=None, end_date=None):
+        """
+        See CrashSlice.select
+        """
+        return self.all().select(borough, year, month, start_date, end_date)
+
+
+class CrashSlice:
+    """
+    Rows of a CrashDataset given by offset ranges, slicing a slice again only narrows the ranges
+    """
+
+    def __init__(self, dataset, ranges):
+        self.dataset = dataset
+        self.ranges = ranges
+
+    def __len__(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def select(self, borough=None, year=None, month=None, start_date=None, end_date=None):
+        """
+        Narrows the slice, every filter left to None keeps all rows
+        :param borough: A borough or a list of boroughs
+        :param year: A year or a list of years
+        :param month: A month number or a list of month numbers
+        :param start_date: Keep crashes on or after this date
+        :param end_date: Keep crashes before this date (exclusive)
+        :return : returns a new CrashSlice
+        """
+        partitions = self.dataset.partitions
+        keep = np.ones(len(partitions), dtype=bool)
+        for column, values in ((self.dataset.borough_column, _as_set(borough)), ("YEAR", _as_set(year)),
+                               ("MONTH", _as_set(month))):
+            if values is not None:
+                keep &= partitions[column].isin(values).to_numpy()
+        ranges = _merge_ranges(zip(partitions["START"][keep], partitions["END"][keep]))
+        ranges = _intersect_ranges(self.ranges, ranges)
+
+        if start_date is not None or end_date is not None:
+            # Crash dates are sorted within every borough, so a date range is a range of offsets of
+            # each borough, ranges spanning several boroughs are trimmed one borough at a time
+            dates = self.dataset.data[self.dataset.date_column].to_numpy()
+            trimmed = []
+            for start, end in _split_ranges(ranges, self.dataset.borough_starts):
+                if start_date is not None:
+                    start += np.searchsorted(dates[start:end], np.datetime64(pd.Timestamp(start_date)), "left")
+                if end_date is not None:
+                    end = start + np.searchsorted(dates[start:end], np.datetime64(pd.Timestamp(end_date)), "left")
+                if start < end:
+                    trimmed.append((int(start), int(end)))
+            ranges = _merge_ranges(trimmed)
+        return CrashSlice(self.dataset, ranges)
+
+    def to_frame(self):
+        """
+        :return : returns the rows as a DataFrame, a view of the dataset when the slice is a single range
+        """
+        data = self.dataset.data
+        if not self.ranges:
+            return data.iloc[0:0]
+        if len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            return data.iloc[start:end]
+        return pd.concat([data.iloc[start:end] for start, end in self.ranges])
+
+
+def _merge_ranges(ranges):
+    """
+    Sorts offset ranges and joins the ones that touch
+    """
+    merged = []
+    for start, end in sorted((int(start), int(end)) for start, end in ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _split_ranges(ranges, boundaries):
+    """
+    Cuts offset ranges at the given sorted offsets
+    """
+    result = []
+    for start, end in ranges:
+        cuts = boundaries[(boundaries > start) & (boundaries < end)]
+        for cut in cuts:
+            result.append((start, int(cut)))
+            start = int(cut)
+        result.append((start, end))
+    return result
+
+
+def _intersect_ranges(first, second):
+    """
+    Offsets in both lists of sorted, disjoint ranges
+    """
+    result = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def as_frame(data):
+    """
+    Lets functions take a DataFrame, a CrashDataset or a CrashSlice
+    """
+    if isinstance(data, CrashDataset):
+        return data.data
+    if isinstance(data, CrashSlice):
+        return data.to_frame()
+    return data
+
+
+def date_part(data, part, date_column="CRASH DATE"):
+    """
+    A precomputed date part of a CrashDataset frame, or the part computed from the date column
+    :param data: A DataFrame
+    :param part: YEAR, MONTH, WEEKDAY or HOUR
+    :param date_column: Column to compute the part from when it is not precomputed
+    """
+    if part in data.columns:
+        return data[part]
+    if part == "HOUR" and "CRASH TIME" in data.columns:
+        return pd.to_numeric(data["CRASH TIME"].str.split(":").str[0]).rename("HOUR")
+    dates = data[date_column].dt
+    return {"YEAR": dates.year, "MONTH": dates.month, "WEEKDAY": dates.dayofweek, "HOUR": dates.hour}[part].rename(part)
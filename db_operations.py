@@ -1,21 +1,37 @@
+import os
+import tempfile
+import time
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError
+from dtype_utils import optimize_dtypes
+from engine_factory import database_url, get_engine, loader_engine
+from instrumentation import frame_bytes, span
+from factors import create_factor_tables, delete_factors, drop_factor_tables, factors_exist, split_factors, \
+    write_factors
+from rollups import apply_rollups, create_rollup_tables, drop_rollup_tables, rollups_exist
+from result_cache import cached_read_sql, create_generation_table_if_not_exists, mark_table_written
+from schema import create_crash_table
 
 
-def create_connection(host_name, user_name, user_password, db_name):
-    try:
-        # Connect to the MySQL server
-        engine = create_engine(f'mysql+mysqlconnector://{user_name}:{user_password}@{host_name}')
-        with engine.connect() as connection:
-            # Create the database if it doesn't exist
-            connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {db_name}"))
-
-        # Connect to the specific database
-        engine = create_engine(f'mysql+mysqlconnector://{user_name}:{user_password}@{host_name}/{db_name}')
-        print("MySQL Database connection successful and database ensured")
-    except SQLAlchemyError as e:
-        print(f"The error '{e}' occurred")
+def create_connection(host_name=None, user_name=None, user_password=None, db_name=None):
+    """
+    Returns the shared, pooled engine of the crash database from engine_factory, the database is
+    created when it doesn't exist. Engines are cached, calling this again costs nothing.
+    Arguments left to None are read from the CRASH_DB_* environment variables.
+    :return : returns the SQLAlchemy engine, None when the database can't be reached
+    """
+    engine = None
+    with span("create_connection", host=host_name, database=db_name) as stage:
+        try:
+            url = database_url(host_name, user_name, user_password, db_name)
+            stage.set(host=url.host, database=url.database, driver=url.get_driver_name())
+            engine = get_engine(url, create_database=True)
+            print("Database connection successful and database ensured")
+        except SQLAlchemyError as e:
+            print(f"The error '{e}' occurred")
+            stage.set(error=str(e))
     return engine
 
 
@@ -24,61 +40,475 @@ def drop_table_if_exists(engine, table_name):
     try:
         with engine.connect() as connection:
             connection.execute(text(drop_table_query))
+            drop_rollup_tables(connection, table_name)
+            drop_factor_tables(connection, table_name)
+            connection.commit()
             print(f"Table {table_name} dropped successfully")
+        mark_table_written(engine, table_name)
     except SQLAlchemyError as e:
         print(f"The error '{e}' occurred while dropping the table")
 
 
-def create_table_if_not_exists(engine, table_name):
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        CRASH_DATE DATETIME,
-        LATITUDE FLOAT,
-        LONGITUDE FLOAT,
-        ZIP_CODE VARCHAR(255),
-        NUMBER_OF_KILLS INT,
-        NUMBER_OF_INJURED INT,
-        NUMBER_OF_CASUALTIES INT,
-        BOROUGH VARCHAR(255)
-    );
+def create_table_if_not_exists(engine, table_name, partition_years=None):
     """
-    with engine.connect() as connection:
-        connection.execute(text(create_table_query))
+    Creates the crash table with the compact, indexed schema from schema.py, its rollup tables and its
+    factor tables
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param partition_years: Optional iterable of years to range partition on (MySQL only)
+    """
+    create_crash_table(engine, table_name, partition_years)
+    create_rollup_tables(engine, table_name)
+    create_factor_tables(engine, table_name)
+    create_generation_table_if_not_exists(engine)
+
+
+def _insert_rows(chunk):
+    """
+    Converts a chunk into plain python tuples that every DBAPI driver can bind,
+    datetimes become strings and missing values become None
+    """
+    chunk = chunk.copy()
+    for column in chunk.columns:
+        if pd.api.types.is_datetime64_any_dtype(chunk[column]):
+            chunk[column] = chunk[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return list(chunk.itertuples(index=False, name=None))
+
+
+def _executemany_insert(connection, chunk, table_name):
+    """
+    Inserts a chunk with a single executemany call, the MySQL drivers rewrite it into multi-row INSERTs
+    """
+    placeholder = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+    columns = ", ".join(chunk.columns)
+    values = ", ".join([placeholder] * len(chunk.columns))
+    connection.exec_driver_sql(f"INSERT INTO {table_name} ({columns}) VALUES ({values})", _insert_rows(chunk))
+
+
+def _load_data_infile(connection, chunk, table_name):
+    """
+    Writes a chunk to a temporary csv file and loads it with MySQL's LOAD DATA LOCAL INFILE
+    :return : returns the size of the csv file sent to the server
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as handle:
+        chunk.to_csv(handle, index=False, header=False, na_rep="\\N", lineterminator="\n",
+                     date_format="%Y-%m-%d %H:%M:%S")
+        path = handle.name
+    try:
+        columns = ", ".join(chunk.columns)
+        connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path.replace(os.sep, '/')}' INTO TABLE {table_name} "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+            f"({columns})")
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def bulk_load(data, connection, table_name="crash_data", chunk_size=10000, max_chunk_size=200000):
+    """
+    Loads data with the fastest mechanism the backend supports, LOAD DATA LOCAL INFILE on MySQL
+    through a connection of loader_engine, and a multi-row executemany everywhere else (SQLite
+    included). The chunk size grows while the throughput keeps improving and shrinks again when it drops.
+    :param data: The data to be pushed
+    :param connection: A SQLAlchemy connection inside a transaction
+    :param table_name: The table name
+    :param chunk_size: The initial chunk size
+    :param max_chunk_size: Upper bound for the adaptive chunk size
+    """
+    method = "infile" if connection.dialect.name == "mysql" else "executemany"
+    min_chunk_size = chunk_size
+    best_rate = 0.0
+    start = 0
+    while start < len(data):
+        end = start + chunk_size
+        chunk = data.iloc[start:end]
+        chunk_start = time.perf_counter()
+        with span("write_chunk", table=table_name, method=method, first_row=start, rows_in=len(chunk),
+                  bytes=frame_bytes(chunk)) as stage:
+            if method == "infile":
+                try:
+                    stage.set(bytes=_load_data_infile(connection, chunk, table_name))
+                except DBAPIError as e:
+                    # local_infile is disabled on the server or the client, use executemany instead
+                    print(f"LOAD DATA LOCAL INFILE is not available ({e.orig}), falling back to executemany")
+                    stage.set(error=str(e.orig))
+                    method = "executemany"
+                    continue
+            else:
+                _executemany_insert(connection, chunk, table_name)
+            stage.set(rows_out=len(chunk))
+        elapsed = time.perf_counter() - chunk_start
+        print(f"Pushed rows {start} to {start + len(chunk)} to {table_name}")
+        start = end
+
+        # Adapt the chunk size to the observed throughput
+        rate = len(chunk) / elapsed if elapsed > 0 else float("inf")
+        if rate > best_rate:
+            best_rate = rate
+            chunk_size = min(chunk_size * 2, max_chunk_size)
+        elif rate < 0.8 * best_rate:
+            chunk_size = max(chunk_size // 2, min_chunk_size)
+
+
+# Attempts of a write transaction that hits a lock held by another writer, and the first wait between them
+WRITE_ATTEMPTS = 4
+RETRY_DELAY = 0.5
+
+# MySQL error codes of a deadlock and of a lock wait timeout, SQLite reports its lock in the message
+TRANSIENT_MYSQL_ERRORS = {1205, 1213}
 
 
-def push_data_to_db(data, engine, table_name="crash_data"):
+def is_transient_error(error):
+    """
+    Tells whether a failed write only lost a race for a lock and can be retried as it is
+    :param error: The SQLAlchemy error, or the pandas error DataFrame.to_sql wraps it in
+    """
+    if isinstance(error, pd.errors.DatabaseError):
+        error = error.__cause__
+    if not isinstance(error, OperationalError):
+        return False
+    args = getattr(error.orig, "args", ())
+    return (bool(args) and args[0] in TRANSIENT_MYSQL_ERRORS) or "database is locked" in str(error.orig)
+
+
+def push_data_to_db(data, engine, table_name="crash_data", bulk=False, rollups=True):
     """
     Pushes data into MySQL database in smaller chunks
     :param data: The data to be pushed
     :param engine: The SQLAlchemy engine object
     :param table_name: The table name
+    :param bulk: Use bulk_load instead of DataFrame.to_sql
+    :param rollups: Update the rollup tables, concurrent writers leave them to rebuild_rollups once
+                    all the rows are in
+    The rollup tables of the table, when they exist, are updated in the same transaction, and the
+    contributing factor and vehicle type columns go to the factor table.
+    A transaction that loses a lock to another writer is retried, any other failed write is rolled
+    back and its error raised again, so callers never count rows that were not committed.
     """
     chunk_size = 10000  # Define a chunk size
+    with span("push_data_to_db", table=table_name, bulk=bulk, rows_in=len(data)) as stage:
+        data, factors = split_factors(data)
+        try:
+            for attempt in range(WRITE_ATTEMPTS):
+                try:
+                    # Only the bulk loader's connections allow LOAD DATA LOCAL INFILE
+                    writer = loader_engine(engine) if bulk else engine
+                    with writer.begin() as connection:  # Use begin to start a transaction
+                        if bulk:
+                            bulk_load(data, connection, table_name, chunk_size)
+                        else:
+                            for start in range(0, len(data), chunk_size):
+                                end = start + chunk_size
+                                chunk = data.iloc[start:end]
+                                with span("write_chunk", table=table_name, method="to_sql", first_row=start,
+                                          rows_in=len(chunk), rows_out=len(chunk), bytes=frame_bytes(chunk)):
+                                    chunk.to_sql(table_name, con=connection, if_exists='append', index=False)
+                                print(f"Pushed rows {start} to {end} to {table_name}")
+                        if rollups and rollups_exist(connection, table_name):
+                            apply_rollups(connection, data, table_name)
+                        if factors_exist(connection, table_name):
+                            write_factors(connection, factors, table_name)
+                    break
+                except (OperationalError, pd.errors.DatabaseError) as e:
+                    if attempt + 1 == WRITE_ATTEMPTS or not is_transient_error(e):
+                        raise
+                    # The transaction was rolled back whole, it is written again from the start
+                    print(f"Write to {table_name} hit a lock held by another writer, retrying")
+                    stage.set(retries=attempt + 1)
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+            mark_table_written(engine, table_name)
+            stage.set(rows_out=len(data), factor_rows=len(factors))
+            print(f"Data pushed to {table_name} successfully")
+        except (SQLAlchemyError, pd.errors.DatabaseError) as e:
+            # The engine is shared with the other writers, it stays open
+            print(f"The error '{e}' occurred")
+            stage.set(error=str(e))
+            raise
+
+
+def create_watermark_table_if_not_exists(engine):
+    """
+    Creates the table that records how far each crash table has been loaded
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS ingest_watermark (
+        TABLE_NAME VARCHAR(64) PRIMARY KEY,
+        MAX_CRASH_DATE DATETIME,
+        MAX_COLLISION_ID BIGINT,
+        UPDATED_AT DATETIME
+    );
+    """
+    with engine.begin() as connection:
+        connection.execute(text(create_table_query))
+
+
+def read_watermark(engine, table_name="crash_data"):
+    """
+    Reads the watermark of a table
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :return : returns a (max crash date, max collision id) tuple, or None if the table was never loaded
+    """
+    create_watermark_table_if_not_exists(engine)
+    with engine.connect() as connection:
+        row = connection.execute(text("SELECT MAX_CRASH_DATE, MAX_COLLISION_ID FROM ingest_watermark "
+                                      "WHERE TABLE_NAME = :table_name"), {"table_name": table_name}).first()
+    if row is None or row[0] is None:
+        return None
+    return pd.Timestamp(row[0]), int(row[1])
+
+
+def refresh_watermark(engine, table_name="crash_data"):
+    """
+    Sets the watermark of a table to the newest crash date and collision id it holds
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    """
+    create_watermark_table_if_not_exists(engine)
     try:
-        with engine.begin() as connection:  # Use begin to start a transaction
-            for start in range(0, len(data), chunk_size):
-                end = start + chunk_size
-                chunk = data.iloc[start:end]
-                chunk.to_sql(table_name, con=connection, if_exists='append', index=False)
-                print(f"Pushed rows {start} to {end} to {table_name}")
-        print(f"Data pushed to {table_name} successfully")
+        with engine.begin() as connection:
+            max_crash_date, max_collision_id = connection.execute(
+                text(f"SELECT MAX(CRASH_DATE), MAX(COLLISION_ID) FROM {table_name}")).first()
+            connection.execute(text("DELETE FROM ingest_watermark WHERE TABLE_NAME = :table_name"),
+                               {"table_name": table_name})
+            connection.execute(text("INSERT INTO ingest_watermark VALUES "
+                                    "(:table_name, :max_crash_date, :max_collision_id, :updated_at)"),
+                               {"table_name": table_name,
+                                "max_crash_date": None if max_crash_date is None else str(max_crash_date),
+                                "max_collision_id": max_collision_id,
+                                "updated_at": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")})
+        print(f"Watermark of {table_name} set to {max_crash_date}, collision id {max_collision_id}")
     except SQLAlchemyError as e:
-        print(f"The error '{e}' occurred")
-        engine.dispose()  # Close the engine to prevent further errors
+        print(f"The error '{e}' occurred while refreshing the watermark")
+
+
+def _changed_rows(data, existing, key):
+    """
+    Returns a boolean mask over data that is True for rows missing from existing or differing from it
+    """
+    merged = data[[key]].merge(existing, on=key, how="left", indicator=True)
+    changed = (merged["_merge"] == "left_only").to_numpy()
+    for column in data.columns.drop(key):
+        if column not in existing.columns:
+            continue
+        new_values = data[column].reset_index(drop=True)
+        old_values = merged[column]
+        both_missing = new_values.isna().to_numpy() & old_values.isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(new_values) and pd.api.types.is_numeric_dtype(old_values):
+            # FLOAT columns round coordinates, so compare them with a tolerance
+            same = np.isclose(new_values.to_numpy(dtype=float, na_value=np.nan),
+                              old_values.to_numpy(dtype=float, na_value=np.nan), atol=1e-5)
+        elif pd.api.types.is_datetime64_any_dtype(new_values):
+            same = (new_values == pd.to_datetime(old_values)).to_numpy()
+        else:
+            same = (new_values.astype(str) == old_values.astype(str)).to_numpy()
+        changed = changed | ~(same | both_missing)
+    return changed
 
 
-def pull_data_from_db(engine, table_name="crash_data"):
+def upsert_data_to_db(data, engine, table_name="crash_data", key="COLLISION_ID", batch_size=1000):
     """
-    Pulls data from MySQL database
+    Writes only the rows that are new or changed. Rows already loaded with the same values are
+    skipped, changed rows are deleted and loaded again together with their factor rows. Whether a row
+    changed is decided on the crash columns only.
+    :param data: The cleaned data, it must contain the key column
     :param engine: The SQLAlchemy engine object
     :param table_name: The table name
+    :param key: The column identifying a crash
+    :param batch_size: Number of keys looked up per query
+    :return : returns the number of rows written, a failed write is rolled back and its error raised again
+    """
+    data = data.drop_duplicates(subset=key, keep="last")
+    data, factors = split_factors(data)
+    lookup = text(f"SELECT * FROM {table_name} WHERE {key} IN :keys").bindparams(bindparam("keys", expanding=True))
+    delete = text(f"DELETE FROM {table_name} WHERE {key} IN :keys").bindparams(bindparam("keys", expanding=True))
+    written = 0
+    with span("upsert_data_to_db", table=table_name, rows_in=len(data)) as stage:
+        try:
+            with engine.begin() as connection:
+                has_rollups = rollups_exist(connection, table_name)
+                has_factors = factors_exist(connection, table_name)
+                for start in range(0, len(data), batch_size):
+                    batch = data.iloc[start:start + batch_size]
+                    with span("write_chunk", table=table_name, method="upsert", first_row=start,
+                              rows_in=len(batch)) as chunk_stage:
+                        keys = [int(value) for value in batch[key]]
+                        existing = pd.read_sql(lookup, connection, params={"keys": keys})
+                        changed = batch[_changed_rows(batch, existing, key)]
+                        chunk_stage.set(rows_out=len(changed), bytes=frame_bytes(changed))
+                        if changed.empty:
+                            continue
+                        existing_keys = set(existing[key].tolist())
+                        stale_keys = [int(value) for value in changed[key] if value in existing_keys]
+                        if stale_keys:
+                            if has_rollups:
+                                apply_rollups(connection, existing[existing[key].isin(stale_keys)], table_name,
+                                              sign=-1)
+                            connection.execute(delete, {"keys": stale_keys})
+                            if has_factors:
+                                delete_factors(connection, stale_keys, table_name)
+                        _executemany_insert(connection, changed, table_name)
+                        if has_rollups:
+                            apply_rollups(connection, changed, table_name)
+                        if has_factors:
+                            write_factors(connection, factors[factors["COLLISION_ID"].isin(changed[key])],
+                                          table_name)
+                        written += len(changed)
+            if written:
+                mark_table_written(engine, table_name)
+            print(f"Upserted {written} of {len(data)} rows into {table_name}")
+        except SQLAlchemyError as e:
+            # The whole transaction was rolled back, none of the counted rows were written
+            print(f"The error '{e}' occurred")
+            stage.set(error=str(e), rows_out=0)
+            raise
+        stage.set(rows_out=written)
+    return written
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def build_crash_filters(borough=None, start_date=None, end_date=None, zip_code=None,
+                        date_column="CRASH_DATE", date_format="%Y-%m-%d %H:%M:%S", after_collision_id=None):
+    """
+    Builds the WHERE conditions shared by the crash queries
+    :param borough: A borough or a list of boroughs
+    :param start_date: Keep crashes on or after this date
+    :param end_date: Keep crashes before this date (exclusive)
+    :param zip_code: A zip code or a list of zip codes
+    :param date_column: Column the date range applies to
+    :param date_format: How the dates are formatted for the database
+    :param after_collision_id: Keep crashes with a higher COLLISION_ID, i.e. loaded after it
+    :return : returns the list of conditions, their parameters and the names of the list parameters
+    """
+    conditions = []
+    params = {}
+    expanding = []
+    if borough is not None:
+        conditions.append("BOROUGH IN :boroughs")
+        params["boroughs"] = _as_list(borough)
+        expanding.append("boroughs")
+    if zip_code is not None:
+        conditions.append("ZIP_CODE IN :zip_codes")
+        params["zip_codes"] = [str(value) for value in _as_list(zip_code)]
+        expanding.append("zip_codes")
+    if start_date is not None:
+        conditions.append(f"{date_column} >= :start_date")
+        params["start_date"] = pd.Timestamp(start_date).strftime(date_format)
+    if end_date is not None:
+        conditions.append(f"{date_column} < :end_date")
+        params["end_date"] = pd.Timestamp(end_date).strftime(date_format)
+    if after_collision_id is not None:
+        conditions.append("COLLISION_ID > :after_collision_id")
+        params["after_collision_id"] = int(after_collision_id)
+    return conditions, params, expanding
+
+
+def make_statement(query, conditions=(), expanding=(), suffix=""):
+    """
+    Appends the conditions to a query and declares the list parameters
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    statement = text(query + suffix)
+    if expanding:
+        statement = statement.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    return statement
+
+
+def build_crash_query(table_name="crash_data", columns=None, borough=None, start_date=None, end_date=None,
+                      zip_code=None, limit=None, after_collision_id=None):
+    """
+    Builds a SELECT on a crash table with the filters pushed down into SQL
+    :param table_name: The table name
+    :param columns: List of columns to select, all columns if None
+    :param borough: A borough or a list of boroughs
+    :param start_date: Keep crashes on or after this date
+    :param end_date: Keep crashes before this date (exclusive)
+    :param zip_code: A zip code or a list of zip codes
+    :param limit: Maximum number of rows
+    :param after_collision_id: Keep crashes with a higher COLLISION_ID
+    :return : returns the query and its bound parameters
+    """
+    for column in columns or []:
+        if not column.isidentifier():
+            raise ValueError(f"Invalid column name {column!r}")
+    select_list = ", ".join(columns) if columns else "*"
+    conditions, params, expanding = build_crash_filters(borough, start_date, end_date, zip_code,
+                                                        after_collision_id=after_collision_id)
+    suffix = f" LIMIT {int(limit)}" if limit is not None else ""
+    return make_statement(f"SELECT {select_list} FROM {table_name}", conditions, expanding, suffix), params
+
+
+def pull_data_from_db(engine, table_name="crash_data", columns=None, borough=None, start_date=None,
+                      end_date=None, zip_code=None, limit=None, use_cache=True, optimize=True,
+                      after_collision_id=None):
+    """
+    Pulls data from MySQL database, the column list and the filters are applied by the database
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param columns: List of columns to select, all columns if None
+    :param borough: A borough or a list of boroughs
+    :param start_date: Keep crashes on or after this date
+    :param end_date: Keep crashes before this date (exclusive)
+    :param zip_code: A zip code or a list of zip codes
+    :param limit: Maximum number of rows
+    :param use_cache: Serve the result from the local result cache while the table is unchanged
+    :param optimize: Shrink the dtypes with dtype_utils.optimize_dtypes
+    :param after_collision_id: Keep crashes with a higher COLLISION_ID, i.e. loaded after it
     :return : returns the data from database
     """
-    query = f"SELECT * FROM {table_name}"
-    try:
-        with engine.connect() as connection:
-            data = pd.read_sql(query, connection)
-        return data
-    except SQLAlchemyError as e:
-        print(f"The error '{e}' occurred")
-        return pd.DataFrame()  # Return an empty DataFrame in case of error
+    query, params = build_crash_query(table_name, columns, borough, start_date, end_date, zip_code, limit,
+                                      after_collision_id)
+    parse_dates = ["CRASH_DATE"] if columns is None or "CRASH_DATE" in columns else None
+    with span("pull_data_from_db", table=table_name, borough=borough, start_date=start_date, end_date=end_date,
+              zip_code=zip_code, use_cache=use_cache) as stage:
+        try:
+            if use_cache:
+                data = cached_read_sql(engine, query, params, table_name, parse_dates)
+            else:
+                with engine.connect() as connection:
+                    data = pd.read_sql(query, connection, params=params, parse_dates=parse_dates)
+            data = optimize_dtypes(data, report=True, label=table_name) if optimize else data
+            stage.set(rows_out=len(data), bytes=frame_bytes(data))
+            return data
+        except SQLAlchemyError as e:
+            print(f"The error '{e}' occurred")
+            stage.set(error=str(e))
+            return pd.DataFrame()  # Return an empty DataFrame in case of error
+
+
+def iter_data_from_db(engine, table_name="crash_data", columns=None, borough=None, start_date=None,
+                      end_date=None, zip_code=None, limit=None, chunk_size=50000, optimize=True):
+    """
+    Same as pull_data_from_db but yields the result in chunks read through a server-side cursor,
+    so a large pull never has to fit in memory at once
+    :param chunk_size: Number of rows per yielded DataFrame
+    :param optimize: Shrink the dtypes of every chunk with dtype_utils.optimize_dtypes
+    :return : returns a generator of DataFrames
+    """
+    query, params = build_crash_query(table_name, columns, borough, start_date, end_date, zip_code, limit)
+    parse_dates = ["CRASH_DATE"] if columns is None or "CRASH_DATE" in columns else None
+    rows = chunks = 0
+    with span("iter_data_from_db", table=table_name, borough=borough, start_date=start_date, end_date=end_date,
+              zip_code=zip_code, chunk_size=chunk_size, rows_out=0, chunks=0) as stage:
+        try:
+            with engine.connect() as connection:
+                connection = connection.execution_options(stream_results=True)
+                for chunk in pd.read_sql(query, connection, params=params, parse_dates=parse_dates,
+                                         chunksize=chunk_size):
+                    chunk = optimize_dtypes(chunk) if optimize else chunk
+                    rows += len(chunk)
+                    chunks += 1
+                    stage.set(rows_out=rows, chunks=chunks)
+                    yield chunk
+        except GeneratorExit:
+            # The caller stopped reading early, the rows yielded so far are recorded
+            stage.set(stopped_early=True)
+        except SQLAlchemyError as e:
+            print(f"The error '{e}' occurred")
+            stage.set(error=str(e))
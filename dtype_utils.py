@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# String columns that always have few distinct values, both the raw csv names and the SQL names
+CATEGORY_COLUMNS = {
+    "BOROUGH", "ZIP_CODE", "ZIP CODE", "ON STREET NAME", "CROSS STREET NAME", "OFF STREET NAME",
+    *[f"CONTRIBUTING FACTOR VEHICLE {slot}" for slot in range(1, 6)],
+    *[f"VEHICLE TYPE CODE {slot}" for slot in range(1, 6)],
+    *[f"CONTRIBUTING_FACTOR_VEHICLE_{slot}" for slot in range(1, 6)],
+    *[f"VEHICLE_TYPE_CODE_{slot}" for slot in range(1, 6)],
+}
+
+COORDINATE_COLUMNS = {"LATITUDE", "LONGITUDE"}
+
+# Largest rounding error allowed when coordinates are stored as float32, about a metre
+COORDINATE_TOLERANCE = 1e-5
+
+
+def _is_string_column(column):
+    return pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)
+
+
+def _smallest_int(column):
+    """
+    Returns the column with the smallest integer dtype that holds it, a nullable one if it has missing
+    values, or the column unchanged when it holds non integral values
+    """
+    values = column.to_numpy(dtype="float64", na_value=np.nan)
+    present = values[~np.isnan(values)]
+    if len(present) and not np.array_equal(present, np.round(present)):
+        return column
+    low, high = (present.min(), present.max()) if len(present) else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            break
+    if len(present) == len(values):
+        return column.astype(dtype)
+    return column.astype(pd.api.types.pandas_dtype(dtype.__name__.capitalize()))
+
+
+def optimize_dtypes(data, report=False, label="data", category_ratio=0.5):
+    """
+    Shrinks the memory of a crash DataFrame: categoricals for low-cardinality strings, float32
+    coordinates when the rounding stays under COORDINATE_TOLERANCE and the smallest integer type for
+    counts, nullable when they have missing values
+    :param data: The DataFrame, it is not modified
+    :param report: Print the memory footprint before and after
+    :param label: Name used in the report
+    :param category_ratio: Other string columns become categorical below this distinct/rows ratio
+    :return : returns the optimised DataFrame
+    """
+    before = data.memory_usage(deep=True).sum()
+    data = data.copy()
+    for name in data.columns:
+        column = data[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            continue
+        if _is_string_column(column):
+            if name in CATEGORY_COLUMNS or column.nunique() < category_ratio * max(len(column), 1):
+                data[name] = column.astype("category")
+        elif name in COORDINATE_COLUMNS and pd.api.types.is_float_dtype(column):
+            narrow = column.astype("float32")
+            error = np.abs(narrow.to_numpy(dtype="float64") - column.to_numpy(dtype="float64"))
+            if np.nanmax(error, initial=0) <= COORDINATE_TOLERANCE:
+                data[name] = narrow
+        elif pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            data[name] = _smallest_int(column)
+
+    if report:
+        after = data.memory_usage(deep=True).sum()
+        print(f"Memory usage of {label}: {before / 1024 ** 2:.1f} MB -> {after / 1024 ** 2:.1f} MB "
+              f"({1 - after / max(before, 1):.0%} saved)")
+    return data
@@ -0,0 +1,219 @@
+import importlib.util
+import os
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+# MySQL drivers from the fastest to the slowest: mysqlclient is a C extension, mysql-connector is
+# only fast with its C extension, PyMySQL is pure Python. Each entry is (SQLAlchemy driver name,
+# module that must be importable, connect argument enabling LOAD DATA LOCAL INFILE).
+MYSQL_DRIVERS = [
+    ("mysqldb", "MySQLdb", {"local_infile": 1}),
+    ("mysqlconnector", "_mysql_connector", {"allow_local_infile": True}),
+    ("pymysql", "pymysql", {"local_infile": True}),
+    ("mysqlconnector", "mysql.connector", {"allow_local_infile": True}),
+]
+
+# Connection settings, read from the environment so no credentials live in the code
+ENVIRONMENT = {
+    "url": "CRASH_DB_URL",  # A complete SQLAlchemy url, overrides the settings below
+    "host": "CRASH_DB_HOST",
+    "port": "CRASH_DB_PORT",
+    "user": "CRASH_DB_USER",
+    "password": "CRASH_DB_PASSWORD",
+    "database": "CRASH_DB_NAME",
+    "driver": "CRASH_DB_DRIVER",
+}
+DEFAULTS = {"host": "localhost", "user": "root", "database": "nyc_crash_data"}
+
+POOL_SIZE = int(os.environ.get("CRASH_DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.environ.get("CRASH_DB_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.environ.get("CRASH_DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.environ.get("CRASH_DB_POOL_RECYCLE", 3600))  # MySQL drops idle connections after 8h
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def _module_available(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def pick_driver():
+    """
+    The fastest MySQL driver that is installed
+    :return : returns its SQLAlchemy name and its connect arguments, mysqlconnector when none is found
+    """
+    for driver, module, connect_args in MYSQL_DRIVERS:
+        if _module_available(module):
+            return driver, connect_args
+    return "mysqlconnector", {"allow_local_infile": True}
+
+
+def database_url(host=None, user=None, password=None, database=None, port=None, driver=None):
+    """
+    Builds the url of the crash database, every argument left to None is read from its CRASH_DB_*
+    environment variable, CRASH_DB_URL replaces all of them
+    :return : returns a SQLAlchemy URL
+    """
+    if os.environ.get(ENVIRONMENT["url"]) and not any((host, user, password, database, port, driver)):
+        return make_url(os.environ[ENVIRONMENT["url"]])
+    settings = {"host": host, "user": user, "password": password, "database": database, "port": port,
+                "driver": driver}
+    for name, value in settings.items():
+        if value is None:
+            settings[name] = os.environ.get(ENVIRONMENT[name], DEFAULTS.get(name))
+    driver = settings["driver"] or pick_driver()[0]
+    return URL.create(f"mysql+{driver}", username=settings["user"], password=settings["password"],
+                      host=settings["host"], port=int(settings["port"]) if settings["port"] else None,
+                      database=settings["database"])
+
+
+class PoolMetrics:
+    """
+    Counters of one engine's pool, updated by MeteredQueuePool
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    def as_dict(self):
+        with self.lock:
+            return {"checkouts": self.checkouts, "wait_seconds": self.wait_seconds,
+                    "max_wait_seconds": self.max_wait_seconds, "connects": self.connects,
+                    "connect_seconds": self.connect_seconds}
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that times every checkout, the wait for a free connection included, and every new
+    connection
+    """
+
+    def __init__(self, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.metrics.lock:
+                self.metrics.checkouts += 1
+                self.metrics.wait_seconds += elapsed
+                self.metrics.max_wait_seconds = max(self.metrics.max_wait_seconds, elapsed)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            with self.metrics.lock:
+                self.metrics.connects += 1
+                self.metrics.connect_seconds += time.perf_counter() - start
+
+
+def _ensure_database(url):
+    """
+    Creates the database of a MySQL url when it doesn't exist, through a short-lived server connection
+    """
+    server = create_engine(url.set(database=None), poolclass=NullPool)
+    try:
+        with server.connect() as connection:
+            connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {url.database}"))
+    finally:
+        server.dispose()
+
+
+def get_engine(url=None, pool_size=None, max_overflow=None, pool_timeout=None, pool_recycle=None,
+               create_database=False, local_infile=False):
+    """
+    Returns the shared engine of a database, engines are created once per url and pool settings and
+    reused by every caller in the process. The entry points (push_data.py, analyze_data.py, vis.py,
+    report.py and cli.py) all get theirs here, by default from the CRASH_DB_* environment variables.
+    :param url: SQLAlchemy url or string, database_url() (the CRASH_DB_* environment variables) when None
+    :param pool_size: Connections kept open, CRASH_DB_POOL_SIZE when None
+    :param max_overflow: Extra connections opened under load, CRASH_DB_MAX_OVERFLOW when None
+    :param pool_timeout: Seconds to wait for a free connection, CRASH_DB_POOL_TIMEOUT when None
+    :param pool_recycle: Seconds after which a connection is reopened, CRASH_DB_POOL_RECYCLE when None
+    :param create_database: Create the MySQL database first when it doesn't exist
+    :param local_infile: Allow LOAD DATA LOCAL INFILE (MySQL only). A client allowing it lets the server
+                         read any file the client can, so only the bulk loader's engine turns it on,
+                         see loader_engine.
+    :return : returns a SQLAlchemy engine
+    """
+    url = make_url(url) if url is not None else database_url()
+    pool = (POOL_SIZE if pool_size is None else pool_size, MAX_OVERFLOW if max_overflow is None else max_overflow,
+            POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+            POOL_RECYCLE if pool_recycle is None else pool_recycle)
+    key = (url.render_as_string(hide_password=False), pool, local_infile)
+    with _lock:
+        if key in _engines:
+            return _engines[key]
+
+        kwargs = {"pool_pre_ping": True}
+        if url.get_backend_name() == "mysql":
+            if create_database:
+                _ensure_database(url)
+            if local_infile:
+                driver_args = {driver: connect_args for driver, _, connect_args in MYSQL_DRIVERS}
+                kwargs["connect_args"] = driver_args.get(url.get_driver_name(), {})
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            # An in-memory SQLite database lives in one connection, every thread shares it
+            kwargs.update(poolclass=StaticPool, connect_args={"check_same_thread": False})
+        else:
+            kwargs.update(poolclass=MeteredQueuePool, pool_size=pool[0], max_overflow=pool[1],
+                          pool_timeout=pool[2], pool_recycle=pool[3])
+        engine = create_engine(url, **kwargs)
+        _engines[key] = engine
+        return engine
+
+
+def loader_engine(engine):
+    """
+    The shared engine bulk_load writes through: on MySQL an engine of the same database allowing
+    LOAD DATA LOCAL INFILE, engine itself on the other backends
+    """
+    if engine.dialect.name != "mysql":
+        return engine
+    return get_engine(engine.url, local_infile=True)
+
+
+def pool_metrics(engine):
+    """
+    Checkout, wait and connect counters of an engine's pool together with its current state
+    :return : returns a dict, only the pool state for engines not created by get_engine
+    """
+    pool = engine.pool
+    metrics = pool.metrics.as_dict() if isinstance(pool, MeteredQueuePool) else {}
+    if isinstance(pool, QueuePool):
+        metrics.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                       overflow=pool.overflow())
+    return metrics
+
+
+def dispose_engines():
+    """
+    Closes the connections of every shared engine, e.g. before forking worker processes
+    """
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
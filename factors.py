@@ -0,0 +1,227 @@
+import pandas as pd
+from sqlalchemy import bindparam, inspect, text
+from result_cache import mark_table_written
+
+# The multi-valued crash attributes, each spread over five slot columns in the csv file
+FACTOR_KINDS = {
+    "FACTOR": ("CONTRIBUTING_FACTOR_VEHICLE", "CONTRIBUTING FACTOR VEHICLE"),
+    "VEHICLE": ("VEHICLE_TYPE_CODE", "VEHICLE TYPE CODE"),
+}
+SLOTS = range(1, 6)
+
+# Value the city records when the officer didn't give one, it is left out of the top counts by default
+UNSPECIFIED = "Unspecified"
+
+# Raw csv column name of every slot column and its cleaned name
+RAW_FACTOR_COLUMNS = {f"{raw} {slot}": f"{name}_{slot}"
+                      for name, raw in FACTOR_KINDS.values() for slot in SLOTS}
+
+
+def factor_table(table_name):
+    """
+    Name of the long (crash, slot, value) table of a crash table
+    """
+    return f"{table_name}_factors"
+
+
+def factor_values_table(table_name):
+    """
+    Name of the dictionary of the factor and vehicle type values of a crash table
+    """
+    return f"{table_name}_factor_values"
+
+
+def _slot_columns(data, kind):
+    """
+    The slot columns of a kind in data, with their slot numbers, under the cleaned or the raw names
+    """
+    name, raw = FACTOR_KINDS[kind]
+    for prefix in (name, raw):
+        columns = {f"{prefix}_{slot}" if prefix == name else f"{prefix} {slot}": slot for slot in SLOTS}
+        columns = {column: slot for column, slot in columns.items() if column in data.columns}
+        if columns:
+            return columns
+    return {}
+
+
+def create_factor_tables(engine, table_name="crash_data"):
+    """
+    Creates the factor table of a crash table and its value dictionary
+    """
+    if engine.dialect.name == "mysql":
+        value_id = "VALUE_ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY"
+        value = "VALUE VARCHAR(100) COLLATE utf8mb4_bin NOT NULL"  # Case sensitive, 'SEDAN' is not 'Sedan'
+        index = f", INDEX idx_{factor_table(table_name)}_value (VALUE_ID)"
+        create_index = None
+    else:
+        value_id = "VALUE_ID INTEGER PRIMARY KEY"
+        value = "VALUE VARCHAR(100) NOT NULL"
+        index = ""
+        create_index = (f"CREATE INDEX IF NOT EXISTS idx_{factor_table(table_name)}_value "
+                        f"ON {factor_table(table_name)} (VALUE_ID);")
+    values_query = f"""
+    CREATE TABLE IF NOT EXISTS {factor_values_table(table_name)} (
+        {value_id},
+        KIND VARCHAR(7) NOT NULL,
+        {value},
+        UNIQUE (KIND, VALUE)
+    );
+    """
+    factors_query = f"""
+    CREATE TABLE IF NOT EXISTS {factor_table(table_name)} (
+        COLLISION_ID INT NOT NULL,
+        KIND VARCHAR(7) NOT NULL,
+        SLOT SMALLINT NOT NULL,
+        VALUE_ID INT NOT NULL,
+        PRIMARY KEY (COLLISION_ID, KIND, SLOT){index}
+    );
+    """
+    with engine.begin() as connection:
+        connection.execute(text(values_query))
+        connection.execute(text(factors_query))
+        if create_index:
+            connection.execute(text(create_index))
+
+
+def drop_factor_tables(connection, table_name="crash_data"):
+    """
+    Drops the factor table of a crash table and its value dictionary
+    """
+    connection.execute(text(f"DROP TABLE IF EXISTS {factor_table(table_name)}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {factor_values_table(table_name)}"))
+
+
+def factors_exist(connection, table_name="crash_data"):
+    return inspect(connection).has_table(factor_table(table_name))
+
+
+def split_factors(data):
+    """
+    Splits the slot columns off cleaned crash rows into long (COLLISION_ID, KIND, SLOT, VALUE) rows,
+    empty slots are dropped
+    :param data: Cleaned crash rows, with or without slot columns
+    :return : returns the crash rows without the slot columns and the long factor rows
+    """
+    parts = []
+    slot_columns = []
+    for kind in FACTOR_KINDS:
+        columns = _slot_columns(data, kind)
+        if not columns:
+            continue
+        slot_columns.extend(columns)
+        long = data[["COLLISION_ID", *columns]].melt(id_vars="COLLISION_ID", var_name="SLOT", value_name="VALUE")
+        long["VALUE"] = long["VALUE"].astype(object).str.strip().str.slice(0, 100)
+        long = long[long["VALUE"].notna() & (long["VALUE"] != "")]
+        long["SLOT"] = long["SLOT"].map(columns).astype("int8")
+        long.insert(1, "KIND", kind)
+        parts.append(long)
+    if not parts:
+        return data, pd.DataFrame(columns=["COLLISION_ID", "KIND", "SLOT", "VALUE"])
+    return data.drop(columns=slot_columns), pd.concat(parts, ignore_index=True)
+
+
+def write_factors(connection, factors, table_name="crash_data"):
+    """
+    Adds long factor rows to the factor table, new values are added to the dictionary first.
+    Call it in the transaction that writes the crash rows.
+    :param connection: A SQLAlchemy connection inside a transaction
+    :param factors: Long rows from split_factors
+    :param table_name: The crash table
+    """
+    if factors.empty:
+        return
+    placeholder = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+    insert_ignore = "INSERT IGNORE" if connection.dialect.name == "mysql" else "INSERT OR IGNORE"
+    values_table = factor_values_table(table_name)
+    new_values = factors[["KIND", "VALUE"]].drop_duplicates()
+    connection.exec_driver_sql(f"{insert_ignore} INTO {values_table} (KIND, VALUE) "
+                               f"VALUES ({placeholder}, {placeholder})",
+                               list(new_values.itertuples(index=False, name=None)))
+
+    # The dictionary holds a few hundred values, read it whole and encode the rows in memory
+    dictionary = pd.read_sql(text(f"SELECT VALUE_ID, KIND, VALUE FROM {values_table}"), connection)
+    encoded = factors.merge(dictionary, on=["KIND", "VALUE"], how="inner")
+    rows = list(encoded[["COLLISION_ID", "KIND", "SLOT", "VALUE_ID"]].astype(object)
+                .itertuples(index=False, name=None))
+    values = ", ".join([placeholder] * 4)
+    connection.exec_driver_sql(f"INSERT INTO {factor_table(table_name)} (COLLISION_ID, KIND, SLOT, VALUE_ID) "
+                               f"VALUES ({values})", rows)
+
+
+def delete_factors(connection, keys, table_name="crash_data", batch_size=1000):
+    """
+    Deletes the factor rows of the given collision ids
+    """
+    delete = text(f"DELETE FROM {factor_table(table_name)} WHERE COLLISION_ID IN :keys").bindparams(
+        bindparam("keys", expanding=True))
+    keys = [int(key) for key in keys]
+    for start in range(0, len(keys), batch_size):
+        connection.execute(delete, {"keys": keys[start:start + batch_size]})
+
+
+def factors_empty(engine, table_name="crash_data"):
+    """
+    True when the crash table has rows but its factor table has none, e.g. a table loaded before the
+    factor table existed
+    """
+    with engine.connect() as connection:
+        if not factors_exist(connection, table_name):
+            return False
+        has_factors = connection.execute(text(f"SELECT 1 FROM {factor_table(table_name)} LIMIT 1")).first()
+        has_crashes = connection.execute(text(f"SELECT 1 FROM {table_name} LIMIT 1")).first()
+    return has_factors is None and has_crashes is not None
+
+
+def replace_factors(engine, data, table_name="crash_data"):
+    """
+    Rewrites the factor rows of the crashes in data, used to backfill tables loaded without factors
+    :param engine: The SQLAlchemy engine object
+    :param data: Cleaned crash rows with their slot columns
+    :param table_name: The crash table
+    """
+    _, factors = split_factors(data)
+    with engine.begin() as connection:
+        # Only crashes that are in the crash table get factor rows
+        keys = [int(key) for key in data["COLLISION_ID"]]
+        lookup = text(f"SELECT COLLISION_ID FROM {table_name} WHERE COLLISION_ID IN :keys").bindparams(
+            bindparam("keys", expanding=True))
+        stored = set()
+        for start in range(0, len(keys), 1000):
+            stored.update(connection.execute(lookup, {"keys": keys[start:start + 1000]}).scalars())
+        delete_factors(connection, stored, table_name)
+        write_factors(connection, factors[factors["COLLISION_ID"].isin(stored)], table_name)
+    mark_table_written(engine, table_name)
+
+
+def top_per_group(counts, group_by, k):
+    """
+    Keeps the k largest counts of every group
+    """
+    counts = counts.sort_values(group_by + ["COUNT", "VALUE"], ascending=[True] * len(group_by) + [False, True])
+    if group_by:
+        counts = counts.groupby(group_by, sort=False, observed=True).head(k)
+    else:
+        counts = counts.head(k)
+    return counts.reset_index(drop=True)
+
+
+def count_factors(data, kind="FACTOR", k=10, group_by=None, include_unspecified=False):
+    """
+    Counts the values of the five slot columns of a kind in one vectorised pass, empty slots are not counted
+    :param data: Crash rows with slot columns, cleaned or raw csv names
+    :param kind: FACTOR for the contributing factors, VEHICLE for the vehicle type codes
+    :param k: Number of values to keep per group
+    :param group_by: Columns of data to count separately, e.g. ['BOROUGH']
+    :param include_unspecified: Also count 'Unspecified'
+    :return : returns the k most frequent values per group with their COUNT
+    """
+    group_by = list(group_by or [])
+    columns = list(_slot_columns(data, kind))
+    long = data[group_by + columns].melt(id_vars=group_by, value_name="VALUE")
+    long["VALUE"] = long["VALUE"].astype(object).str.strip()
+    keep = long["VALUE"].notna() & (long["VALUE"] != "")
+    if not include_unspecified:
+        keep &= long["VALUE"] != UNSPECIFIED
+    counts = long[keep].groupby(group_by + ["VALUE"], observed=True).size().rename("COUNT").reset_index()
+    return top_per_group(counts, group_by, k)
+
@@ -0,0 +1,193 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import folium  # package to generate interactive heatmaps.
+from folium.plugins import HeatMap  # package to create heatmaps
+from db_operations import build_crash_filters, make_statement
+from result_cache import cached_read_sql
+
+# Cells are square blocks of Web Mercator pixels, so one level of zoom halves the cell size and the
+# cells of a zoom level are the cells of the next level merged by two in both directions
+TILE_PX = 256
+DEFAULT_ZOOM = 15  # About 25 m cells over New York with the default cell size
+DEFAULT_CELL_PX = 8
+
+# Step of the degree grid the database pre-aggregates on, about 10 m
+SQL_STEP_DEGREES = 1e-4
+
+NYC_LOCATION = [40.7128, -74.0060]
+
+
+def _cells_across(zoom, cell_px):
+    return TILE_PX * 2 ** zoom // cell_px
+
+
+def cell_index(lat, lon, zoom=DEFAULT_ZOOM, cell_px=DEFAULT_CELL_PX):
+    """
+    Web Mercator cell of every point
+    :param lat: Latitudes in degrees
+    :param lon: Longitudes in degrees
+    :param zoom: Zoom level of the grid
+    :param cell_px: Cell size in pixels at that zoom level
+    :return : returns the column and row of every point's cell
+    """
+    cells = _cells_across(zoom, cell_px)
+    lat = np.radians(np.clip(np.asarray(lat, dtype="float64"), -85.05, 85.05))
+    x = (np.asarray(lon, dtype="float64") + 180) / 360 * cells
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * cells
+    return np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+
+
+def cell_centre(x, y, zoom=DEFAULT_ZOOM, cell_px=DEFAULT_CELL_PX):
+    """
+    Latitude and longitude of the centre of Web Mercator cells, the inverse of cell_index
+    """
+    cells = _cells_across(zoom, cell_px)
+    lon = (np.asarray(x) + 0.5) / cells * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (np.asarray(y) + 0.5) / cells))))
+    return lat, lon
+
+
+def _sum_cells(x, y, weights, groups, zoom, cell_px):
+    """
+    Sums the weights of every (group, cell) and returns one row per occupied cell
+    """
+    cells = pd.DataFrame({"GROUP": groups, "X": x, "Y": y, "WEIGHT": weights})
+    cells = cells.groupby(["GROUP", "X", "Y"], sort=False, observed=True)["WEIGHT"].sum().reset_index()
+    cells["LATITUDE"], cells["LONGITUDE"] = cell_centre(cells["X"], cells["Y"], zoom, cell_px)
+    cells.attrs.update(zoom=zoom, cell_px=cell_px)
+    return cells
+
+
+def bin_points(data, weight_column=None, group_column=None, zoom=DEFAULT_ZOOM, cell_px=DEFAULT_CELL_PX):
+    """
+    Bins crashes into a fixed Web Mercator grid, the number of cells only depends on the area covered
+    and the resolution, not on the number of crashes
+    :param data: Crashes with LATITUDE and LONGITUDE
+    :param weight_column: Column to sum per cell, e.g. NUMBER OF INJURED, every crash counts 1 when None
+    :param group_column: Bin every value of this column separately, e.g. ZIP CODE or ON STREET NAME
+    :param zoom: Zoom level of the grid
+    :param cell_px: Cell size in pixels at that zoom level
+    :return : returns one row per occupied cell with GROUP, X, Y, WEIGHT and the cell centre
+    """
+    data = data.dropna(subset=["LATITUDE", "LONGITUDE"] + ([group_column] if group_column else []))
+    x, y = cell_index(data["LATITUDE"], data["LONGITUDE"], zoom, cell_px)
+    weights = (np.ones(len(data)) if weight_column is None
+               else data[weight_column].to_numpy(dtype="float64", na_value=0))
+    groups = np.zeros(len(data), dtype=np.int8) if group_column is None else data[group_column].to_numpy()
+    return _sum_cells(x, y, weights, groups, zoom, cell_px)
+
+
+def bin_points_sql(engine, table_name="crash_data", measure="CRASHES", group_column=None, borough=None,
+                   start_date=None, end_date=None, zip_code=None, zoom=DEFAULT_ZOOM, cell_px=DEFAULT_CELL_PX,
+                   step=SQL_STEP_DEGREES):
+    """
+    Same as bin_points, but the database first counts the crashes on a fine degree grid so only the
+    occupied cells leave the database, they are then rebinned on the Mercator grid
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param measure: CRASHES, or a column to sum such as NUMBER_OF_INJURED
+    :param group_column: Bin every BOROUGH or ZIP_CODE separately
+    :param borough: A borough or a list of boroughs
+    :param start_date: Keep crashes on or after this date
+    :param end_date: Keep crashes before this date (exclusive)
+    :param zip_code: A zip code or a list of zip codes
+    :param step: Step of the degree grid in the database, finer than the Mercator cells
+    :return : returns one row per occupied cell with GROUP, X, Y, WEIGHT and the cell centre
+    """
+    weight = "COUNT(*)" if measure == "CRASHES" else f"COALESCE(SUM({measure}), 0)"
+    group = f"{group_column}, " if group_column else ""
+    query = (f"SELECT {group}ROUND(LATITUDE / {step}) AS LAT_STEP, ROUND(LONGITUDE / {step}) AS LON_STEP, "
+             f"{weight} AS WEIGHT FROM {table_name}")
+    conditions, params, expanding = build_crash_filters(borough, start_date, end_date, zip_code)
+    conditions.append("LATITUDE IS NOT NULL AND LONGITUDE IS NOT NULL")
+    if group_column:
+        conditions.append(f"{group_column} IS NOT NULL")
+    statement = make_statement(query, conditions, expanding, f" GROUP BY {group}LAT_STEP, LON_STEP")
+    fine = cached_read_sql(engine, statement, params, table_name)
+
+    x, y = cell_index(fine["LAT_STEP"] * step, fine["LON_STEP"] * step, zoom, cell_px)
+    groups = np.zeros(len(fine), dtype=np.int8) if group_column is None else fine[group_column].to_numpy()
+    return _sum_cells(x, y, fine["WEIGHT"].to_numpy(dtype="float64"), groups, zoom, cell_px)
+
+
+def tile_pyramid(cells, min_zoom=10):
+    """
+    Coarser levels of a binned grid, each level merges the cells of the level above by two in both
+    directions
+    :param cells: Output of bin_points or bin_points_sql
+    :param min_zoom: Coarsest zoom level
+    :return : returns a dict of cells keyed by zoom level, from min_zoom to the zoom of cells
+    """
+    zoom, cell_px = cells.attrs["zoom"], cells.attrs["cell_px"]
+    levels = {zoom: cells}
+    for level in range(zoom - 1, min_zoom - 1, -1):
+        finer = levels[level + 1]
+        levels[level] = _sum_cells(finer["X"].to_numpy() // 2, finer["Y"].to_numpy() // 2,
+                                   finer["WEIGHT"].to_numpy(), finer["GROUP"].to_numpy(), level, cell_px)
+    return levels
+
+
+def write_tile_pyramid(cells, directory, min_zoom=10):
+    """
+    Writes the pyramid of a binned grid as {zoom}/{x}/{y}.json tiles of [latitude, longitude, weight]
+    cells, the layout map clients use to fetch only the tiles in view
+    :param cells: Output of bin_points or bin_points_sql, for a single group
+    :param directory: Output directory
+    :param min_zoom: Coarsest zoom level
+    :return : returns the number of tiles written
+    """
+    written = 0
+    for zoom, level in tile_pyramid(cells, min_zoom).items():
+        cells_per_tile = TILE_PX // level.attrs["cell_px"]
+        tiles = level.assign(TILE_X=level["X"] // cells_per_tile, TILE_Y=level["Y"] // cells_per_tile)
+        for (tile_x, tile_y), tile in tiles.groupby(["TILE_X", "TILE_Y"]):
+            tile_directory = os.path.join(directory, str(zoom), str(tile_x))
+            os.makedirs(tile_directory, exist_ok=True)
+            with open(os.path.join(tile_directory, f"{tile_y}.json"), "w") as file:
+                json.dump(tile[["LATITUDE", "LONGITUDE", "WEIGHT"]].round(6).values.tolist(), file)
+            written += 1
+    return written
+
+
+def save_heatmap(cells, path, location=None, zoom_start=10, radius=10):
+    """
+    Saves a folium heatmap of binned cells, the HTML holds one weighted point per cell
+    :param cells: Output of bin_points or bin_points_sql, for a single group
+    :param path: HTML file to write
+    :param location: Map centre, New York when None
+    :return : returns the folium map
+    """
+    heat_map = folium.Map(location=location or NYC_LOCATION, zoom_start=zoom_start)
+    heat_data = cells[["LATITUDE", "LONGITUDE", "WEIGHT"]].round(6).values.tolist()
+    # leaflet.heat saturates at a weight of 1 by default, the busiest cell is the top of the scale instead
+    top = float(cells["WEIGHT"].max()) if len(cells) else 1.0
+    HeatMap(heat_data, radius=radius, max=top).add_to(heat_map)
+    heat_map.save(path)
+    return heat_map
+
+
+def bulk_heatmaps(data, group_column, directory=".", prefix="", groups=None, weight_column=None,
+                  zoom=DEFAULT_ZOOM, cell_px=DEFAULT_CELL_PX, **map_kwargs):
+    """
+    Saves one heatmap per zip code, street, borough or any other column value, all groups are binned
+    in a single pass
+    :param data: Crashes with LATITUDE, LONGITUDE and group_column
+    :param group_column: Column to make one map per value of
+    :param directory: Output directory
+    :param prefix: File name prefix, the files are named {prefix}{value}_heatmap.html
+    :param groups: Values to map, every value when None
+    :param weight_column: Column to sum per cell, crashes are counted when None
+    :return : returns a dict of file paths keyed by group value
+    """
+    if groups is not None:
+        data = data[data[group_column].isin(groups)]
+    cells = bin_points(data, weight_column, group_column, zoom, cell_px)
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for group, group_cells in cells.groupby("GROUP", sort=False):
+        name = "".join(char if char.isalnum() else "_" for char in str(group))
+        paths[group] = os.path.join(directory, f"{prefix}{name}_heatmap.html")
+        save_heatmap(group_cells, paths[group], **map_kwargs)
+    return paths
@@ -0,0 +1,168 @@
+import contextlib
+import cProfile
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+# JSON lines file the spans are appended to, '-' for stderr, spans are not measured when unset
+SPANS_PATH = os.environ.get("CRASH_SPANS")
+
+# Stages to run under cProfile, comma separated, '*' for all of them
+PROFILE_STAGES = {stage for stage in os.environ.get("CRASH_PROFILE", "").split(",") if stage}
+PROFILE_DIR = os.environ.get("CRASH_PROFILE_DIR", "profiles")
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(spans_path=None, profile_stages=None, profile_dir=None):
+    """
+    Sets where spans go and which stages are profiled, overriding the environment variables
+    :param spans_path: JSON lines file, '-' for stderr, None to stop measuring
+    :param profile_stages: Iterable of stage names to profile, '*' for all of them
+    :param profile_dir: Directory of the .prof files
+    """
+    global SPANS_PATH, PROFILE_STAGES, PROFILE_DIR
+    SPANS_PATH = spans_path
+    if profile_stages is not None:
+        PROFILE_STAGES = {profile_stages} if isinstance(profile_stages, str) else set(profile_stages)
+    if profile_dir is not None:
+        PROFILE_DIR = profile_dir
+
+
+def peak_memory_mb(children=False):
+    """
+    Returns the peak resident memory of the current process in MB, or None when it can't be measured
+    :param children: Measure the largest finished child process (e.g. a pool worker) instead
+    """
+    try:
+        import resource
+    except ImportError:
+        # resource is not available on Windows, fall back to psutil if it is installed
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return None if children else psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def frame_bytes(data):
+    """
+    In-memory size of a DataFrame's columns, without inspecting the objects of object columns
+    """
+    return int(data.memory_usage(index=False, deep=False).sum())
+
+
+def current_span_id():
+    """
+    Id of the innermost open span of the calling thread, None when there is none
+    """
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+@contextlib.contextmanager
+def parent_span(span_id):
+    """
+    Makes the spans opened inside children of span_id, for work handed to another thread
+    :param span_id: Id from current_span_id() in the thread that handed the work over
+    """
+    stack = _local.__dict__.setdefault("stack", [])
+    if span_id is None:
+        yield
+        return
+    stack.append(span_id)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+class Span:
+    """
+    Fields of one stage run, set them with set(). Disabled spans ignore them.
+    """
+
+    def __init__(self, stage, enabled, fields):
+        self.stage = stage
+        self.enabled = enabled
+        self.fields = fields
+
+    def set(self, **fields):
+        if self.enabled:
+            self.fields.update(fields)
+
+
+def _emit(record):
+    line = json.dumps(record, default=str)
+    with _lock:
+        if SPANS_PATH == "-":
+            print(line, file=sys.stderr)
+        else:
+            with open(SPANS_PATH, "a") as file:
+                file.write(line + "\n")
+
+
+@contextlib.contextmanager
+def span(stage, **fields):
+    """
+    Measures a pipeline stage and emits it as one JSON line: wall and CPU time (of the calling
+    thread), the growth of the process' peak memory, the parent span, and the fields given here or
+    with Span.set, such as rows_in, rows_out and bytes. An exception is recorded and raised again,
+    errors a stage handles itself can be recorded with Span.set(error=...).
+    :param stage: Name of the stage, e.g. push_data_to_db
+    :param fields: Initial fields of the span
+    :return : yields the Span
+    """
+    if SPANS_PATH is None:
+        yield Span(stage, False, fields)
+        return
+
+    stack = _local.__dict__.setdefault("stack", [])
+    span_id = f"{os.getpid()}-{next(_ids)}"
+    current = Span(stage, True, dict(fields))
+    profiler = None
+    if (stage in PROFILE_STAGES or "*" in PROFILE_STAGES) and not getattr(_local, "profiling", False):
+        profiler = cProfile.Profile()
+        _local.profiling = True
+
+    parent = stack[-1] if stack else None
+    stack.append(span_id)
+    started = time.time()
+    peak_before = peak_memory_mb()
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield current
+    except BaseException as e:
+        current.fields.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _local.profiling = False
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        peak_after = peak_memory_mb()
+        stack.pop()
+        record = {"stage": stage, "span_id": span_id, "parent_id": parent, "pid": os.getpid(),
+                  "thread": threading.current_thread().name, "start": started, "wall_s": round(wall, 6),
+                  "cpu_s": round(cpu, 6),
+                  "peak_memory_delta_mb": None if peak_before is None else round(peak_after - peak_before, 3),
+                  "status": "error" if "error" in current.fields else "ok", **current.fields}
+        if profiler is not None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            record["profile"] = os.path.join(PROFILE_DIR, f"{stage}-{span_id}.prof")
+            profiler.dump_stats(record["profile"])
+        _emit(record)
+
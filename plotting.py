@@ -0,0 +1,66 @@
+import os
+import re
+import matplotlib
+import matplotlib.pyplot as plt
+
+# When set, charts are written to this directory instead of being shown, see set_report_dir
+REPORT_DIR = os.environ.get("CRASH_REPORT_DIR")
+
+# Files written by finish_figure and finish_file since the last reset, the report uses it to know what a chart produced
+saved_figures = []
+
+
+def set_report_dir(directory):
+    """
+    Switches to report mode: a non-interactive backend, and every chart is saved to directory
+    :param directory: Output directory, None to go back to showing the charts
+    """
+    global REPORT_DIR
+    REPORT_DIR = directory
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        plt.switch_backend("Agg")
+
+
+def figure_file(name):
+    """
+    File name of a chart in the report directory
+    """
+    return re.sub(r"[^\w.-]+", "_", str(name)).strip("_") + ".png"
+
+
+def report_file(file_name):
+    """
+    Path of a file a chart writes itself, like an HTML map: in the report directory in report mode,
+    in the current directory otherwise
+    """
+    return file_name if REPORT_DIR is None else os.path.join(REPORT_DIR, file_name)
+
+
+def finish_file(path):
+    """
+    Ends a file a chart wrote itself, in report mode it is recorded with the figures so the report
+    checks it is still there
+    """
+    if REPORT_DIR is not None:
+        saved_figures.append(path)
+
+
+def finish_figure(name, dpi=100):
+    """
+    Ends a chart: shows it, or in report mode saves it as <name>.png and closes it
+    :param name: Chart name, unique within a report
+    :return : returns the saved file path in report mode, None otherwise
+    """
+    if REPORT_DIR is None:
+        plt.show()
+        return None
+    path = os.path.join(REPORT_DIR, figure_file(name))
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close("all")
+    saved_figures.append(path)
+    return path
+
+
+if REPORT_DIR is not None:
+    matplotlib.use("Agg")
@@ -1,62 +1,272 @@
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
-from db_operations import create_connection, drop_table_if_exists, create_table_if_not_exists, push_data_to_db
+from cleaning import clean_collisions
+from dtype_utils import optimize_dtypes
+from instrumentation import frame_bytes, peak_memory_mb, span
+from factors import RAW_FACTOR_COLUMNS, factors_empty, replace_factors
+from db_operations import create_connection, drop_table_if_exists, create_table_if_not_exists, push_data_to_db, \
+    read_watermark, refresh_watermark, upsert_data_to_db
+from rollups import rebuild_rollups, rollups_empty
+from schema import delete_legacy_rows, migrate_crash_table
 
 
 def data_preprocessing(data):
     """
     This function takes raw_data as input and performs data cleaning according to the project requirements
-    and also calculates some attributes.
-    :param data: The raw data that is read from the csv file
-    :return : returns the cleaned data
-    """
-    data["CRASH DATE"] = pd.to_datetime(data["CRASH DATE"]+ " " +data["CRASH TIME"])
-    data = data.drop(data[data["LATITUDE"].isna()].index)
-    data = data.drop(data[data["LATITUDE"] == 0].index)
-    data = data.drop(data[data["ZIP CODE"].isna()].index)
-    data["NUMBER OF KILLS"] = data['NUMBER OF PERSONS KILLED'] + \
-                              data['NUMBER OF CYCLIST KILLED'] + \
-                              data['NUMBER OF PEDESTRIANS KILLED'] \
-                              + data['NUMBER OF MOTORIST KILLED']
-
-    data["NUMBER OF INJURED"] = data["NUMBER OF PERSONS INJURED"] + \
-                                data['NUMBER OF PEDESTRIANS INJURED'] + \
-                                data['NUMBER OF MOTORIST INJURED'] \
-                                + data['NUMBER OF CYCLIST INJURED']
-
-    data['NUMBER OF CASUALTIES'] = data["NUMBER OF KILLS"] + data["NUMBER OF INJURED"]
-    columns_to_keep = ['CRASH DATE', 'LATITUDE', 'LONGITUDE', 'ZIP CODE',
+    and also calculates some attributes. The rules are declared in cleaning.py.
+    :param data: The raw data that is read from the csv file, it is not modified
+    :return : returns the cleaned data, with memory-optimised dtypes, the number of rows dropped by
+              every rule is in its attrs["rejected"]
+    """
+    with span("data_preprocessing", rows_in=len(data), bytes_in=frame_bytes(data)) as stage:
+        data, rejected = _clean(data)
+        stage.set(rows_out=len(data), bytes_out=frame_bytes(data), rejected=rejected)
+    data.attrs["rejected"] = rejected
+    return data
+
+
+def _clean(data):
+    """
+    The cleaning steps of data_preprocessing
+    :return : returns the cleaned data with the SQL column names and the rejected-row counts
+    """
+    # The contributing factor and vehicle type slots are kept for the factor table
+    factor_columns = [column for column in RAW_FACTOR_COLUMNS if column in data.columns]
+    columns_to_keep = ['COLLISION_ID', 'CRASH DATE', 'LATITUDE', 'LONGITUDE', 'ZIP CODE',
                        'NUMBER OF KILLS', 'NUMBER OF INJURED', 'NUMBER OF CASUALTIES', 'BOROUGH']
 
-    data = data[columns_to_keep]
+    data, rejected = clean_collisions(data, columns_to_keep + factor_columns)
+    data = data[columns_to_keep + factor_columns]
     # Rename columns to match SQL table
-    data.columns = ['CRASH_DATE', 'LATITUDE', 'LONGITUDE', 'ZIP_CODE',
-                    'NUMBER_OF_KILLS', 'NUMBER_OF_INJURED', 'NUMBER_OF_CASUALTIES', 'BOROUGH']
-    return data
+    data.columns = ['COLLISION_ID', 'CRASH_DATE', 'LATITUDE', 'LONGITUDE', 'ZIP_CODE',
+                    'NUMBER_OF_KILLS', 'NUMBER_OF_INJURED', 'NUMBER_OF_CASUALTIES', 'BOROUGH'] + \
+                   [RAW_FACTOR_COLUMNS[column] for column in factor_columns]
+    return optimize_dtypes(data), rejected
 
 
-if __name__ == "__main__":
+# Columns read from the csv file and their dtypes, declaring them up front avoids
+# the mixed type inference that made us read the whole file with low_memory=False
+RAW_DTYPES = {
+    "COLLISION_ID": "int64",
+    "CRASH DATE": str,
+    "CRASH TIME": str,
+    "BOROUGH": str,
+    "ZIP CODE": str,
+    "LATITUDE": "float64",
+    "LONGITUDE": "float64",
+    "NUMBER OF PERSONS INJURED": "float32",
+    "NUMBER OF PERSONS KILLED": "float32",
+    "NUMBER OF PEDESTRIANS INJURED": "float32",
+    "NUMBER OF PEDESTRIANS KILLED": "float32",
+    "NUMBER OF CYCLIST INJURED": "float32",
+    "NUMBER OF CYCLIST KILLED": "float32",
+    "NUMBER OF MOTORIST INJURED": "float32",
+    "NUMBER OF MOTORIST KILLED": "float32",
+    **{column: "category" for column in RAW_FACTOR_COLUMNS},
+}
+
+
+def read_csv_chunks(csv_path, chunk_size=100000):
+    """
+    Reads the csv file lazily in chunks with the declared dtypes
+    :param csv_path: Path of the Vehicle_Collisions csv file
+    :param chunk_size: Number of raw rows per chunk
+    :return : returns an iterator over the raw chunks
+    """
+    return pd.read_csv(csv_path, usecols=list(RAW_DTYPES), dtype=RAW_DTYPES, chunksize=chunk_size)
+
+
+def _report_ingest(rows_read, rows_pushed, start_time, children=False, pushed_label="after cleaning",
+                   rejected=None):
+    """
+    Prints the throughput and the peak memory of an ingest run, and the rows dropped by every cleaning rule
+    """
+    elapsed = time.perf_counter() - start_time
+    rows_per_sec = rows_read / elapsed if elapsed > 0 else float("inf")
+    peaks = [("", peak_memory_mb())]
+    if children:
+        peaks.append((" per worker", peak_memory_mb(children=True)))
+    peak_text = ", ".join(f"peak memory{label} {peak:.0f} MB" if peak is not None else f"peak memory{label} unavailable"
+                          for label, peak in peaks)
+    print(f"Ingested {rows_read} rows ({rows_pushed} {pushed_label}) in {elapsed:.1f}s, "
+          f"{rows_per_sec:.0f} rows/sec, {peak_text}")
+    if rejected:
+        print("Dropped by cleaning: " + ", ".join(f"{rule} {count}" for rule, count in rejected.items()))
+
+
+def stream_csv_to_db(csv_path, engine, table_name="crash_data", chunk_size=100000, bulk=True):
+    """
+    Reads the csv file in chunks, cleans every chunk with data_preprocessing and pushes it
+    straight to the database, so the peak memory depends on the chunk size and not on the file size.
+    Prints the throughput and the peak memory at the end.
+    :param csv_path: Path of the Vehicle_Collisions csv file
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param chunk_size: Number of raw rows per chunk
+    :param bulk: Push the chunks with the bulk loader instead of DataFrame.to_sql
+    :return : returns the number of cleaned rows pushed to the database, a chunk that can't be written
+              stops the load with its error
+    """
+    start_time = time.perf_counter()
+    rows_read = 0
+    rows_pushed = 0
+    rejected = Counter()
+    for chunk in read_csv_chunks(csv_path, chunk_size):
+        rows_read += len(chunk)
+        cleaned_chunk = data_preprocessing(chunk)
+        rejected.update(cleaned_chunk.attrs["rejected"])
+        push_data_to_db(cleaned_chunk, engine, table_name, bulk)
+        rows_pushed += len(cleaned_chunk)
+
+    _report_ingest(rows_read, rows_pushed, start_time, rejected=rejected)
+    return rows_pushed
+
+
+def _write_cleaned_chunk(cleaned_future, engine, table_name, bulk, slots, failed):
+    """
+    Waits for a chunk to be cleaned by the process pool and pushes it through its own connection,
+    then frees the chunk's slot so the reader can go on. A failure sets failed and is raised again.
+    :return : returns the number of rows pushed and the rows dropped by every cleaning rule
+    """
     try:
-        # Assuming 'data' is loaded from a CSV file for the initial run
-        raw_data = pd.read_csv(r"C:\Users\nika\Desktop\final exam q3\Vehicle_Collisions.csv", low_memory=False)
-        cleaned_data = data_preprocessing(raw_data)
+        cleaned_chunk = cleaned_future.result()
+        push_data_to_db(cleaned_chunk, engine, table_name, bulk, rollups=False)
+        return len(cleaned_chunk), cleaned_chunk.attrs["rejected"]
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        slots.release()
+
+
+def parallel_csv_to_db(csv_path, engine, table_name="crash_data", chunk_size=100000,
+                       workers=None, writers=2, max_pending=None, bulk=True):
+    """
+    Pipelined version of stream_csv_to_db. The csv chunks are cleaned by a pool of worker processes
+    while a small pool of writer threads pushes finished chunks concurrently, each through its own
+    pooled connection. At most max_pending chunks are in flight, which keeps the memory bounded.
+    The rollups are rebuilt once all the chunks are in instead of being updated by every writer.
+    :param csv_path: Path of the Vehicle_Collisions csv file
+    :param engine: The SQLAlchemy engine object, its pool should have at least `writers` connections
+    :param table_name: The table name
+    :param chunk_size: Number of raw rows per chunk
+    :param workers: Number of processes running data_preprocessing, defaults to the number of cores
+    :param writers: Number of concurrent writer connections
+    :param max_pending: Maximum number of chunks read but not yet written, defaults to 2 * (workers + writers)
+    :param bulk: Push the chunks with the bulk loader instead of DataFrame.to_sql
+    :return : returns the number of cleaned rows pushed to the database. When a chunk can't be cleaned
+              or written no more chunks are read and the first error is raised once the chunks in
+              flight are done.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * (workers + writers)
+    slots = threading.BoundedSemaphore(max_pending)
+    failed = threading.Event()
+    start_time = time.perf_counter()
+    rows_read = 0
+    write_futures = []
+    with ProcessPoolExecutor(max_workers=workers) as cleaners, ThreadPoolExecutor(max_workers=writers) as writer_pool:
+        for chunk in read_csv_chunks(csv_path, chunk_size):
+            slots.acquire()  # Blocks the reader while max_pending chunks are in flight
+            if failed.is_set():
+                slots.release()
+                break
+            rows_read += len(chunk)
+            cleaned_future = cleaners.submit(data_preprocessing, chunk)
+            write_futures.append(writer_pool.submit(_write_cleaned_chunk, cleaned_future, engine,
+                                                    table_name, bulk, slots, failed))
+        rows_pushed = 0
+        rejected = Counter()
+        for future in write_futures:
+            pushed, chunk_rejected = future.result()
+            rows_pushed += pushed
+            rejected.update(chunk_rejected)
 
-        # MySQL database connection details
-        host_name = "localhost"
-        user_name = "root"
-        user_password = "nc8121"
-        db_name = "nyc_crash_data"
+    # The writers all add to the same daily and hourly rows, they are summed once from the loaded table
+    rebuild_rollups(engine, table_name)
+    _report_ingest(rows_read, rows_pushed, start_time, children=True, rejected=rejected)
+    return rows_pushed
+
+
+def incremental_csv_to_db(csv_path, engine, table_name="crash_data", chunk_size=100000, lookback_days=7):
+    """
+    Loads only what changed since the last run instead of dropping and reloading the table.
+    A row is a candidate when its collision id is above the watermark (new crashes, including late
+    reports of old dates) or its crash date falls within lookback_days of the watermark (recent records
+    the city may still correct). Candidates identical to the stored rows are skipped.
+    :param csv_path: Path of the Vehicle_Collisions csv file
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param chunk_size: Number of raw rows per chunk
+    :param lookback_days: How many days before the watermark are checked for corrections
+    :return : returns the number of rows written
+    """
+    watermark = read_watermark(engine, table_name)
+    if watermark is None:
+        # First load, rows carried over from a table without collision ids are in the file again,
+        # and the rollups may predate the rows already in the table
+        delete_legacy_rows(engine, table_name)
+        rebuild_rollups(engine, table_name)
+    elif rollups_empty(engine, table_name):
+        # Tables loaded before the rollups existed have a watermark but empty rollups, they are
+        # filled before this run's writes update them
+        rebuild_rollups(engine, table_name)
+    # Tables loaded before the factor table existed get their factors from this run
+    backfill_factors = factors_empty(engine, table_name)
+    start_time = time.perf_counter()
+    rows_read = 0
+    rows_written = 0
+    rejected = Counter()
+    for chunk in read_csv_chunks(csv_path, chunk_size):
+        rows_read += len(chunk)
+        cleaned_chunk = data_preprocessing(chunk)
+        rejected.update(cleaned_chunk.attrs["rejected"])
+        all_rows = cleaned_chunk
+        if watermark is not None:
+            max_crash_date, max_collision_id = watermark
+            cutoff = max_crash_date.normalize() - pd.Timedelta(days=lookback_days)
+            is_candidate = (cleaned_chunk["COLLISION_ID"] > max_collision_id) | (cleaned_chunk["CRASH_DATE"] >= cutoff)
+            cleaned_chunk = cleaned_chunk[is_candidate]
+        if not cleaned_chunk.empty:
+            rows_written += upsert_data_to_db(cleaned_chunk, engine, table_name)
+        if backfill_factors:
+            replace_factors(engine, all_rows, table_name)
+
+    refresh_watermark(engine, table_name)
+    _report_ingest(rows_read, rows_written, start_time, pushed_label="written", rejected=rejected)
+    return rows_written
+
+
+if __name__ == "__main__":
+    try:
+        # The csv file is streamed in chunks so the whole file never has to fit in memory
+        csv_path = r"C:\Users\nika\Desktop\final exam q3\Vehicle_Collisions.csv"
+        chunk_size = 100000
+        workers = None  # One cleaning process per core
+        writers = 2
+        incremental = True  # Set to False to drop the table and reload the whole history
 
-        # Create a connection to the MySQL database
-        engine = create_connection(host_name, user_name, user_password, db_name)
+        engine = create_connection()
 
-        # Drop the table if it exists
-        drop_table_if_exists(engine, "crash_data")
+        if incremental:
+            # Only new or changed crashes are written, older tables are moved to the compact schema first
+            migrate_crash_table(engine, "crash_data")
+            create_table_if_not_exists(engine, "crash_data")
+            incremental_csv_to_db(csv_path, engine, "crash_data", chunk_size)
+        else:
+            # Drop the table if it exists
+            drop_table_if_exists(engine, "crash_data")
 
-        # Create the table
-        create_table_if_not_exists(engine, "crash_data")
+            # Create the table
+            create_table_if_not_exists(engine, "crash_data")
 
-        # Push cleaned data to the database
-        push_data_to_db(cleaned_data, engine)
+            # Clean the chunks in parallel and push them to the database over several connections
+            parallel_csv_to_db(csv_path, engine, "crash_data", chunk_size, workers, writers)
+            refresh_watermark(engine, "crash_data")
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -1,7 +1,20 @@
 import pandas as pd
 import matplotlib.pyplot as plt # package to plot the graphs
-import folium # package to generate interactive heatmaps.
-from folium.plugins import HeatMap # package to create heatmaps
+import repo_path  # noqa: F401 makes the repository root importable
+from crash_dataset import as_frame, date_part
+from factors import count_factors
+from heat_grid import bin_points, save_heatmap
+from plotting import finish_figure, finish_file, report_file
+from time_series import count_series, max_windows, top_windows
+
+def save_map(cells, file_name):
+    """
+    Saves a heatmap of binned cells next to the charts
+    """
+    path = report_file(file_name)
+    save_heatmap(cells, path)
+    finish_file(path)
+
 
 def zipcode_compare(Q2019, Q2020):
     """
@@ -9,6 +22,7 @@ def zipcode_compare(Q2019, Q2020):
     highest crashes.
 
     """
+    Q2019, Q2020 = as_frame(Q2019), as_frame(Q2020)
     # zip code comparison on 2019 2020 Queens borough
     zipsc19 = Q2019["ZIP CODE"].value_counts()[:10].to_frame(name="Crashes in 2019").reset_index()
     zipsc20 = Q2020["ZIP CODE"].value_counts()[:10].to_frame(name="Crashes in 2020").reset_index()
@@ -18,19 +32,11 @@ def zipcode_compare(Q2019, Q2020):
     plt.title("Zipcode with most crashes in 2019 vs 2020")
     plt.xlabel("Zipcodes")
     plt.ylabel("Number of Crashes")
-    plt.show()
+    finish_figure("zipcode_compare")
 
-    data = Q2019[Q2019["ZIP CODE"] == 11434.0]
-    nyc_map_19 = folium.Map(location=[40.7128, -74.0060], zoom_start=10)
-    heat_data_19 = [[row['LATITUDE'], row['LONGITUDE']] for index, row in data.iterrows()]
-    HeatMap(heat_data_19).add_to(nyc_map_19)
-    nyc_map_19.save('ZIPCODE2019_heatmap.html')  # Save the map as an HTML file
-
-    data = Q2020[Q2020["ZIP CODE"] == 11385.0]
-    nyc_map_20 = folium.Map(location=[40.7128, -74.0060], zoom_start=10)
-    heat_data_20 = [[row['LATITUDE'], row['LONGITUDE']] for index, row in data.iterrows()]
-    HeatMap(heat_data_20).add_to(nyc_map_20)
-    nyc_map_20.save('ZIPCODE2020_heatmap.html')
+    # The maps hold one weighted point per grid cell instead of every crash
+    save_map(bin_points(Q2019[Q2019["ZIP CODE"] == 11434.0]), 'ZIPCODE2019_heatmap.html')
+    save_map(bin_points(Q2020[Q2020["ZIP CODE"] == 11385.0]), 'ZIPCODE2020_heatmap.html')
 
 
 def street_compare(Q2019, Q2020):
@@ -38,6 +44,7 @@ def street_compare(Q2019, Q2020):
     This function takes two dataframes as input and finds value counts for the ON street name and
     plot the bar plot for the top 10 streets
     """
+    Q2019, Q2020 = as_frame(Q2019), as_frame(Q2020)
     # street comparision 2019 2020 Queens borough
     ons_19 = Q2019["ON STREET NAME"].value_counts()[:10].to_frame(name="Crashes in 2019").reset_index()
     ons_20 = Q2020["ON STREET NAME"].value_counts()[:10].to_frame(name="Crashes in 2020").reset_index()
@@ -47,25 +54,15 @@ def street_compare(Q2019, Q2020):
     plt.title("ON Street with most crashes in 2019 vs 2020")
     plt.xlabel("Street names ")
     plt.ylabel("Number of Crashes")
-    plt.show()
-
-    for i, row in ons_19.iterrows():
-        print(row[0])
-        nyc_map_s19 = folium.Map(location=[40.7128, -74.0060], zoom_start=10)
-        d = Q2019[Q2019["ON STREET NAME"] == row[0]]
-        heat_data = [[row['LATITUDE'], row['LONGITUDE']] for index, row in d.iterrows()]
-        HeatMap(heat_data).add_to(nyc_map_s19)
-        nyc_map_s19.save('STREET19_heatmap.html')  # Save the map as an HTML file
-        break
-
-    for i, row in ons_20.iterrows():
-        print(row[0])
-        nyc_map_s20 = folium.Map(location=[40.7128, -74.0060], zoom_start=10)
-        d = Q2020[Q2020["ON STREET NAME"] == row[0]]
-        heat_data = [[row['LATITUDE'], row['LONGITUDE']] for index, row in d.iterrows()]
-        HeatMap(heat_data).add_to(nyc_map_s20)
-        nyc_map_s20.save('STREET20_heatmap.html')  # Save the map as an HTML file
-        break
+    finish_figure("street_compare")
+
+    # Heatmap of the street with the most crashes of each year
+    top_street_19 = ons_19["ON STREET NAME"].iloc[0]
+    top_street_20 = ons_20["ON STREET NAME"].iloc[0]
+    print(top_street_19)
+    save_map(bin_points(Q2019[Q2019["ON STREET NAME"] == top_street_19]), 'STREET19_heatmap.html')
+    print(top_street_20)
+    save_map(bin_points(Q2020[Q2020["ON STREET NAME"] == top_street_20]), 'STREET20_heatmap.html')
 
 
 def analyze_contributing_factors(Q2019, Q2020):
@@ -73,31 +70,12 @@ def analyze_contributing_factors(Q2019, Q2020):
     The function takes two dataframes as inputs and merges the required columns and finds value counts
     and plots the top 10 contributing factors as PIE chart
     """
-    # Concatenate all values in each row into a single string
-    merged_values_all_rows19 = Q2019[
-        ['CONTRIBUTING FACTOR VEHICLE 1', 'CONTRIBUTING FACTOR VEHICLE 2', 'CONTRIBUTING FACTOR VEHICLE 3', \
-         'CONTRIBUTING FACTOR VEHICLE 4', 'CONTRIBUTING FACTOR VEHICLE 5'
-         ]].astype(str).apply('_'.join, axis=1)
-
-    merged_values_all_rows20 = Q2020[
-        ['CONTRIBUTING FACTOR VEHICLE 1', 'CONTRIBUTING FACTOR VEHICLE 2', 'CONTRIBUTING FACTOR VEHICLE 3', \
-         'CONTRIBUTING FACTOR VEHICLE 4', 'CONTRIBUTING FACTOR VEHICLE 5'
-         ]].astype(str).apply('_'.join, axis=1)
-
-    all_values_string19 = '_'.join(merged_values_all_rows19)
-    all_values_string20 = '_'.join(merged_values_all_rows20)
-
-    # Get the total value counts for all values
-    total_value_counts19 = pd.Series(all_values_string19.split('_')).value_counts()[:10].to_frame(
-        name="count of each factor").reset_index()
-    total_value_counts20 = pd.Series(all_values_string20.split('_')).value_counts()[:10].to_frame(
-        name="count of each factor").reset_index()
-
-    total_value_counts19.rename(columns={"index": "Contributing Factor"}, inplace=True)
-    total_value_counts20.rename(columns={"index": "Contributing Factor"}, inplace=True)
-
-    total_value_counts19 = total_value_counts19.drop(total_value_counts19.index[:1])
-    total_value_counts20 = total_value_counts20.drop(total_value_counts20.index[:1])
+    Q2019, Q2020 = as_frame(Q2019), as_frame(Q2020)
+    # Count the values of the five factor columns, empty slots and 'Unspecified' are not counted
+    total_value_counts19 = count_factors(Q2019, "FACTOR", 10).rename(
+        columns={"VALUE": "Contributing Factor", "COUNT": "count of each factor"})
+    total_value_counts20 = count_factors(Q2020, "FACTOR", 10).rename(
+        columns={"VALUE": "Contributing Factor", "COUNT": "count of each factor"})
 
     # total_value_counts.columns
     fig, axs = plt.subplots(1, 2, figsize=(12, 4))
@@ -113,7 +91,7 @@ def analyze_contributing_factors(Q2019, Q2020):
     fig.suptitle("Pie chart for factors for crashes in 2019 and 2020")
     plt.ylabel(None)
     plt.tight_layout()
-    plt.show()
+    finish_figure("contributing_factors")
 
 
 def analyze_vehicle_types(Q2019, Q2020):
@@ -121,29 +99,12 @@ def analyze_vehicle_types(Q2019, Q2020):
     The function takes two dataframes as inputs and merges the required columns and finds value counts
     and plots the top 10 Vehicle types as PIE chart
     """
-    # Concatenate all values in each row into a single string
-    merged_values_all_rows19 = Q2019[['VEHICLE TYPE CODE 1', 'VEHICLE TYPE CODE 2',
-                                      'VEHICLE TYPE CODE 3', 'VEHICLE TYPE CODE 4', 'VEHICLE TYPE CODE 5']].astype(
-        str).apply('_'.join, axis=1)
-
-    merged_values_all_rows20 = Q2020[['VEHICLE TYPE CODE 1', 'VEHICLE TYPE CODE 2',
-                                      'VEHICLE TYPE CODE 3', 'VEHICLE TYPE CODE 4', 'VEHICLE TYPE CODE 5']].astype(
-        str).apply('_'.join, axis=1)
-
-    all_values_string19 = '_'.join(merged_values_all_rows19)
-    all_values_string20 = '_'.join(merged_values_all_rows20)
-
-    # Get the total value counts for all values
-    total_value_counts19 = pd.Series(all_values_string19.split('_')).value_counts()[:10].to_frame(
-        name="count of each vehicle").reset_index()
-    total_value_counts20 = pd.Series(all_values_string20.split('_')).value_counts()[:10].to_frame(
-        name="count of each vehicle").reset_index()
-
-    total_value_counts19.rename(columns={"index": "Vehicle Type"}, inplace=True)
-    total_value_counts20.rename(columns={"index": "Vehicle Type"}, inplace=True)
-
-    total_value_counts19 = total_value_counts19.drop(total_value_counts19.index[0])
-    total_value_counts20 = total_value_counts20.drop(total_value_counts20.index[0])
+    Q2019, Q2020 = as_frame(Q2019), as_frame(Q2020)
+    # Count the values of the five vehicle type columns, empty slots are not counted
+    total_value_counts19 = count_factors(Q2019, "VEHICLE", 10).rename(
+        columns={"VALUE": "Vehicle Type", "COUNT": "count of each vehicle"})
+    total_value_counts20 = count_factors(Q2020, "VEHICLE", 10).rename(
+        columns={"VALUE": "Vehicle Type", "COUNT": "count of each vehicle"})
 
     # total_value_counts.columns
     fig, axs = plt.subplots(1, 2, figsize=(12, 4))
@@ -159,7 +120,7 @@ def analyze_vehicle_types(Q2019, Q2020):
     fig.suptitle("Pie chart Vehicle Types involved in crashes in 2019 and 2020")
     plt.ylabel(None)
     plt.tight_layout()
-    plt.show()
+    finish_figure("vehicle_types")
 
 
 def find_12days_with_most_Accidents(data_2020):
@@ -167,11 +128,12 @@ def find_12days_with_most_Accidents(data_2020):
     This function takes a pandas dataframe as input and finds the top 12 days with most number of crashes and prints them on to the
     output
     """
-    # Count the number of accidents per day
-    daily_accidents_2020 = data_2020["CRASH DATE"].value_counts()
+    data_2020 = as_frame(data_2020)
+    # Count the number of accidents per day, days without accidents included
+    daily_accidents_2020 = count_series(data_2020, "D")
 
     # # Find the 12 days with the most accidents
-    top_12_days = daily_accidents_2020.nlargest(12)
+    top_12_days = top_windows(daily_accidents_2020, k=12).set_index("START")["CRASHES"].rename_axis("CRASH DATE")
 
     print("The 12 days with the \nmost accidents in 2020 are:")
     print(top_12_days)
@@ -182,6 +144,7 @@ def daily_comparision(month_yr1, month_yr2, month, year1, year2):
     This function take two pandas dataframes and month and year values as inputs
     and finds the number of crashes occured per day and group them by date and plots a bar plot
     """
+    month_yr1, month_yr2 = as_frame(month_yr1), as_frame(month_yr2)
     crash_counts_month_yr1 = month_yr1.groupby(month_yr1['CRASH DATE'].dt.date).size()
     crash_counts_month_yr2 = month_yr2.groupby(month_yr2['CRASH DATE'].dt.date).size()
 
@@ -193,7 +156,7 @@ def daily_comparision(month_yr1, month_yr2, month, year1, year2):
     plt.xlabel('Crash Date')
     plt.ylabel('Number of Crashes')
     plt.title(f'Daily Crash Comparison: {month} {year1} vs {month} {year2}')
-    plt.show()
+    finish_figure(f"daily_{month}_{year1}_vs_{year2}")
 
 
 def analyze_day_ofthe_week(data):
@@ -203,19 +166,20 @@ def analyze_day_ofthe_week(data):
     """
     # needs data from jan 2019 to oct 2020
     # Week Crash comparison between 2019 and 2020 (day wise)
-    data['YEAR'] = data['CRASH DATE'].dt.year
-    data['DAY OF WEEK'] = data['CRASH DATE'].dt.day_name()
+    data = as_frame(data)
+    years = date_part(data, 'YEAR')
+    weekdays = date_part(data, 'WEEKDAY')
 
     # Filter data for 2019 and 2020
-    data = data[data['YEAR'].isin([2019, 2020])]
+    in_years = years.isin([2019, 2020])
 
     # Group by year and day of the week
-    daily_crashes = data.groupby(['DAY OF WEEK', 'YEAR']).size().unstack()
+    daily_crashes = years[in_years].groupby([weekdays[in_years], years[in_years]]).size().unstack()
 
-    # Reorder the days for plotting
+    # Reorder the days for plotting, weekday 0 is Monday
     ordered_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    daily_crashes = daily_crashes.reindex(ordered_days)
-    data.head()
+    daily_crashes = daily_crashes.reindex(range(7))
+    daily_crashes.index = ordered_days
 
     # Plot
     daily_crashes.plot(kind='bar', figsize=(15, 8))
@@ -223,7 +187,7 @@ def analyze_day_ofthe_week(data):
     plt.ylabel('Number of Crashes')
     plt.title('Day of the week Crash Comparison')
     plt.legend(title='Year')
-    plt.show()
+    finish_figure("day_of_week")
 
 
 def analyze_hourly_Crashes(data):
@@ -233,17 +197,17 @@ def analyze_hourly_Crashes(data):
     """
     # needs data from jan 2019 to oct 2020
     # Hourly Crash Comparison between for all days 2019 and 2020
-    data['CRASH TIME'] = pd.to_timedelta(data['CRASH TIME'] + ':00')
+    data = as_frame(data)
 
     # Extract the year and hour
-    data['YEAR'] = data['CRASH DATE'].dt.year
-    data['HOUR'] = data['CRASH TIME'].dt.components.hours
+    years = date_part(data, 'YEAR')
+    hours = date_part(data, 'HOUR')
 
     # Filter data for 2019 and 2020
-    data = data[data['YEAR'].isin([2019, 2020])]
+    in_years = years.isin([2019, 2020])
 
     # Group by year and hour
-    hourly_crashes = data.groupby('HOUR').size()
+    hourly_crashes = hours[in_years].value_counts().sort_index()
 
     # Plot
     hourly_crashes.plot(kind='bar', figsize=(15, 8))
@@ -252,7 +216,7 @@ def analyze_hourly_Crashes(data):
     plt.title('Hourly Crash Comparison for 2019 and 2020')
     plt.xticks(range(0, 24), range(0, 24))  # Setting x-ticks to show every hour
     plt.legend(title='Year')
-    plt.show()
+    finish_figure("hourly")
 
 
 def consecutive_crashes_for_100days(data):
@@ -260,21 +224,19 @@ def consecutive_crashes_for_100days(data):
     The function takes data as input pandas dataframe and finds the number consecutive 100 days with
     most crashes. and prints to the ouput
     """
+    data = as_frame(data)
     # needs data from jan 2019 to oct 2020
-    # Count the number of accidents per day
-    daily_accidents = data.groupby('CRASH DATE').size()
-
-    # Use rolling window of 100 days to sum the accidents
-    rolling_sum = daily_accidents.rolling(window=99).sum()
-
-    # Find the period with the maximum number of accidents
-    max_accidents = rolling_sum.max()
-    max_period_start = rolling_sum.idxmax()
-    max_period_end = max_period_start + pd.Timedelta(days=100)
+    # Count the number of accidents per day, days without accidents count 0
+    daily_accidents = count_series(data, "D")
+
+    # Sum the accidents of every window of 100 days and find the period with the maximum number of accidents
+    windows = max_windows(daily_accidents, 100)
+    if windows.empty:
+        print(f"The data covers {len(daily_accidents)} days, fewer than 100 consecutive days.")
+        return
+    best = windows.iloc[0]
     print(
-        f"The 100 consecutive days with the most accidents is from {max_period_start.date()} to {max_period_end.date()}, with {max_accidents} accidents.")
-
-
+        f"The 100 consecutive days with the most accidents is from {best['START'].date()} to {best['END'].date()}, with {best['CRASHES']} accidents.")
 
 
 def analyse_numberof_injuries(yyear1, yyear2, mmonth1, mmonth2, year1, year2):
@@ -283,6 +245,7 @@ def analyse_numberof_injuries(yyear1, yyear2, mmonth1, mmonth2, year1, year2):
     find the number of injured per dataframe and plot a graph to compare the values of the month
     with the year and another month and another year.
     """
+    yyear1, yyear2, mmonth1, mmonth2 = as_frame(yyear1), as_frame(yyear2), as_frame(mmonth1), as_frame(mmonth2)
     # to plot the number of people injured in total
     noc19 = yyear1["NUMBER OF INJURED"].sum()
     noc20 = yyear2["NUMBER OF INJURED"].sum()
@@ -295,4 +258,4 @@ def analyse_numberof_injuries(yyear1, yyear2, mmonth1, mmonth2, year1, year2):
     plt.title("Number of injuries in 2019 and 2020 compared with july injuries")
     plt.xlabel("Year")
     plt.ylabel("Number of Casualties")
-    plt.show()
\ No newline at end of file
+    finish_figure(f"injuries_{year1}_vs_{year2}")
\ No newline at end of file
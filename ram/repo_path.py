@@ -0,0 +1,9 @@
+"""
+Makes the modules at the repository root importable from the scripts in this folder
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
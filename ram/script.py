@@ -1,121 +1,103 @@
-import numpy as np
-from sklearn.cluster import DBSCAN,KMeans # package to implement clustering algorithms
+import pandas as pd
+import matplotlib.pyplot as plt # package to plot the graphs
+from sklearn.cluster import DBSCAN # package to implement clustering algorithms
 from sklearn.preprocessing import StandardScaler # package to standardize the features
-from EDA import *
+from EDA import analyse_numberof_injuries, analyze_contributing_factors, analyze_day_ofthe_week, \
+    analyze_hourly_Crashes, analyze_vehicle_types, consecutive_crashes_for_100days, daily_comparision, \
+    find_12days_with_most_Accidents, street_compare, zipcode_compare
+import repo_path  # noqa: F401 makes the repository root importable
+from cleaning import clean_collisions
+from clustering import cluster_profile, dbscan_haversine
+from crash_dataset import CrashDataset, as_frame
+from instrumentation import span
+from plotting import finish_figure
 
 def data_preprocessing(data):
     """
     This function takes raw_data as input and performs data cleaning according to the project requirements
-    and also caculates some attributes.
+    and also caculates some attributes. The rules are shared with push_data.py and declared in cleaning.py.
     :param data: The raw data that is read from the csv file
     :return : returns the cleaned data
     """
-
-    data["CRASH DATE"] = pd.to_datetime(data["CRASH DATE"])
-    data = data.drop(data[data["LATITUDE"].isna()].index)
-    # data = data.drop(data[data["LONGITUDE"].isna()].index)
-    data = data.drop(data[data["LATITUDE"] == 0].index)
-
-    # drop zipcode with nans
-    data = data.drop(data[data["ZIP CODE"].isna()].index)
-
-    data["NUMBER OF KILLS"] = data['NUMBER OF PERSONS KILLED'] +\
-            data['NUMBER OF CYCLIST KILLED'] + \
-            data['NUMBER OF PEDESTRIANS KILLED']\
-            + data['NUMBER OF MOTORIST KILLED']
-        
-    data["NUMBER OF INJURED"] = data["NUMBER OF PERSONS INJURED"] + \
-        data['NUMBER OF PEDESTRIANS INJURED'] + \
-            data['NUMBER OF MOTORIST INJURED'] \
-        + data['NUMBER OF CYCLIST INJURED']
-
-    data['NUMBER OF CASUALTIES'] = data["NUMBER OF KILLS"] + data["NUMBER OF INJURED"]
     columns_to_drop = ['LOCATION', 'NUMBER OF PERSONS INJURED',
         'NUMBER OF PERSONS KILLED', 'NUMBER OF PEDESTRIANS INJURED',
         'NUMBER OF PEDESTRIANS KILLED', 'NUMBER OF CYCLIST INJURED',
         'NUMBER OF CYCLIST KILLED', 'NUMBER OF MOTORIST INJURED',
         'NUMBER OF MOTORIST KILLED']
 
-    data = data.drop(columns = columns_to_drop, axis = 1)
+    data, rejected = clean_collisions(data, [column for column in data.columns if column not in columns_to_drop])
+    print("Dropped by cleaning: " + ", ".join(f"{rule} {count}" for rule, count in rejected.items()))
     return data
 
 
-def Perform_DBSCAN(data, eps = 0.1, minpts = 20, month="June", year="2019"):
+def Perform_DBSCAN(data, eps = 0.1, minpts = 20, month="June", year="2019", haversine=False, n_jobs=1):
     """
     This function performs DBSCAN using sklearn package
+    with haversine=True eps is in metres and the clustering runs on the engine in clustering.py
+    data can be a DataFrame or a CrashDataset slice, it is not modified
     """
-    features = data[['LATITUDE', 'LONGITUDE']]
-
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
+    data = as_frame(data)
 
     # Perform DBSCAN clustering
-    dbscan = DBSCAN(eps=eps, min_samples=minpts)
-    labels = dbscan.fit_predict(scaled_features)
-
-    # Add cluster labels to the original dataset
-    data['Cluster'] = labels
+    with span("Perform_DBSCAN", rows_in=len(data), eps=eps, min_samples=minpts, haversine=haversine,
+              month=month, year=year) as stage:
+        if haversine:
+            labels = dbscan_haversine(data['LATITUDE'], data['LONGITUDE'], eps, minpts, n_jobs)
+        else:
+            # Only the standardised path needs the scaled coordinates
+            scaled_features = StandardScaler().fit_transform(data[['LATITUDE', 'LONGITUDE']])
+            dbscan = DBSCAN(eps=eps, min_samples=minpts)
+            labels = dbscan.fit_predict(scaled_features)
+        stage.set(clusters=int(labels.max() + 1), noise=int((labels == -1).sum()))
+
+    # Add cluster labels to a copy of the dataset
+    data = data.assign(Cluster=labels)
 
     data = data.drop(data[data["Cluster"]== -1].index)
-    cluster_centers = []
-    unique_labels = np.unique(labels)
-    for label in unique_labels:
-        if label == -1:
-            continue  # Skip noise points
-        cluster_points = scaled_features[labels == label]
-        cluster_center = np.mean(cluster_points, axis=0)
-        cluster_centers.append(cluster_center)
-
-    # Convert cluster_centers to original scale
-    cluster_centers_original_scale = scaler.inverse_transform(cluster_centers)
-
-    # # Display the cluster centers in the original scale
-    # for i, center in enumerate(cluster_centers_original_scale):
-    #     print(f"Cluster {i + 1} Center: {center}")
+    # Centroids, bounding boxes, counts and casualties of every cluster in one pass
+    print(f"Clusters of {month} {year}:")
+    print(cluster_profile(data, label_column="Cluster"))
 
     # Visualize the clusters
     plt.scatter(data['LONGITUDE'], data['LATITUDE'], c=data['Cluster'], cmap='Dark2', s=2)
     plt.title(f'NYC Crash Data Clusters (DBSCAN) {month} {year}')
     plt.xlabel('Longitude')
     plt.ylabel('Latitude')
-    plt.show()
+    finish_figure(f"dbscan_{month}_{year}")
 
     return data
 
 
-def main():
+CSV_PATH = r"E:\Assignments\Summer 2024\Big Data\final exam q3\Vehicle_Collisions.csv"
+
+
+def main(csv_path=CSV_PATH):
     """
     This function is the main function
     This function drives the program according to the project needs
+    :param csv_path: Path of the Vehicle_Collisions csv file
     """
     # read the data
-    raw_data = pd.read_csv(r"E:\Assignments\Summer 2024\Big Data\final exam q3\Vehicle_Collisions.csv", low_memory=False)
-
-    nyc_map = folium.Map(location=[40.7128, -74.0060], zoom_start=10)
+    raw_data = pd.read_csv(csv_path, low_memory=False)
 
     data = data_preprocessing(raw_data)
+    del raw_data
 
-    # data from 2019 and 2020
-    data19_20 = data[(data["CRASH DATE"].dt.year == 2019) |  (data["CRASH DATE"].dt.year == 2020)]
+    # Sort the data once by borough and date, every slice below is a range of rows of this dataset
+    dataset = CrashDataset(data)
+    del data
 
     # data frmo 2020
-    data_2020 = data19_20[data19_20["CRASH DATE"].dt.year == 2020]
-    
-    # data with 2019 and 2020 data with june and july
-    data_june_july_19_20 = data19_20[(data19_20["CRASH DATE"].dt.month == 6) |  (data19_20["CRASH DATE"].dt.month == 7)]
-    
+    data_2020 = dataset.select(year=2020)
+
     # queens data with june july 2019, 2020
-    Queens = data_june_july_19_20[data_june_july_19_20["BOROUGH"] == "QUEENS"] # has data for Queens june, july of 2019 and 2020.
-  
-    June_2019 = Queens[(Queens["CRASH DATE"].dt.year == 2019) & (Queens["CRASH DATE"].dt.month == 6)]
-    June_2020 = Queens[(Queens["CRASH DATE"].dt.year == 2020) & (Queens["CRASH DATE"].dt.month == 6)]
-    July_2019 = Queens[(Queens["CRASH DATE"].dt.year == 2019) & (Queens["CRASH DATE"].dt.month == 7)]
-    July_2020 = Queens[(Queens["CRASH DATE"].dt.year == 2020) & (Queens["CRASH DATE"].dt.month == 7)]
-
-    july = Queens[(Queens["CRASH DATE"].dt.month == 7)]
-    june = Queens[(Queens["CRASH DATE"].dt.month == 6)]
-    Q2019 = Queens[(Queens["CRASH DATE"].dt.year == 2019)]
-    Q2020 = Queens[(Queens["CRASH DATE"].dt.year == 2020)]
+    June_2019 = dataset.select("QUEENS", year=2019, month=6)
+    June_2020 = dataset.select("QUEENS", year=2020, month=6)
+    July_2019 = dataset.select("QUEENS", year=2019, month=7)
+    July_2020 = dataset.select("QUEENS", year=2020, month=7)
+
+    Q2019 = dataset.select("QUEENS", year=2019)
+    Q2020 = dataset.select("QUEENS", year=2020)
 
     zipcode_compare(Q2019, Q2020)
     street_compare(Q2019, Q2020)
@@ -134,9 +116,8 @@ def main():
     analyse_numberof_injuries(Q2019,Q2020,July_2019,July_2020, 2019, 2020)
 
     start_date = '2019-01-01'
-    end_date = '2020-10-31'
-    qdata = data19_20[data19_20["BOROUGH"] == "BROOKLYN"]
-    data_for_456 = qdata[(qdata['CRASH DATE'] >= start_date) & (qdata['CRASH DATE'] <= end_date)]
+    end_date = '2020-11-01'  # exclusive, up to the end of October 2020
+    data_for_456 = dataset.select("BROOKLYN", start_date=start_date, end_date=end_date)
 
     consecutive_crashes_for_100days(data_for_456)
     analyze_day_ofthe_week(data_for_456)
@@ -0,0 +1,259 @@
+import hashlib
+import inspect
+import json
+import os
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")  # Render to files, no window is ever opened
+import pandas as pd
+import plotting
+from analyze_data import Perform_DBSCAN, plot_clusters, plot_raw_data
+from crash_dataset import CrashDataset
+from db_operations import create_connection, pull_data_from_db
+from schema import BOROUGHS
+from concurrent_queries import engine_workers, gather
+from vis import analyze_day_of_the_week, analyze_hourly_crashes, fetch_borough_charts
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The ram/ scripts import each other by name, the report's worker processes import them the same way
+RAM_DIR = os.path.join(REPO_ROOT, "ram")
+if RAM_DIR not in sys.path:
+    sys.path.append(RAM_DIR)
+
+import EDA  # noqa: E402
+import script  # noqa: E402
+
+# Fingerprint and files of every chart of the last run, kept next to the charts
+MANIFEST_FILE = ".report_manifest.json"
+
+
+def cluster_chart(data, eps, minpts):
+    """
+    Clusters the crashes and plots the clusters, one report chart
+    """
+    plot_clusters(Perform_DBSCAN(data, eps, minpts), eps, minpts)
+
+
+def eda_charts(csv_path):
+    """
+    The charts of ram/script.py, drawn from the csv file since the database doesn't keep the street
+    names. The slices are turned into DataFrames so their content is part of the fingerprints.
+    :param csv_path: Path of the Vehicle_Collisions csv file
+    :return : returns a list of (name, render function, arguments) charts
+    """
+    dataset = CrashDataset(script.data_preprocessing(pd.read_csv(csv_path, low_memory=False)))
+    q2019 = dataset.select("QUEENS", year=2019).to_frame()
+    q2020 = dataset.select("QUEENS", year=2020).to_frame()
+    months = {(month, year): dataset.select("QUEENS", year=year, month=number).to_frame()
+              for month, number in (("June", 6), ("July", 7)) for year in (2019, 2020)}
+    brooklyn = dataset.select("BROOKLYN", start_date="2019-01-01", end_date="2020-11-01").to_frame()
+
+    charts = [
+        ("eda_zipcode_compare", EDA.zipcode_compare, (q2019, q2020)),
+        ("eda_street_compare", EDA.street_compare, (q2019, q2020)),
+        ("eda_contributing_factors", EDA.analyze_contributing_factors, (q2019, q2020)),
+        ("eda_vehicle_types", EDA.analyze_vehicle_types, (q2019, q2020)),
+    ]
+    for month in ("June", "July"):
+        charts.append((f"eda_daily_{month}", EDA.daily_comparision,
+                       (months[(month, 2019)], months[(month, 2020)], month, 2019, 2020)))
+    for (month, year), data in months.items():
+        charts.append((f"eda_dbscan_{month}_{year}", script.Perform_DBSCAN, (data, 0.1, 15, month, year)))
+    charts += [
+        ("eda_injuries", EDA.analyse_numberof_injuries,
+         (q2019, q2020, months[("July", 2019)], months[("July", 2020)], 2019, 2020)),
+        ("eda_day_of_week", EDA.analyze_day_ofthe_week, (brooklyn,)),
+        ("eda_hourly", EDA.analyze_hourly_Crashes, (brooklyn,)),
+    ]
+    return charts
+
+
+def report_charts(engine, table_name="crash_data", boroughs=BOROUGHS, start_date="2019-01-01",
+                  end_date="2020-11-01", cluster_borough="QUEENS", cluster_year=2019, eps=0.1, minpts=20,
+                  csv_path=None):
+    """
+    Fetches the input data of every chart of the report. The data is fetched here, the plotting runs
+    in build_report, so a chart is only redrawn when its data changes.
+    :param engine: The SQLAlchemy engine object
+    :param boroughs: Boroughs to draw the day of the week and hourly charts of
+    :param start_date: First day of the day of the week and hourly charts
+    :param end_date: Day after the last one (exclusive)
+    :param cluster_borough: Borough of the clustering charts
+    :param cluster_year: Year of the clustering charts
+    :param csv_path: The Vehicle_Collisions csv file, adds the charts of ram/ when given
+    :return : returns a list of (name, render function, arguments) charts
+    """
+    # The borough aggregates and the clustering crashes are independent queries, they run concurrently
+    fetched = gather({
+        "boroughs": lambda: fetch_borough_charts(engine, boroughs, start_date, end_date, table_name),
+        "crashes": lambda: pull_data_from_db(engine, table_name, columns=["LATITUDE", "LONGITUDE"],
+                                             borough=cluster_borough, start_date=f"{cluster_year}-01-01",
+                                             end_date=f"{cluster_year + 1}-01-01"),
+    }, engine_workers(engine))
+    charts = []
+    for borough, (day_of_week_data, hourly_data) in fetched["boroughs"].items():
+        prefix = borough.lower().replace(" ", "_")
+        charts.append((f"{prefix}_day_of_week", analyze_day_of_the_week, (day_of_week_data, borough)))
+        charts.append((f"{prefix}_hourly", analyze_hourly_crashes, (hourly_data, borough)))
+
+    crashes = fetched["crashes"]
+    if not crashes.empty:
+        charts.append(("raw_data", plot_raw_data, (crashes,)))
+        charts.append((f"dbscan_{eps}_{minpts}", cluster_chart, (crashes, eps, minpts)))
+    if csv_path is not None:
+        charts += eda_charts(csv_path)
+    return charts
+
+
+def _is_local(module):
+    path = getattr(module, "__file__", None)
+    return path is not None and os.path.abspath(path).startswith(REPO_ROOT + os.sep)
+
+
+def chart_modules(render):
+    """
+    The repository modules a chart's code can reach: the module of the render function and of every
+    function, class or module it refers to, followed through the functions of those modules
+    :param render: The function drawing the chart
+    :return : returns the sorted module names
+    """
+    modules = set()
+    seen = set()
+    pending = [render]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, types.ModuleType):
+            if _is_local(item):
+                modules.add(item.__name__)
+            continue
+        module = sys.modules.get(getattr(item, "__module__", None))
+        if module is None or not _is_local(module):
+            continue
+        modules.add(module.__name__)
+        if isinstance(item, type):
+            pending.extend(vars(item).values())
+            continue
+        function = getattr(item, "__func__", getattr(item, "fget", item))
+        code = getattr(function, "__code__", None)
+        if code is None:
+            continue
+        names = set()
+        codes = [code]
+        while codes:
+            current = codes.pop()
+            names.update(current.co_names)
+            codes.extend(const for const in current.co_consts if isinstance(const, types.CodeType))
+        pending.extend(function.__globals__[name] for name in names if name in function.__globals__)
+    return sorted(modules)
+
+
+def fingerprint(render, args):
+    """
+    Hash of a chart's input data and of the code drawing it, the source of every repository module the
+    chart's code reaches is included
+    :param render: The function drawing the chart
+    :param args: Its arguments, DataFrames are hashed by content
+    :return : returns a hex digest
+    """
+    digest = hashlib.sha256(f"{render.__module__}.{render.__qualname__}".encode())
+    for name in chart_modules(render):
+        digest.update(name.encode())
+        digest.update(inspect.getsource(sys.modules[name]).encode())
+    for arg in args:
+        if isinstance(arg, pd.DataFrame):
+            digest.update(repr(list(arg.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(arg, index=True).to_numpy().tobytes())
+        else:
+            digest.update(repr(arg).encode())
+    return digest.hexdigest()
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+
+def _render_chart(render, args):
+    """
+    Draws one chart in report mode and returns the files it wrote
+    """
+    plotting.saved_figures.clear()
+    render(*args)
+    return [os.path.basename(path) for path in plotting.saved_figures]
+
+
+def build_report(charts, directory="results", n_jobs=None, force=False):
+    """
+    Draws the charts to PNG files without opening any window. Charts whose fingerprint matches the
+    last run and whose files are still there are skipped, the others are drawn in parallel.
+    :param charts: Output of report_charts
+    :param directory: Output directory
+    :param n_jobs: Number of worker processes, None for one per core
+    :param force: Redraw every chart
+    :return : returns a dict of chart name to 'drawn', 'unchanged' or 'failed'
+    """
+    plotting.set_report_dir(directory)
+    manifest = _read_manifest(directory)
+    status = {}
+    pending = []
+    for name, render, args in charts:
+        key = fingerprint(render, args)
+        entry = manifest.get(name)
+        if (not force and entry is not None and entry["fingerprint"] == key
+                and all(os.path.exists(os.path.join(directory, file)) for file in entry["files"])):
+            status[name] = "unchanged"
+        else:
+            pending.append((name, render, args, key))
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(pending))
+    if n_jobs <= 1:
+        results = [(name, key, _call(_render_chart, render, args)) for name, render, args, key in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=plotting.set_report_dir,
+                                 initargs=(directory,)) as executor:
+            futures = [(name, key, executor.submit(_render_chart, render, args))
+                       for name, render, args, key in pending]
+            results = [(name, key, _call(future.result)) for name, key, future in futures]
+
+    for name, key, (files, error) in results:
+        if error is None:
+            manifest[name] = {"fingerprint": key, "files": files}
+            status[name] = "drawn"
+        else:
+            print(f"Chart {name} failed: {error}")
+            manifest.pop(name, None)
+            status[name] = "failed"
+    _write_manifest(directory, manifest)
+    return status
+
+
+def _call(function, *args):
+    """
+    Runs function and returns (result, None), or (None, error) when it raises
+    """
+    try:
+        return function(*args), None
+    except Exception as e:
+        return None, e
+
+
+if __name__ == "__main__":
+    engine = create_connection()
+    csv_path = None  # The Vehicle_Collisions csv file, adds the charts of ram/ when set
+    status = build_report(report_charts(engine, csv_path=csv_path), "results", force="--force" in sys.argv)
+    for name, state in status.items():
+        print(f"{name}: {state}")
@@ -0,0 +1,234 @@
+import hashlib
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from instrumentation import frame_bytes, span
+
+# File format of the cache, parquet when pyarrow is installed and pkl otherwise. It is probed on the
+# first cache file access, so importing this module doesn't load pyarrow.
+CACHE_FORMAT = None
+
+CACHE_DIR = os.environ.get("CRASH_CACHE_DIR", ".crash_cache")
+CACHE_MAX_BYTES = int(os.environ.get("CRASH_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Results kept in this process, the least recently used ones are dropped beyond these budgets
+CACHE_MEMORY_MAX_BYTES = int(os.environ.get("CRASH_CACHE_MEMORY_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_MEMORY_MAX_ENTRIES = int(os.environ.get("CRASH_CACHE_MEMORY_MAX_ENTRIES", 256))
+
+# Results already loaded in this process, key -> (DataFrame, bytes) from the least to the most
+# recently used, cleared together with the files by invalidate_cache
+_memory_cache = OrderedDict()
+_memory_bytes = 0
+_memory_lock = threading.Lock()
+
+# One lock per cache key, concurrent callers of the same query wait for the first one instead of
+# running it again
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+
+def _key_lock(key):
+    with _key_locks_lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def _memory_get(key):
+    """
+    A result kept in memory, marked as recently used, or None
+    """
+    with _memory_lock:
+        entry = _memory_cache.get(key)
+        if entry is None:
+            return None
+        _memory_cache.move_to_end(key)
+        return entry[0]
+
+
+def _memory_put(key, data):
+    """
+    Keeps a result in memory and drops the least recently used ones while the budgets are exceeded,
+    a result larger than the whole byte budget is not kept
+    """
+    global _memory_bytes
+    size = int(data.memory_usage(index=True, deep=True).sum())
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_bytes -= _memory_cache.pop(key)[1]
+        if size > CACHE_MEMORY_MAX_BYTES:
+            return
+        _memory_cache[key] = (data, size)
+        _memory_bytes += size
+        while _memory_bytes > CACHE_MEMORY_MAX_BYTES or len(_memory_cache) > CACHE_MEMORY_MAX_ENTRIES:
+            _memory_bytes -= _memory_cache.popitem(last=False)[1][1]
+
+
+def _memory_clear():
+    global _memory_bytes
+    with _memory_lock:
+        _memory_cache.clear()
+        _memory_bytes = 0
+    with _key_locks_lock:
+        _key_locks.clear()
+
+
+def create_generation_table_if_not_exists(engine):
+    """
+    Creates the table holding the ingest generation of every crash table
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS table_generation (
+        TABLE_NAME VARCHAR(64) PRIMARY KEY,
+        GENERATION BIGINT NOT NULL
+    );
+    """
+    with engine.begin() as connection:
+        connection.execute(text(create_table_query))
+
+
+def bump_generation(connection, table_name):
+    """
+    Increments the ingest generation of a table
+    """
+    params = {"table_name": table_name}
+    updated = connection.execute(text("UPDATE table_generation SET GENERATION = GENERATION + 1 "
+                                      "WHERE TABLE_NAME = :table_name"), params).rowcount
+    if not updated:
+        connection.execute(text("INSERT INTO table_generation VALUES (:table_name, 1)"), params)
+
+
+def mark_table_written(engine, table_name):
+    """
+    Invalidates the cached results of a table and bumps its generation after a write
+    """
+    invalidate_cache(table_name)
+    try:
+        with engine.begin() as connection:
+            bump_generation(connection, table_name)
+    except SQLAlchemyError:
+        pass  # The generation is not tracked, table_version falls back to the row count
+
+
+def table_version(connection, table_name):
+    """
+    Returns a stamp that changes whenever the table is written, the ingest generation when it is
+    tracked and the row count plus the newest crash date otherwise
+    """
+    try:
+        row = connection.execute(text("SELECT GENERATION FROM table_generation WHERE TABLE_NAME = :table_name"),
+                                 {"table_name": table_name}).first()
+        if row is not None:
+            return f"generation:{row[0]}"
+    except SQLAlchemyError:
+        connection.rollback()  # The table_generation table does not exist
+    row_count, max_crash_date = connection.execute(
+        text(f"SELECT COUNT(*), MAX(CRASH_DATE) FROM {table_name}")).first()
+    return f"rows:{row_count}:{max_crash_date}"
+
+
+def _cache_format():
+    global CACHE_FORMAT
+    if CACHE_FORMAT is None:
+        CACHE_FORMAT = "parquet" if importlib.util.find_spec("pyarrow") is not None else "pkl"
+    return CACHE_FORMAT
+
+
+def _cache_path(table_name, key):
+    return os.path.join(CACHE_DIR, f"{table_name}--{key}.{_cache_format()}")
+
+
+def _read_file(path):
+    return pd.read_parquet(path) if _cache_format() == "parquet" else pd.read_pickle(path)
+
+
+def _write_file(data, path):
+    # Written next to the entry and renamed, so a concurrent reader never sees a partial file
+    partial = f"{path}.{os.getpid()}-{threading.get_ident()}.partial"
+    if _cache_format() == "parquet":
+        data.to_parquet(partial, index=False)
+    else:
+        data.to_pickle(partial)
+    os.replace(partial, path)
+
+
+def _evict(max_bytes):
+    """
+    Removes the least recently used cache files until the cache fits in max_bytes, files still being
+    written are left to their writer
+    """
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".partial"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue  # Removed by a concurrent query
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cached_read_sql(engine, statement, params, table_name="crash_data", parse_dates=None):
+    """
+    Runs a query through the local cache. The key is the normalised query, its parameters and the
+    version of the table, so results are reused until the table is written again.
+    :param engine: The SQLAlchemy engine object
+    :param statement: The query
+    :param params: The bound parameters
+    :param table_name: The table the query reads, its version is part of the key
+    :param parse_dates: Columns to parse as datetimes
+    :return : returns the result as a DataFrame
+    """
+    query = " ".join(str(statement).split())
+    with span("query", table=table_name) as stage, engine.connect() as connection:
+        version = table_version(connection, table_name)
+        source = "|".join([engine.url.render_as_string(hide_password=True), query,
+                           repr(sorted(params.items())), repr(parse_dates), version])
+        key = hashlib.sha256(source.encode()).hexdigest()[:32]
+        with _key_lock(key):
+            data = _memory_get(key)
+            if data is not None:
+                stage.set(cache="memory", rows_out=len(data), bytes=frame_bytes(data))
+                return data.copy()
+
+            path = _cache_path(table_name, key)
+            if os.path.exists(path):
+                os.utime(path)  # Mark the entry as recently used
+                data = _read_file(path)
+                stage.set(cache="file")
+            else:
+                data = pd.read_sql(statement, connection, params=params, parse_dates=parse_dates)
+                stage.set(cache="miss", query=query)
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                _write_file(data, path)
+                _evict(CACHE_MAX_BYTES)
+            stage.set(rows_out=len(data), bytes=frame_bytes(data))
+            _memory_put(key, data)
+    return data.copy()
+
+
+def invalidate_cache(table_name=None):
+    """
+    Drops the cached results of a table, or of every table when table_name is None
+    """
+    _memory_clear()
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if (table_name is None or name.split("--")[0] == table_name) and not name.endswith(".partial"):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except FileNotFoundError:
+                pass  # Evicted by a concurrent query
@@ -0,0 +1,164 @@
+import pandas as pd
+from sqlalchemy import inspect, text
+from schema import GRAIN_EXPRESSIONS
+
+MEASURES = ["CRASHES", "INJURED", "KILLS", "CASUALTIES"]
+
+# Key columns of every rollup, BOROUGH and ZIP_CODE are part of the primary key so missing
+# values are stored as 'UNKNOWN' and '' instead of NULL
+ROLLUP_KEYS = {
+    "daily": ["DAY", "BOROUGH", "ZIP_CODE"],
+    "hourly": ["DAY", "HOUR", "BOROUGH"],
+}
+
+# Grains each rollup can answer, everything derived from DAY plus its own key columns
+ROLLUP_GRAINS = {
+    "daily": {"YEAR", "MONTH", "DAY", "DAY_OF_WEEK", "BOROUGH", "ZIP_CODE"},
+    "hourly": {"YEAR", "MONTH", "DAY", "DAY_OF_WEEK", "HOUR", "BOROUGH"},
+}
+
+UNKNOWN_BOROUGH = "UNKNOWN"
+
+
+def rollup_table(table_name, grain):
+    """
+    Name of a rollup table of a crash table
+    """
+    return f"{table_name}_rollup_{grain}"
+
+
+def create_rollup_tables(engine, table_name="crash_data"):
+    """
+    Creates the daily x borough x zip and hourly x borough rollups of a crash table
+    """
+    measures = ",\n        ".join(f"{measure} INT NOT NULL" for measure in MEASURES)
+    daily_query = f"""
+    CREATE TABLE IF NOT EXISTS {rollup_table(table_name, "daily")} (
+        DAY DATE NOT NULL,
+        BOROUGH VARCHAR(13) NOT NULL,
+        ZIP_CODE CHAR(5) NOT NULL,
+        {measures},
+        PRIMARY KEY (DAY, BOROUGH, ZIP_CODE)
+    );
+    """
+    hourly_query = f"""
+    CREATE TABLE IF NOT EXISTS {rollup_table(table_name, "hourly")} (
+        DAY DATE NOT NULL,
+        HOUR SMALLINT NOT NULL,
+        BOROUGH VARCHAR(13) NOT NULL,
+        {measures},
+        PRIMARY KEY (DAY, HOUR, BOROUGH)
+    );
+    """
+    with engine.begin() as connection:
+        connection.execute(text(daily_query))
+        connection.execute(text(hourly_query))
+
+
+def drop_rollup_tables(connection, table_name="crash_data"):
+    """
+    Drops the rollups of a crash table
+    """
+    for grain in ROLLUP_KEYS:
+        connection.execute(text(f"DROP TABLE IF EXISTS {rollup_table(table_name, grain)}"))
+
+
+def rollups_exist(connection, table_name="crash_data"):
+    return inspect(connection).has_table(rollup_table(table_name, "daily"))
+
+
+def rollups_empty(engine, table_name="crash_data"):
+    """
+    True when the crash table has rows but its rollups have none, e.g. a table loaded before the
+    rollups existed
+    """
+    with engine.connect() as connection:
+        if not rollups_exist(connection, table_name):
+            return False
+        has_rollups = connection.execute(text(f"SELECT 1 FROM {rollup_table(table_name, 'daily')} LIMIT 1")).first()
+        has_crashes = connection.execute(text(f"SELECT 1 FROM {table_name} LIMIT 1")).first()
+    return has_rollups is None and has_crashes is not None
+
+
+def _add_to_rollup(connection, rollup, keys, frame):
+    """
+    Adds the measures of frame to the matching rollup rows, inserting the missing ones
+    """
+    columns = keys + MEASURES
+    placeholder = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+    values = ", ".join([placeholder] * len(columns))
+    if connection.dialect.name == "mysql":
+        updates = ", ".join(f"{measure} = {measure} + VALUES({measure})" for measure in MEASURES)
+        conflict = f"ON DUPLICATE KEY UPDATE {updates}"
+    else:
+        updates = ", ".join(f"{measure} = {measure} + excluded.{measure}" for measure in MEASURES)
+        conflict = f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    rows = list(frame[columns].astype(object).itertuples(index=False, name=None))
+    connection.exec_driver_sql(f"INSERT INTO {rollup} ({', '.join(columns)}) VALUES ({values}) {conflict}", rows)
+
+
+def apply_rollups(connection, data, table_name="crash_data", sign=1):
+    """
+    Adds the crashes in data to the rollups of a crash table, or removes them with sign=-1.
+    Call it in the transaction that writes or deletes the rows.
+    :param connection: A SQLAlchemy connection inside a transaction
+    :param data: Cleaned crash rows
+    :param table_name: The crash table
+    :param sign: 1 when the rows are inserted, -1 when they are deleted
+    """
+    if data.empty:
+        return
+    crash_date = pd.to_datetime(data["CRASH_DATE"])
+    frame = pd.DataFrame({
+        "DAY": crash_date.dt.normalize(),
+        "HOUR": crash_date.dt.hour,
+        "BOROUGH": data["BOROUGH"].astype(object).fillna(UNKNOWN_BOROUGH),
+        "ZIP_CODE": data["ZIP_CODE"].astype(object).fillna(""),
+        "CRASHES": 1,
+        "INJURED": data["NUMBER_OF_INJURED"],
+        "KILLS": data["NUMBER_OF_KILLS"],
+        "CASUALTIES": data["NUMBER_OF_CASUALTIES"],
+    })
+    for grain, keys in ROLLUP_KEYS.items():
+        rollup = frame.groupby(keys)[MEASURES].sum().reset_index()
+        rollup["DAY"] = rollup["DAY"].dt.strftime("%Y-%m-%d")
+        rollup[MEASURES] = rollup[MEASURES].astype("int64") * sign
+        _add_to_rollup(connection, rollup_table(table_name, grain), keys, rollup)
+        if sign < 0:
+            connection.execute(text(f"DELETE FROM {rollup_table(table_name, grain)} WHERE CRASHES <= 0"))
+
+
+def rebuild_rollups(engine, table_name="crash_data"):
+    """
+    Recomputes the rollups of a crash table from its rows, for tables loaded before the rollups existed
+    """
+    expressions = GRAIN_EXPRESSIONS["mysql" if engine.dialect.name == "mysql" else "sqlite"]
+    sums = ("COUNT(*), COALESCE(SUM(NUMBER_OF_INJURED), 0), COALESCE(SUM(NUMBER_OF_KILLS), 0), "
+            "COALESCE(SUM(NUMBER_OF_CASUALTIES), 0)")
+    borough = f"COALESCE(BOROUGH, '{UNKNOWN_BOROUGH}')"
+    selects = {
+        "daily": f"SELECT DATE(CRASH_DATE), {borough}, COALESCE(ZIP_CODE, ''), {sums} FROM {table_name} "
+                 "GROUP BY 1, 2, 3",
+        "hourly": f"SELECT DATE(CRASH_DATE), {expressions['HOUR']}, {borough}, {sums} FROM {table_name} "
+                  "GROUP BY 1, 2, 3",
+    }
+    create_rollup_tables(engine, table_name)
+    with engine.begin() as connection:
+        for grain, select in selects.items():
+            rollup = rollup_table(table_name, grain)
+            connection.execute(text(f"DELETE FROM {rollup}"))
+            connection.execute(text(f"INSERT INTO {rollup} ({', '.join(ROLLUP_KEYS[grain] + MEASURES)}) {select}"))
+    print(f"Rollups of {table_name} rebuilt")
+
+
+def pick_rollup(group_by, zip_code=None, start_date=None, end_date=None):
+    """
+    Returns the rollup that can answer a crash count query, or None when it needs the raw rows
+    """
+    for value in (start_date, end_date):
+        if value is not None and pd.Timestamp(value) != pd.Timestamp(value).normalize():
+            return None  # Rollups only resolve whole days
+    for grain in ("daily", "hourly"):
+        if set(group_by) <= ROLLUP_GRAINS[grain] and (zip_code is None or "ZIP_CODE" in ROLLUP_KEYS[grain]):
+            return grain
+    return None
@@ -0,0 +1,164 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# SQL expressions for every time grain, DAY_OF_WEEK follows MySQL's DAYOFWEEK (1 = Sunday ... 7 = Saturday)
+GRAIN_EXPRESSIONS = {
+    "mysql": {
+        "YEAR": "YEAR(CRASH_DATE)",
+        "MONTH": "MONTH(CRASH_DATE)",
+        "DAY": "DATE(CRASH_DATE)",
+        "DAY_OF_WEEK": "DAYOFWEEK(CRASH_DATE)",
+        "HOUR": "HOUR(CRASH_DATE)",
+    },
+    "sqlite": {
+        "YEAR": "CAST(strftime('%Y', CRASH_DATE) AS INTEGER)",
+        "MONTH": "CAST(strftime('%m', CRASH_DATE) AS INTEGER)",
+        "DAY": "DATE(CRASH_DATE)",
+        "DAY_OF_WEEK": "CAST(strftime('%w', CRASH_DATE) AS INTEGER) + 1",
+        "HOUR": "CAST(strftime('%H', CRASH_DATE) AS INTEGER)",
+    },
+}
+
+BOROUGHS = ("BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND")
+
+CRASH_COLUMNS = ['COLLISION_ID', 'CRASH_DATE', 'LATITUDE', 'LONGITUDE', 'ZIP_CODE',
+                 'NUMBER_OF_KILLS', 'NUMBER_OF_INJURED', 'NUMBER_OF_CASUALTIES', 'BOROUGH']
+
+
+def borough_date_index(table_name):
+    """
+    Name of the (BOROUGH, CRASH_DATE) index of a crash table
+    """
+    return f"idx_{table_name}_borough_date"
+
+
+def crash_table_ddl(table_name, dialect_name, partition_years=None, index_table_name=None):
+    """
+    Builds the statements that create a compact crash table
+    :param table_name: The table name
+    :param dialect_name: 'mysql' or any other SQLAlchemy dialect name, the others get portable types
+    :param partition_years: Optional iterable of years, MySQL only, one RANGE partition per year
+    :param index_table_name: Table name used to name the index, defaults to table_name
+    :return : returns a list of SQL statements
+    """
+    index_name = borough_date_index(index_table_name or table_name)
+    if dialect_name != "mysql":
+        # SQLite and friends: INTEGER PRIMARY KEY makes the collision id the rowid
+        return [f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            COLLISION_ID INTEGER NOT NULL PRIMARY KEY,
+            CRASH_DATE DATETIME NOT NULL,
+            LATITUDE REAL,
+            LONGITUDE REAL,
+            ZIP_CODE CHAR(5),
+            NUMBER_OF_KILLS SMALLINT,
+            NUMBER_OF_INJURED SMALLINT,
+            NUMBER_OF_CASUALTIES SMALLINT,
+            BOROUGH VARCHAR(13)
+        );
+        """, f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} (BOROUGH, CRASH_DATE);"]
+
+    boroughs = ", ".join(f"'{borough}'" for borough in BOROUGHS)
+    # MySQL requires the partitioning column in every unique key
+    primary_key = "COLLISION_ID, CRASH_DATE" if partition_years else "COLLISION_ID"
+    partitions = ""
+    if partition_years:
+        ranges = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in sorted(partition_years)]
+        ranges.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        partitions = "PARTITION BY RANGE (YEAR(CRASH_DATE)) (\n            " + ",\n            ".join(ranges) + "\n        )"
+    return [f"""
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        COLLISION_ID INT NOT NULL,
+        CRASH_DATE DATETIME NOT NULL,
+        LATITUDE FLOAT,
+        LONGITUDE FLOAT,
+        ZIP_CODE CHAR(5),
+        NUMBER_OF_KILLS SMALLINT UNSIGNED,
+        NUMBER_OF_INJURED SMALLINT UNSIGNED,
+        NUMBER_OF_CASUALTIES SMALLINT UNSIGNED,
+        BOROUGH ENUM({boroughs}),
+        PRIMARY KEY ({primary_key}),
+        INDEX {index_name} (BOROUGH, CRASH_DATE)
+    ) {partitions};
+    """]
+
+
+def create_crash_table(engine, table_name="crash_data", partition_years=None):
+    """
+    Creates the compact, indexed crash table if it does not exist
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param partition_years: Optional iterable of years to range partition on (MySQL only)
+    """
+    with engine.begin() as connection:
+        for statement in crash_table_ddl(table_name, engine.dialect.name, partition_years):
+            connection.execute(text(statement))
+
+
+def migrate_crash_table(engine, table_name="crash_data", partition_years=None):
+    """
+    Rewrites an existing crash table into the compact schema. The rows are copied into a new table
+    which is then swapped in place of the old one. Tables created before COLLISION_ID was kept get
+    negative surrogate ids, incremental_csv_to_db replaces those rows with the real ones on its first run.
+    On MySQL every DDL statement commits on its own, so a failure part way through can leave the
+    half-filled copy or the swapped out old table behind. The old table keeps every row until the
+    atomic RENAME, and running the migration again drops the leftovers and finishes it.
+    :param engine: The SQLAlchemy engine object
+    :param table_name: The table name
+    :param partition_years: Optional iterable of years to range partition on (MySQL only)
+    """
+    new_table, old_table = f"{table_name}_compact", f"{table_name}_legacy"
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        create_crash_table(engine, table_name, partition_years)
+        return
+    index_names = {index["name"] for index in inspector.get_indexes(table_name)}
+    if borough_date_index(table_name) in index_names:
+        # A run interrupted after the swap leaves the old table behind
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {old_table}"))
+        print(f"Table {table_name} already uses the compact schema")
+        return
+
+    columns = {column["name"] for column in inspector.get_columns(table_name)}
+    if "COLLISION_ID" in columns:
+        id_expression, where = "COLLISION_ID", "CRASH_DATE IS NOT NULL AND COLLISION_ID IS NOT NULL"
+    else:
+        print(f"Table {table_name} has no COLLISION_ID, its rows get negative surrogate ids")
+        id_expression, where = "-ROW_NUMBER() OVER (ORDER BY CRASH_DATE)", "CRASH_DATE IS NOT NULL"
+    boroughs = ", ".join(f"'{borough}'" for borough in BOROUGHS)
+    select_list = ", ".join([
+        id_expression, "CRASH_DATE", "LATITUDE", "LONGITUDE", "SUBSTR(ZIP_CODE, 1, 5)",
+        "NUMBER_OF_KILLS", "NUMBER_OF_INJURED", "NUMBER_OF_CASUALTIES",
+        f"CASE WHEN BOROUGH IN ({boroughs}) THEN BOROUGH END"])
+
+    is_mysql = engine.dialect.name == "mysql"
+    insert_ignore = "INSERT IGNORE" if is_mysql else "INSERT OR IGNORE"
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {new_table}"))
+            connection.execute(text(f"DROP TABLE IF EXISTS {old_table}"))
+            for statement in crash_table_ddl(new_table, engine.dialect.name, partition_years, table_name):
+                connection.execute(text(statement))
+            result = connection.execute(text(
+                f"{insert_ignore} INTO {new_table} ({', '.join(CRASH_COLUMNS)}) "
+                f"SELECT {select_list} FROM {table_name} WHERE {where}"))
+            if is_mysql:
+                connection.execute(text(f"RENAME TABLE {table_name} TO {old_table}, {new_table} TO {table_name}"))
+            else:
+                connection.execute(text(f"ALTER TABLE {table_name} RENAME TO {old_table}"))
+                connection.execute(text(f"ALTER TABLE {new_table} RENAME TO {table_name}"))
+            connection.execute(text(f"DROP TABLE {old_table}"))
+        print(f"Table {table_name} migrated to the compact schema, {result.rowcount} rows copied")
+    except SQLAlchemyError as e:
+        print(f"The error '{e}' occurred while migrating {table_name}")
+
+
+def delete_legacy_rows(engine, table_name="crash_data"):
+    """
+    Deletes the rows that were given surrogate ids by migrate_crash_table
+    """
+    with engine.begin() as connection:
+        deleted = connection.execute(text(f"DELETE FROM {table_name} WHERE COLLISION_ID < 0")).rowcount
+    if deleted:
+        print(f"Deleted {deleted} legacy rows from {table_name}")
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# The modules live at the repository root, the ram/ scripts import each other by name
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, "ram"))
+
+import pytest  # noqa: E402
+import result_cache  # noqa: E402
+from db_operations import create_table_if_not_exists  # noqa: E402
+from engine_factory import get_engine  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # An empty crash table in a SQLite file, with the result cache kept in the test's directory
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    engine = get_engine(f"sqlite:///{tmp_path / 'crashes.db'}")
+    create_table_if_not_exists(engine, "crash_data")
+    yield engine
+    engine.dispose()
@@ -0,0 +1,11 @@
+import pytest
+from cli import parse_args
+
+
+def test_metre_clustering_needs_eps(capsys):
+    assert parse_args(["cluster"]).eps == 0.1
+    assert parse_args(["cluster", "--haversine", "--eps", "100"]).eps == 100
+    for flags in (["--haversine"], ["--incremental", "state.pkl"]):
+        with pytest.raises(SystemExit):
+            parse_args(["cluster", *flags])
+        assert "--eps in metres" in capsys.readouterr().err
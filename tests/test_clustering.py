@@ -0,0 +1,37 @@
+import numpy as np
+from sklearn.cluster import DBSCAN
+from clustering import dbscan_haversine, dbscan_sweep
+
+
+def streets(rng):
+    # Crashes along streets about 1.5km long, so clusters run over several 500m cells, plus duplicates and noise
+    starts = np.array([[40.700, -73.950], [40.710, -73.940], [40.690, -73.930]])
+    steps = rng.uniform(0, 1, (900, 1)) * [[0.0135, 0.0]] + rng.normal(0, 0.0002, (900, 2))
+    points = starts[rng.integers(0, len(starts), 900)] + steps
+    noise = [40.68, -73.97] + rng.uniform(0, 0.05, (300, 2))
+    points = np.vstack([points, points[:100], noise])
+    return points[:, 0], points[:, 1]
+
+
+def test_grid_partitioned_labels_match_the_sequential_run():
+    lat, lon = streets(np.random.default_rng(3))
+    for eps_m, min_samples in [(60, 4), (100, 8), (150, 20)]:
+        sequential = dbscan_haversine(lat, lon, eps_m, min_samples, n_jobs=1)
+        partitioned = dbscan_haversine(lat, lon, eps_m, min_samples, n_jobs=2, cell_m=500)
+        assert sequential.max() >= 2
+        np.testing.assert_array_equal(partitioned, sequential)
+
+
+def test_sweep_labels_match_dbscan():
+    rng = np.random.default_rng(4)
+    lat, lon = streets(rng)
+    # Scaled coordinates like the standardised path, with repeated rows
+    features = np.column_stack([lat, lon])
+    features = (features - features.mean(axis=0)) / features.std(axis=0)
+    eps_values, min_samples_values = [0.02, 0.05, 0.1], [3, 10, 25]
+    summary, labels = dbscan_sweep(features, eps_values, min_samples_values, return_labels=True)
+    assert len(summary) == 9
+    for eps in eps_values:
+        for min_samples in min_samples_values:
+            expected = DBSCAN(eps=eps, min_samples=min_samples).fit(features).labels_
+            np.testing.assert_array_equal(labels[(eps, min_samples)], expected)
@@ -0,0 +1,54 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+import result_cache
+from concurrent_queries import engine_workers, gather, read_sql_many
+from engine_factory import get_engine
+from vis import fetch_borough_charts
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    result_cache.invalidate_cache()
+    engine = get_engine("sqlite://")
+    crashes = pd.DataFrame({"COLLISION_ID": np.arange(100), "CRASH_DATE": pd.Timestamp("2020-01-01"),
+                            "BOROUGH": np.resize(["BRONX", "BROOKLYN", "QUEENS", "MANHATTAN"], 100),
+                            "NUMBER_OF_KILLS": 0, "NUMBER_OF_INJURED": 1, "NUMBER_OF_CASUALTIES": 1})
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS crash_data"))
+        crashes.to_sql("crash_data", connection, index=False)
+    yield engine
+    result_cache.invalidate_cache()
+
+
+def test_batch_on_in_memory_sqlite(engine):
+    boroughs = ["BRONX", "BROOKLYN", "QUEENS", "MANHATTAN", "STATEN ISLAND"]
+    queries = {borough: (text("SELECT COUNT(*) AS CRASHES FROM crash_data WHERE BOROUGH = :borough"),
+                         {"borough": borough}) for borough in boroughs}
+    # The single connection of an in-memory database is not shared by two queries at once
+    assert engine_workers(engine, 5) == 1
+    results = read_sql_many(engine, queries, max_workers=5)
+    assert list(results) == boroughs
+    assert [int(results[borough]["CRASHES"].iloc[0]) for borough in boroughs] == [25, 25, 25, 25, 0]
+
+
+def test_batch_takes_as_long_as_the_slowest_call():
+    start = time.perf_counter()
+    results = gather({i: (lambda i=i: time.sleep(0.2) or i) for i in range(10)}, max_workers=10)
+    assert list(results.values()) == list(range(10))
+    assert time.perf_counter() - start < 1.0
+
+
+def test_first_error_is_raised():
+    with pytest.raises(ZeroDivisionError):
+        gather({"ok": lambda: 1, "fails": lambda: 1 / 0})
+
+
+def test_borough_charts_cover_brooklyn_unless_asked(engine):
+    assert list(fetch_borough_charts(engine)) == ["BROOKLYN"]
+    charts = fetch_borough_charts(engine, ["BRONX", "QUEENS"])
+    assert list(charts) == ["BRONX", "QUEENS"]
+    assert [int(hourly["CRASHES"].sum()) for _, hourly in charts.values()] == [25, 25]
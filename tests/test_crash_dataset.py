@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from crash_dataset import CrashDataset
+
+BOROUGHS = ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND"]
+
+
+@pytest.fixture(scope="module")
+def crashes():
+    rng = np.random.default_rng(0)
+    rows = 20000
+    start = pd.Timestamp("2019-01-01").value
+    end = pd.Timestamp("2020-12-31").value
+    return pd.DataFrame({
+        "COLLISION_ID": np.arange(rows),
+        "CRASH_DATE": pd.to_datetime(rng.integers(start, end, rows)).floor("min"),
+        "BOROUGH": rng.choice(BOROUGHS, rows),
+    })
+
+
+def reference(data, boroughs=None, start_date=None, end_date=None):
+    mask = np.ones(len(data), dtype=bool)
+    if boroughs is not None:
+        mask &= data["BOROUGH"].isin(boroughs).to_numpy()
+    if start_date is not None:
+        mask &= (data["CRASH_DATE"] >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        mask &= (data["CRASH_DATE"] < pd.Timestamp(end_date)).to_numpy()
+    return set(data.loc[mask, "COLLISION_ID"])
+
+
+@pytest.mark.parametrize("boroughs", [None, ["BRONX", "BROOKLYN"], ["BROOKLYN", "QUEENS", "STATEN ISLAND"],
+                                      ["MANHATTAN"]])
+def test_date_range_across_boroughs(crashes, boroughs):
+    dataset = CrashDataset(crashes)
+    selected = dataset.select(boroughs, start_date="2019-06-01", end_date="2019-07-01").to_frame()
+    assert set(selected["COLLISION_ID"]) == reference(crashes, boroughs, "2019-06-01", "2019-07-01")
+    assert len(selected) == len(set(selected["COLLISION_ID"]))
+
+
+def test_date_range_after_year_filter(crashes):
+    dataset = CrashDataset(crashes)
+    selected = dataset.select(year=2020).select(start_date="2020-03-15", end_date="2020-05-01").to_frame()
+    assert set(selected["COLLISION_ID"]) == reference(crashes, None, "2020-03-15", "2020-05-01")
+
+
+def test_open_ended_date_range(crashes):
+    dataset = CrashDataset(crashes)
+    assert set(dataset.select(start_date="2020-11-01").to_frame()["COLLISION_ID"]) == \
+        reference(crashes, start_date="2020-11-01")
+    assert set(dataset.select(end_date="2019-02-01").to_frame()["COLLISION_ID"]) == \
+        reference(crashes, end_date="2019-02-01")
@@ -0,0 +1,98 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import db_operations
+import instrumentation
+from db_operations import build_crash_filters, build_crash_query, bulk_load, iter_data_from_db, pull_data_from_db
+
+
+def crashes(ids):
+    return pd.DataFrame({
+        "COLLISION_ID": ids, "CRASH_DATE": pd.Timestamp("2020-06-01 08:30"), "LATITUDE": 40.7,
+        "LONGITUDE": -73.9, "ZIP_CODE": "11201", "NUMBER_OF_KILLS": 0, "NUMBER_OF_INJURED": 1,
+        "NUMBER_OF_CASUALTIES": 1, "BOROUGH": "BROOKLYN",
+    })
+
+
+def count_rows(engine):
+    with engine.connect() as connection:
+        return pd.read_sql("SELECT COUNT(*) AS N FROM crash_data", connection)["N"].iloc[0]
+
+
+def test_refused_infile_falls_back_to_executemany(engine, monkeypatch, capsys):
+    with engine.begin() as connection:
+        # SQLite rejects LOAD DATA like a MySQL server with local_infile disabled
+        monkeypatch.setattr(connection.dialect, "name", "mysql")
+        bulk_load(crashes(np.arange(1, 2501)), connection, chunk_size=1000)
+    assert "falling back to executemany" in capsys.readouterr().out
+    assert count_rows(engine) == 2500
+
+
+def test_chunk_size_follows_the_throughput(engine, monkeypatch):
+    # Rows per second by chunk size, throughput improves up to 40000 rows and drops beyond
+    rates = {10000: 10000, 20000: 20000, 40000: 40000, 80000: 10000}
+    clock = [0.0]
+    sizes = []
+
+    def insert(connection, chunk, table_name):
+        sizes.append(len(chunk))
+        clock[0] += len(chunk) / rates[len(chunk)]
+
+    monkeypatch.setattr(db_operations, "_executemany_insert", insert)
+    monkeypatch.setattr(db_operations.time, "perf_counter", lambda: clock[0])
+    with engine.begin() as connection:
+        bulk_load(crashes(np.arange(250000)), connection, chunk_size=10000)
+    assert sizes == [10000, 20000, 40000, 80000, 40000, 40000, 20000]
+
+    sizes.clear()
+    with engine.begin() as connection:
+        bulk_load(crashes(np.arange(100000)), connection, chunk_size=10000, max_chunk_size=20000)
+    assert sizes == [10000, 20000, 20000, 20000, 20000, 10000]
+
+
+def test_streamed_pull_is_recorded(engine, monkeypatch, tmp_path):
+    db_operations.push_data_to_db(crashes(np.arange(1, 251)), engine)
+    spans_path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(instrumentation, "SPANS_PATH", str(spans_path))
+    assert sum(len(chunk) for chunk in iter_data_from_db(engine, chunk_size=100)) == 250
+    stream = iter_data_from_db(engine, chunk_size=100)
+    next(stream)
+    stream.close()
+
+    records = [json.loads(line) for line in spans_path.read_text().splitlines()]
+    pulls = [record for record in records if record["stage"] == "iter_data_from_db"]
+    assert [(pull["rows_out"], pull["chunks"], pull["status"]) for pull in pulls] == [(250, 3, "ok"), (100, 1, "ok")]
+    assert pulls[1]["stopped_early"]
+
+
+def test_crash_filters():
+    assert build_crash_filters() == ([], {}, [])
+    conditions, params, expanding = build_crash_filters("QUEENS", "2019-01-01", pd.Timestamp("2020-01-01"),
+                                                        [11368, "11101"], after_collision_id=np.int64(7))
+    assert conditions == ["BOROUGH IN :boroughs", "ZIP_CODE IN :zip_codes", "CRASH_DATE >= :start_date",
+                          "CRASH_DATE < :end_date", "COLLISION_ID > :after_collision_id"]
+    assert params == {"boroughs": ["QUEENS"], "zip_codes": ["11368", "11101"],
+                      "start_date": "2019-01-01 00:00:00", "end_date": "2020-01-01 00:00:00",
+                      "after_collision_id": 7}
+    assert expanding == ["boroughs", "zip_codes"]
+    _, params, _ = build_crash_filters(end_date="2020-06-01", date_column="DAY", date_format="%Y-%m-%d")
+    assert params == {"end_date": "2020-06-01"}
+    with pytest.raises(ValueError):
+        build_crash_query(columns=["BOROUGH; DROP TABLE crash_data"])
+
+
+def test_pull_applies_the_filters_in_the_database(engine):
+    data = crashes(np.arange(1, 201))
+    data["CRASH_DATE"] = pd.Timestamp("2019-12-30") + pd.to_timedelta(np.arange(200), unit="h")
+    data["BOROUGH"] = np.resize(["BROOKLYN", "QUEENS", "BRONX"], 200)
+    data["ZIP_CODE"] = np.resize(["11201", "11368"], 200)
+    db_operations.push_data_to_db(data, engine)
+
+    pulled = pull_data_from_db(engine, columns=["COLLISION_ID", "BOROUGH"], borough=["QUEENS", "BRONX"],
+                               start_date="2020-01-01", end_date="2020-01-05", zip_code="11368")
+    expected = data[data["BOROUGH"].isin(["QUEENS", "BRONX"]) & (data["ZIP_CODE"] == "11368")
+                    & (data["CRASH_DATE"] >= "2020-01-01") & (data["CRASH_DATE"] < "2020-01-05")]
+    assert list(pulled.columns) == ["COLLISION_ID", "BOROUGH"]
+    assert sorted(pulled["COLLISION_ID"]) == list(expected["COLLISION_ID"])
+    assert len(pull_data_from_db(engine, columns=["COLLISION_ID"], after_collision_id=150, limit=10)) == 10
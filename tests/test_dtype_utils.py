@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from dtype_utils import COORDINATE_TOLERANCE, optimize_dtypes
+
+
+def test_coordinates_become_float32_within_the_tolerance():
+    rng = np.random.default_rng(6)
+    data = pd.DataFrame({"LATITUDE": 40.7 + rng.normal(0, 0.1, 1000), "LONGITUDE": -73.9 + rng.normal(0, 0.1, 1000)})
+    data.loc[3, "LATITUDE"] = np.nan
+    optimized = optimize_dtypes(data)
+    assert (optimized.dtypes == "float32").all()
+    error = (optimized["LATITUDE"].astype("float64") - data["LATITUDE"]).abs()
+    assert error.max() <= COORDINATE_TOLERANCE and np.isnan(optimized.loc[3, "LATITUDE"])
+
+    # Projected coordinates in metres lose more than the tolerance in float32
+    projected = pd.DataFrame({"LATITUDE": [4507123.123456, 4507123.654321]})
+    assert optimize_dtypes(projected)["LATITUDE"].dtype == "float64"
+
+
+def test_counts_get_the_smallest_integer_type():
+    data = pd.DataFrame({
+        "NUMBER_OF_KILLS": [0.0, 1.0, 2.0],
+        "NUMBER_OF_INJURED": [1.0, np.nan, 3.0],
+        "COLLISION_ID": [4000000, 4000001, 4000002],
+        "NUMBER_OF_CASUALTIES": [300.0, np.nan, 0.0],
+        "SCORE": [0.5, 1.0, 2.0],
+        "BOROUGH": ["QUEENS", "QUEENS", None],
+    })
+    optimized = optimize_dtypes(data)
+    assert optimized.dtypes.astype(str).to_dict() == {
+        "NUMBER_OF_KILLS": "int8", "NUMBER_OF_INJURED": "Int8", "COLLISION_ID": "int32",
+        "NUMBER_OF_CASUALTIES": "Int16", "SCORE": "float64", "BOROUGH": "category",
+    }
+    assert optimized["NUMBER_OF_INJURED"].isna().tolist() == [False, True, False]
+    assert optimized["NUMBER_OF_CASUALTIES"].tolist()[::2] == [300, 0]
+    # The input is left as it was
+    assert data["NUMBER_OF_KILLS"].dtype == "float64"
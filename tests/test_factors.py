@@ -0,0 +1,62 @@
+import pandas as pd
+from matplotlib.axes import Axes
+import EDA
+import plotting
+from factors import count_factors, split_factors
+
+
+def raw_crashes():
+    # Raw csv slot columns, missing, blank and 'Unspecified' slots included
+    return pd.DataFrame({
+        "COLLISION_ID": [1, 2, 3],
+        "BOROUGH": ["QUEENS", "QUEENS", "BROOKLYN"],
+        "CONTRIBUTING FACTOR VEHICLE 1": ["Driver Inattention/Distraction", "Unspecified", "Unsafe Speed"],
+        "CONTRIBUTING FACTOR VEHICLE 2": ["Unspecified", " Driver Inattention/Distraction ", None],
+        "CONTRIBUTING FACTOR VEHICLE 3": [None, "", "Unsafe Speed"],
+        "CONTRIBUTING FACTOR VEHICLE 4": [None, None, None],
+        "CONTRIBUTING FACTOR VEHICLE 5": [None, None, "Driver Inattention/Distraction"],
+        "VEHICLE TYPE CODE 1": ["Sedan", "Taxi", "Sedan"],
+        "VEHICLE TYPE CODE 2": ["Bike", None, ""],
+        "VEHICLE TYPE CODE 3": [None, None, None],
+        "VEHICLE TYPE CODE 4": [None, None, None],
+        "VEHICLE TYPE CODE 5": [None, None, None],
+    })
+
+
+def as_dict(counts):
+    return dict(zip(counts["VALUE"], counts["COUNT"]))
+
+
+def test_count_factors_skips_empty_and_unspecified_slots():
+    data = raw_crashes()
+    assert as_dict(count_factors(data, "FACTOR")) == {"Driver Inattention/Distraction": 3, "Unsafe Speed": 2}
+    assert as_dict(count_factors(data, "FACTOR", include_unspecified=True)) == {
+        "Driver Inattention/Distraction": 3, "Unsafe Speed": 2, "Unspecified": 2}
+    assert as_dict(count_factors(data, "VEHICLE", k=1)) == {"Sedan": 2}
+    by_borough = count_factors(data, "FACTOR", group_by=["BOROUGH"])
+    assert list(by_borough.itertuples(index=False, name=None)) == [
+        ("BROOKLYN", "Unsafe Speed", 2), ("BROOKLYN", "Driver Inattention/Distraction", 1),
+        ("QUEENS", "Driver Inattention/Distraction", 2)]
+
+
+def test_split_factors_keeps_the_filled_slots():
+    crashes, factors = split_factors(raw_crashes())
+    assert list(crashes.columns) == ["COLLISION_ID", "BOROUGH"]
+    vehicles = factors[factors["KIND"] == "VEHICLE"]
+    assert list(vehicles.itertuples(index=False, name=None)) == [
+        (1, "VEHICLE", 1, "Sedan"), (2, "VEHICLE", 1, "Taxi"), (3, "VEHICLE", 1, "Sedan"), (1, "VEHICLE", 2, "Bike")]
+    # 'Unspecified' is a recorded value, only empty slots are dropped
+    assert sorted(factors.loc[factors["COLLISION_ID"] == 2, "VALUE"]) == [
+        "Driver Inattention/Distraction", "Taxi", "Unspecified"]
+
+
+def test_pie_charts_show_the_counts(monkeypatch, tmp_path):
+    pies = []
+    original_pie = Axes.pie
+    monkeypatch.setattr(Axes, "pie", lambda axes, counts, labels, **kwargs: pies.append(dict(zip(labels, counts)))
+                        or original_pie(axes, counts, labels=labels, **kwargs))
+    monkeypatch.setattr(plotting, "REPORT_DIR", None)
+    plotting.set_report_dir(str(tmp_path))
+    data = raw_crashes()
+    EDA.analyze_contributing_factors(data, data.iloc[:2])
+    assert pies == [{"Driver Inattention/Distraction": 3, "Unsafe Speed": 2}, {"Driver Inattention/Distraction": 2}]
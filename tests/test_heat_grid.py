@@ -0,0 +1,50 @@
+import re
+import numpy as np
+import pandas as pd
+from db_operations import push_data_to_db
+from heat_grid import SQL_STEP_DEGREES, bin_points, bin_points_sql, cell_centre, cell_index, save_heatmap, \
+    tile_pyramid
+
+
+def crashes(rng, rows=2000):
+    # Coordinates on the database's degree grid, so both binning paths see the same points
+    steps = np.round(np.column_stack([40.70 + rng.normal(0, 0.02, rows), -73.95 + rng.normal(0, 0.02, rows)])
+                     / SQL_STEP_DEGREES)
+    return pd.DataFrame({
+        "COLLISION_ID": np.arange(1, rows + 1), "CRASH_DATE": pd.Timestamp("2020-06-01 08:30"),
+        "LATITUDE": steps[:, 0] * SQL_STEP_DEGREES, "LONGITUDE": steps[:, 1] * SQL_STEP_DEGREES,
+        "ZIP_CODE": "11201", "NUMBER_OF_KILLS": 0, "NUMBER_OF_INJURED": rng.integers(0, 3, rows),
+        "NUMBER_OF_CASUALTIES": 0, "BOROUGH": rng.choice(["BROOKLYN", "QUEENS"], rows),
+    })
+
+
+def test_cell_index_of_known_points():
+    # One 256 px cell covers the world at zoom 0, four at zoom 1
+    assert [value.tolist() for value in cell_index([0.0], [0.0], zoom=0, cell_px=256)] == [[0], [0]]
+    assert [value.tolist() for value in cell_index([40.7, -33.9], [-74.0, 151.2], zoom=1, cell_px=256)] == [
+        [0, 1], [0, 1]]
+    x, y = cell_index([40.7128, 40.6], [-74.006, -73.9])
+    assert [value.tolist() for value in cell_index(*cell_centre(x, y))] == [x.tolist(), y.tolist()]
+
+
+def sorted_cells(cells):
+    return cells.sort_values(["GROUP", "X", "Y"], ignore_index=True)[["GROUP", "X", "Y", "WEIGHT"]]
+
+
+def test_database_binning_matches_the_in_memory_binning(engine):
+    data = crashes(np.random.default_rng(7))
+    push_data_to_db(data, engine)
+    pd.testing.assert_frame_equal(sorted_cells(bin_points_sql(engine, measure="NUMBER_OF_INJURED",
+                                                              group_column="BOROUGH")),
+                                  sorted_cells(bin_points(data, "NUMBER_OF_INJURED", "BOROUGH")), check_dtype=False)
+    cells = bin_points_sql(engine, borough="QUEENS")
+    assert cells["WEIGHT"].sum() == (data["BOROUGH"] == "QUEENS").sum()
+    assert [level["WEIGHT"].sum() for level in tile_pyramid(cells, min_zoom=12).values()] == [cells["WEIGHT"].sum()] * 4
+
+
+def test_heatmap_scale_tops_at_the_busiest_cell(tmp_path):
+    cells = bin_points(crashes(np.random.default_rng(8)))
+    path = tmp_path / "map.html"
+    save_heatmap(cells, str(path))
+    scale = re.search(r'"max": ([0-9.]+)', path.read_text())
+    assert float(scale.group(1)) == cells["WEIGHT"].max() > 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from analyze_data import Incremental_DBSCAN
+from clustering import IncrementalDBSCAN
+from db_operations import push_data_to_db
+
+
+def crashes(ids, dates, rng):
+    # Tight groups of crashes around a few centres
+    centres = np.array([[40.70, -73.95], [40.75, -73.90], [40.65, -73.80]])
+    points = centres[rng.integers(0, len(centres), len(ids))] + rng.normal(0, 0.0003, (len(ids), 2))
+    return pd.DataFrame({
+        "COLLISION_ID": ids, "CRASH_DATE": pd.to_datetime(dates), "LATITUDE": points[:, 0],
+        "LONGITUDE": points[:, 1], "ZIP_CODE": "11201", "NUMBER_OF_KILLS": 0, "NUMBER_OF_INJURED": 1,
+        "NUMBER_OF_CASUALTIES": 1, "BOROUGH": "BROOKLYN",
+    })
+
+
+def test_live_cluster_count_after_merges():
+    rng = np.random.default_rng(1)
+    state = IncrementalDBSCAN(eps_m=150, min_samples=3)
+    # Scattered points first make many small clusters, the dense fill afterwards merges them
+    for _ in range(6):
+        lat = 40.70 + rng.uniform(0, 0.02, 300)
+        lon = -73.95 + rng.uniform(0, 0.02, 300)
+        state.insert(lat, lon)
+        labels = state.labels()
+        assert state.n_clusters == len(set(labels[labels >= 0]))
+    assert state._next_cluster_id > state.n_clusters
+
+
+def test_late_reports_are_clustered(engine, tmp_path):
+    rng = np.random.default_rng(2)
+    state_path = str(tmp_path / "state.pkl")
+    push_data_to_db(crashes(np.arange(1, 201), pd.date_range("2020-06-01", periods=200, freq="h"), rng), engine)
+    first, _ = Incremental_DBSCAN(engine, "crash_data", state_path, 100, 5)
+    assert len(first) == 200
+
+    # Late reports of old crashes, and a crash in the same minute as the newest one
+    late_dates = list(pd.date_range("2019-01-01", periods=49, freq="D")) + [first["CRASH_DATE"].max()]
+    push_data_to_db(crashes(np.arange(201, 251), late_dates, rng), engine)
+    second, state = Incremental_DBSCAN(engine, "crash_data", state_path, 100, 5)
+    assert sorted(second["COLLISION_ID"]) == list(range(201, 251))
+    assert state.n_rows == 250 and state.watermark == 250
+
+    third, _ = Incremental_DBSCAN(engine, "crash_data", state_path, 100, 5)
+    assert third.empty
@@ -0,0 +1,142 @@
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy.exc import OperationalError
+import db_operations
+import push_data
+import result_cache
+import script
+from db_operations import create_table_if_not_exists, push_data_to_db
+from engine_factory import get_engine
+
+
+def crashes(ids):
+    return pd.DataFrame({
+        "COLLISION_ID": ids, "CRASH_DATE": pd.Timestamp("2020-06-01 08:30"), "LATITUDE": 40.7,
+        "LONGITUDE": -73.9, "ZIP_CODE": "11201", "NUMBER_OF_KILLS": 0, "NUMBER_OF_INJURED": 1,
+        "NUMBER_OF_CASUALTIES": 1, "BOROUGH": "BROOKLYN",
+    })
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(db_operations, "RETRY_DELAY", 0.2)
+    path = tmp_path / "crashes.db"
+    # Writers give up on a lock after 50ms instead of the default 5s
+    engine = get_engine(f"sqlite:///{path}?timeout=0.05")
+    create_table_if_not_exists(engine, "crash_data")
+    yield engine, path
+    engine.dispose()
+
+
+def hold_lock(path, seconds):
+    blocker = sqlite3.connect(path, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(seconds, lambda: (blocker.rollback(), blocker.close()))
+    timer.start()
+    return timer
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_write_is_retried_while_another_writer_holds_the_lock(database, bulk):
+    engine, path = database
+    timer = hold_lock(path, 0.3)
+    push_data_to_db(crashes(np.arange(1, 101)), engine, bulk=bulk)
+    timer.join()
+    with engine.connect() as connection:
+        assert pd.read_sql("SELECT COUNT(*) AS N FROM crash_data", connection)["N"].iloc[0] == 100
+        assert pd.read_sql("SELECT SUM(CRASHES) AS N FROM crash_data_rollup_daily", connection)["N"].iloc[0] == 100
+
+
+def test_lock_that_outlasts_the_retries_is_raised(database, monkeypatch):
+    engine, path = database
+    monkeypatch.setattr(db_operations, "WRITE_ATTEMPTS", 2)
+    timer = hold_lock(path, 1.0)
+    with pytest.raises((OperationalError, pd.errors.DatabaseError)):
+        push_data_to_db(crashes(np.arange(1, 101)), engine)
+    timer.join()
+    with engine.connect() as connection:
+        assert pd.read_sql("SELECT COUNT(*) AS N FROM crash_data", connection)["N"].iloc[0] == 0
+
+
+def raw_collisions(rows):
+    """
+    Raw csv rows from (COLLISION_ID, CRASH DATE, CRASH TIME, ZIP CODE, LATITUDE) tuples, one person injured in each
+    """
+    raw = pd.DataFrame(rows, columns=["COLLISION_ID", "CRASH DATE", "CRASH TIME", "ZIP CODE", "LATITUDE"])
+    raw["LONGITUDE"] = -73.9
+    raw["BOROUGH"] = "BROOKLYN"
+    raw["LOCATION"] = "(40.7, -73.9)"
+    for column in push_data.RAW_DTYPES:
+        if column.startswith("NUMBER OF"):
+            raw[column] = 1 if column == "NUMBER OF PERSONS INJURED" else 0
+        elif column not in raw.columns:
+            raw[column] = "Unspecified"
+    return raw
+
+
+def write_collisions_csv(path):
+    # One row per cleaning rule, the last row fails two rules and is counted under the first one
+    rows = [
+        (1, "06/01/2020", "08:30", "11201", 40.70),
+        (2, "06/01/2020", "09:15", "11201", None),
+        (3, "06/02/2020", "10:00", "11215", 0.0),
+        (4, "06/02/2020", "11:45", None, 40.68),
+        (5, "13/45/2020", "12:00", "11217", 40.69),
+        (6, "06/03/2020", "13:05", "11217", 40.69),
+        (7, "not a date", "14:00", "11201", None),
+    ]
+    raw_collisions(rows).to_csv(path, index=False)
+
+
+def test_both_pipelines_clean_the_same_rows(tmp_path):
+    path = tmp_path / "collisions.csv"
+    write_collisions_csv(path)
+
+    ingested = push_data.data_preprocessing(next(push_data.read_csv_chunks(path)))
+    assert ingested.attrs["rejected"] == {"missing_latitude": 2, "zero_latitude": 1, "missing_zip_code": 1,
+                                          "invalid_date": 1}
+    analysed = script.data_preprocessing(pd.read_csv(path, low_memory=False))
+    assert list(ingested["COLLISION_ID"]) == list(analysed["COLLISION_ID"]) == [1, 6]
+    assert list(analysed["NUMBER OF CASUALTIES"]) == [1, 1]
+
+
+def test_incremental_load_writes_new_and_recent_changed_rows(database, tmp_path):
+    engine, _ = database
+    path = tmp_path / "collisions.csv"
+    raw = raw_collisions([
+        (1, "01/05/2020", "08:00", "11201", 40.70),
+        (2, "05/20/2020", "09:00", "11201", 40.70),
+        (3, "06/01/2020", "10:00", "11201", 40.70),
+        (4, "06/02/2020", "11:00", "11201", 40.70),
+        (5, "06/03/2020", "12:00", "11201", 40.70),
+    ])
+    raw.to_csv(path, index=False)
+    assert push_data.incremental_csv_to_db(path, engine) == 5
+    assert db_operations.read_watermark(engine) == (pd.Timestamp("2020-06-03 12:00"), 5)
+
+    # Corrections of an old and of a recent crash, and a late report of a 2019 crash
+    raw.loc[raw["COLLISION_ID"].isin([1, 4]), "NUMBER OF PERSONS INJURED"] = 3
+    late = raw_collisions([(6, "03/01/2019", "07:30", "11215", 40.68)])
+    pd.concat([raw, late]).to_csv(path, index=False)
+    assert push_data.incremental_csv_to_db(path, engine, lookback_days=7) == 2
+
+    with engine.connect() as connection:
+        stored = pd.read_sql("SELECT COLLISION_ID, NUMBER_OF_INJURED FROM crash_data ORDER BY COLLISION_ID",
+                             connection)
+    # The old crash is before the lookback window, it keeps its first values
+    assert list(stored["NUMBER_OF_INJURED"]) == [1, 1, 1, 3, 1, 1]
+    assert db_operations.read_watermark(engine) == (pd.Timestamp("2020-06-03 12:00"), 6)
+    assert push_data.incremental_csv_to_db(path, engine) == 0
+
+
+def test_changed_rows_ignore_float_rounding_and_missing_values():
+    new = crashes([1, 2, 3, 4])
+    new["ZIP_CODE"] = [None, "11201", "11201", "11201"]
+    existing = new.iloc[:3].copy()
+    existing["LATITUDE"] = np.float32(40.7)  # Stored in a FLOAT column
+    existing.loc[2, "NUMBER_OF_INJURED"] = 2
+    assert list(db_operations._changed_rows(new, existing, "COLLISION_ID")) == [False, False, True, True]
@@ -0,0 +1,40 @@
+import inspect
+import pandas as pd
+import report
+
+
+def test_chart_modules_follow_called_code():
+    assert {"report", "analyze_data", "clustering", "plotting"} <= set(report.chart_modules(report.cluster_chart))
+    assert {"EDA", "heat_grid", "plotting"} <= set(report.chart_modules(report.EDA.street_compare))
+    assert "pandas" not in report.chart_modules(report.cluster_chart)
+
+
+def test_fingerprint_changes_with_called_module(monkeypatch):
+    data = pd.DataFrame({"LATITUDE": [40.7, 40.71], "LONGITUDE": [-73.9, -73.91]})
+    before = report.fingerprint(report.cluster_chart, (data, 0.1, 20))
+    getsource = inspect.getsource
+
+    def edited(item):
+        source = getsource(item)
+        return source + "\n# edited\n" if getattr(item, "__name__", None) == "analyze_data" else source
+    monkeypatch.setattr(report.inspect, "getsource", edited)
+    assert report.fingerprint(report.cluster_chart, (data, 0.1, 20)) != before
+
+
+def test_maps_are_part_of_the_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(report.plotting, "REPORT_DIR", None)
+    streets = pd.DataFrame({"ON STREET NAME": ["QUEENS BOULEVARD"] * 3 + ["NORTHERN BOULEVARD"] * 2,
+                            "LATITUDE": [40.72, 40.73, 40.74, 40.75, 40.76],
+                            "LONGITUDE": [-73.85, -73.84, -73.83, -73.88, -73.87]})
+    charts = [("eda_street_compare", report.EDA.street_compare, (streets, streets))]
+    directory = tmp_path / "results"
+    assert report.build_report(charts, str(directory), n_jobs=1) == {"eda_street_compare": "drawn"}
+    manifest = report._read_manifest(str(directory))
+    assert sorted(manifest["eda_street_compare"]["files"]) == ["STREET19_heatmap.html", "STREET20_heatmap.html",
+                                                               "street_compare.png"]
+    assert list(tmp_path.glob("*.html")) == []
+
+    (directory / "STREET20_heatmap.html").unlink()
+    assert report.build_report(charts, str(directory), n_jobs=1) == {"eda_street_compare": "drawn"}
+    assert (directory / "STREET20_heatmap.html").exists()
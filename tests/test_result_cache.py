@@ -0,0 +1,68 @@
+import os
+import pandas as pd
+import pytest
+from sqlalchemy import text
+import result_cache
+from engine_factory import get_engine
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    result_cache.invalidate_cache()
+    engine = get_engine(f"sqlite:///{tmp_path / 'crashes.db'}")
+    with engine.begin() as connection:
+        pd.DataFrame({"COLLISION_ID": range(1000), "CRASH_DATE": pd.Timestamp("2020-01-01")}).to_sql(
+            "crash_data", connection, index=False)
+    yield engine
+    result_cache.invalidate_cache()
+    engine.dispose()
+
+
+def read(engine, limit):
+    return result_cache.cached_read_sql(engine, text("SELECT * FROM crash_data LIMIT :limit"), {"limit": limit})
+
+
+def test_memory_cache_keeps_the_most_recently_used_entries(engine, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_MEMORY_MAX_ENTRIES", 3)
+    for limit in (10, 20, 30):
+        read(engine, limit)
+    read(engine, 10)  # Now the most recently used
+    read(engine, 40)
+    kept = [len(data) for data, _ in result_cache._memory_cache.values()]
+    assert kept == [30, 10, 40]
+
+
+def test_memory_cache_stays_within_its_byte_budget(engine, monkeypatch):
+    one = read(engine, 100)
+    size = int(one.memory_usage(index=True, deep=True).sum())
+    result_cache.invalidate_cache()
+    monkeypatch.setattr(result_cache, "CACHE_MEMORY_MAX_BYTES", int(2.5 * size))
+    for limit in range(100, 106):
+        assert len(read(engine, limit)) == limit
+    assert result_cache._memory_bytes <= int(2.5 * size)
+    assert len(result_cache._memory_cache) == 2
+    assert result_cache._memory_bytes == sum(size for _, size in result_cache._memory_cache.values())
+
+
+def test_cache_falls_back_to_pickle_without_pyarrow(engine, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_FORMAT", None)
+    monkeypatch.setattr(result_cache.importlib.util, "find_spec", lambda name: None)
+    first = read(engine, 10)
+    assert result_cache.CACHE_FORMAT == "pkl"
+    assert [name.rsplit(".", 1)[1] for name in os.listdir(result_cache.CACHE_DIR)] == ["pkl"]
+    result_cache._memory_clear()
+    pd.testing.assert_frame_equal(read(engine, 10), first)
+
+
+def test_eviction_leaves_files_being_written(engine, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_FORMAT", "pkl")
+    to_pickle = pd.DataFrame.to_pickle
+
+    def write_then_evict(data, path, *args, **kwargs):
+        to_pickle(data, path, *args, **kwargs)
+        result_cache._evict(0)  # Another query evicts everything before this write is renamed
+
+    monkeypatch.setattr(pd.DataFrame, "to_pickle", write_then_evict)
+    assert len(read(engine, 10)) == 10
+    assert len(os.listdir(result_cache.CACHE_DIR)) == 1
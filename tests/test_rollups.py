@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from aggregations import crash_counts
+from db_operations import push_data_to_db, upsert_data_to_db
+
+GROUPINGS = [["DAY", "BOROUGH"], ["DAY", "ZIP_CODE"], ["YEAR", "MONTH"], ["DAY_OF_WEEK"], ["HOUR", "BOROUGH"]]
+
+
+def crashes(ids, rng):
+    return pd.DataFrame({
+        "COLLISION_ID": ids,
+        "CRASH_DATE": pd.Timestamp("2020-06-01") + pd.to_timedelta(rng.integers(0, 10 * 24 * 60, len(ids)), unit="min"),
+        "LATITUDE": 40.7, "LONGITUDE": -73.9,
+        "ZIP_CODE": rng.choice(["11201", "11215", None], len(ids)),
+        "NUMBER_OF_KILLS": rng.integers(0, 2, len(ids)), "NUMBER_OF_INJURED": rng.integers(0, 4, len(ids)),
+        "BOROUGH": rng.choice(["BROOKLYN", "QUEENS", None], len(ids)),
+    }).assign(NUMBER_OF_CASUALTIES=lambda frame: frame["NUMBER_OF_KILLS"] + frame["NUMBER_OF_INJURED"])
+
+
+def assert_rollups_match_raw(engine):
+    for group_by in GROUPINGS:
+        from_rollup = crash_counts(engine, group_by)
+        raw = crash_counts(engine, group_by, use_rollups=False)
+        pd.testing.assert_frame_equal(from_rollup, raw, check_dtype=False)
+
+
+def test_rollups_follow_inserts_and_changed_rows(engine):
+    rng = np.random.default_rng(5)
+    data = crashes(np.arange(1, 301), rng)
+    push_data_to_db(data, engine)
+    assert_rollups_match_raw(engine)
+
+    # Corrections of loaded crashes, one moved to a day and borough of its own, and new crashes
+    changed = data.iloc[:20].copy()
+    changed["NUMBER_OF_INJURED"] += 2
+    changed["NUMBER_OF_CASUALTIES"] += 2
+    changed.loc[changed.index[0], ["CRASH_DATE", "BOROUGH"]] = [pd.Timestamp("2020-07-04 23:10"), "BRONX"]
+    assert upsert_data_to_db(pd.concat([changed, data.iloc[20:40], crashes(np.arange(301, 321), rng)]), engine) == 40
+    assert_rollups_match_raw(engine)
+    assert crash_counts(engine, ["BOROUGH"])["CRASHES"].sum() == 320
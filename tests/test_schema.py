@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+from sqlalchemy import inspect, text
+from engine_factory import get_engine
+from schema import borough_date_index, crash_table_ddl, delete_legacy_rows, migrate_crash_table
+
+# The crash table before the compact schema, without COLLISION_ID
+LEGACY_TABLE = """
+CREATE TABLE crash_data (
+    CRASH_DATE DATETIME,
+    LATITUDE FLOAT,
+    LONGITUDE FLOAT,
+    ZIP_CODE VARCHAR(255),
+    NUMBER_OF_KILLS INT,
+    NUMBER_OF_INJURED INT,
+    NUMBER_OF_CASUALTIES INT,
+    BOROUGH VARCHAR(255)
+);
+"""
+
+LEGACY_ROWS = [
+    ("2020-06-02 10:00:00", 40.70, -73.90, "11201", 0, 1, 1, "BROOKLYN"),
+    ("2020-06-01 08:30:00", 40.75, -73.85, "11368-1234", 1, 2, 3, "QUEENS"),
+    ("2020-06-03 12:00:00", 40.80, -73.95, None, 0, 0, 0, "Unknown"),
+    (None, 40.71, -73.91, "11215", 0, 1, 1, "BROOKLYN"),
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'crashes.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(LEGACY_TABLE))
+        connection.exec_driver_sql("INSERT INTO crash_data VALUES (?, ?, ?, ?, ?, ?, ?, ?)", LEGACY_ROWS)
+    yield engine
+    engine.dispose()
+
+
+def read_crashes(engine):
+    with engine.connect() as connection:
+        return pd.read_sql("SELECT * FROM crash_data ORDER BY COLLISION_ID", connection)
+
+
+def test_legacy_rows_get_surrogate_ids(engine):
+    migrate_crash_table(engine)
+    crashes = read_crashes(engine)
+    # Rows without a crash date are dropped, the others are numbered by date
+    assert list(crashes["COLLISION_ID"]) == [-3, -2, -1]
+    assert list(crashes["ZIP_CODE"].fillna("")) == ["", "11201", "11368"]
+    assert list(crashes["BOROUGH"].fillna("")) == ["", "BROOKLYN", "QUEENS"]
+    assert borough_date_index("crash_data") in {index["name"] for index in inspect(engine).get_indexes("crash_data")}
+
+    migrate_crash_table(engine)
+    pd.testing.assert_frame_equal(read_crashes(engine), crashes)
+
+    delete_legacy_rows(engine)
+    assert read_crashes(engine).empty
+
+
+def test_interrupted_migration_is_finished_by_the_next_run(engine):
+    # A run that failed before the swap leaves a half-filled copy
+    with engine.begin() as connection:
+        for statement in crash_table_ddl("crash_data_compact", "sqlite", index_table_name="crash_data"):
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO crash_data_compact (COLLISION_ID, CRASH_DATE) "
+                                "VALUES (-1, '2020-06-01 08:30:00')"))
+    migrate_crash_table(engine)
+    assert len(read_crashes(engine)) == 3
+
+    # A run that failed after the swap leaves the old table
+    with engine.begin() as connection:
+        connection.execute(text(LEGACY_TABLE.replace("crash_data", "crash_data_legacy")))
+    migrate_crash_table(engine)
+    assert set(inspect(engine).get_table_names()) == {"crash_data"}
+    assert len(read_crashes(engine)) == 3
@@ -0,0 +1,41 @@
+import pandas as pd
+import EDA
+from time_series import count_series, max_windows, sweep_windows, top_windows
+
+
+def crashes(days):
+    return pd.DataFrame({"CRASH_DATE": pd.date_range("2020-01-01", periods=days, freq="D").repeat(2)})
+
+
+def test_window_longer_than_the_series_has_no_rows():
+    windows = max_windows(count_series(crashes(30), "D"), 100)
+    assert windows.empty
+    assert list(windows.columns) == ["START", "END", "CRASHES"]
+
+
+def test_window_that_fits():
+    windows = max_windows(count_series(crashes(120), "D"), 100)
+    assert len(windows) == 1
+    assert windows.iloc[0]["CRASHES"] == 200
+    assert windows.iloc[0]["END"] - windows.iloc[0]["START"] == pd.Timedelta(days=99)
+
+
+def test_consecutive_crashes_on_a_short_slice(capsys):
+    EDA.consecutive_crashes_for_100days(crashes(30).rename(columns={"CRASH_DATE": "CRASH DATE"}))
+    assert "fewer than 100" in capsys.readouterr().out
+
+
+def test_sweep_skips_windows_longer_than_the_series():
+    assert sorted(sweep_windows(count_series(crashes(5), "D"), windows=range(1, 10))["WINDOW"]) == [1, 2, 3, 4, 5]
+
+
+def test_no_crashes_count_no_periods(capsys):
+    empty = pd.DataFrame({"CRASH DATE": pd.Series([], dtype="datetime64[ns]")})
+    counts = count_series(empty, "D")
+    assert counts.empty and list(counts.columns) == ["ALL"]
+    assert max_windows(counts, 100).empty
+    assert top_windows(counts, k=12).empty
+
+    EDA.find_12days_with_most_Accidents(empty)
+    EDA.consecutive_crashes_for_100days(empty)
+    assert "fewer than 100" in capsys.readouterr().out
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from aggregations import crash_counts
+
+FREQUENCIES = {"D": ("DAY",), "h": ("DAY", "HOUR")}
+
+
+def _dense_counts(periods, groups, weights, freq, start, end):
+    """
+    Sums weights into a periods x groups matrix covering every period from start to end
+    """
+    index = pd.date_range(start, end, freq=freq)
+    group_codes, group_names = pd.factorize(groups, sort=True)
+    keep = (periods >= index[0]) & (periods <= index[-1]) & (group_codes >= 0)
+    positions = np.asarray((periods[keep] - index[0]) // pd.Timedelta(1, unit=freq), dtype=np.int64)
+    cells = np.bincount(positions * len(group_names) + group_codes[keep], weights=weights[keep],
+                        minlength=len(index) * len(group_names))
+    return pd.DataFrame(cells.reshape(len(index), len(group_names)).astype(np.int64), index=index,
+                        columns=pd.Index(group_names, name="GROUP"))
+
+
+def _empty_counts(groups, freq):
+    """
+    The output of _dense_counts without periods, one column per distinct group
+    """
+    return pd.DataFrame(np.zeros((0, len(set(groups))), dtype=np.int64), index=pd.DatetimeIndex([], freq=freq),
+                        columns=pd.Index(sorted(set(groups)), name="GROUP"))
+
+
+def count_series(data, freq="D", group_column=None, date_column=None, start=None, end=None):
+    """
+    Counts crashes per day or hour on a dense index, periods without crashes count 0
+    :param data: Crash rows, a DataFrame or a CrashDataset slice converted with crash_dataset.as_frame
+    :param freq: 'D' for days or 'h' for hours
+    :param group_column: Count every value of this column separately, e.g. BOROUGH, one ALL column when None
+    :param date_column: Datetime column, CRASH DATE or CRASH_DATE when None
+    :param start: First period, the first crash when None
+    :param end: Last period (inclusive), the last crash when None
+    :return : returns a DataFrame with one row per period and one column per group, no rows when
+              there are no crashes and no start or end
+    """
+    date_column = date_column or ("CRASH DATE" if "CRASH DATE" in data.columns else "CRASH_DATE")
+    periods = pd.DatetimeIndex(data[date_column]).floor(freq)
+    start = pd.Timestamp(start if start is not None else periods.min()).floor(freq)
+    end = pd.Timestamp(end if end is not None else periods.max()).floor(freq)
+    groups = np.full(len(data), "ALL", dtype=object) if group_column is None else data[group_column].to_numpy()
+    if pd.isna(start) or pd.isna(end):
+        return _empty_counts(["ALL"] if group_column is None else groups[periods.notna()], freq)
+    return _dense_counts(periods, groups, np.ones(len(data)), freq, start, end)
+
+
+def count_series_from_db(engine, freq="D", borough=None, start_date=None, end_date=None, table_name="crash_data"):
+    """
+    count_series per borough with the counting done by the database, from the rollups when they exist
+    :param engine: The SQLAlchemy engine object
+    :param freq: 'D' for days or 'h' for hours
+    :param borough: A borough or a list of boroughs
+    :param start_date: First day
+    :param end_date: Day after the last one (exclusive)
+    :param table_name: The table name
+    :return : returns a DataFrame with one row per period and one column per borough, no rows when
+              there are no crashes and no start_date or end_date
+    """
+    counts = crash_counts(engine, list(FREQUENCIES[freq]) + ["BOROUGH"], borough, start_date, end_date,
+                          table_name=table_name)
+    counts = counts[counts["BOROUGH"].notna()]
+    periods = pd.DatetimeIndex(pd.to_datetime(counts["DAY"]))
+    if freq == "h":
+        periods = periods + pd.to_timedelta(counts["HOUR"].to_numpy(), unit="h")
+    start = pd.Timestamp(start_date) if start_date is not None else periods.min()
+    end = (pd.Timestamp(end_date) - pd.Timedelta(1, unit=freq)) if end_date is not None else periods.max()
+    if pd.isna(start) or pd.isna(end):
+        return _empty_counts(counts["BOROUGH"], freq)
+    return _dense_counts(periods, counts["BOROUGH"].to_numpy(), counts["CRASHES"].to_numpy(dtype="float64"),
+                         freq, start.floor(freq), end.floor(freq))
+
+
+def _prefix_sums(counts):
+    return np.vstack([np.zeros((1, counts.shape[1]), dtype=np.int64), np.cumsum(counts.to_numpy(), axis=0)])
+
+
+def window_sums(counts, window, prefix=None):
+    """
+    Crashes in every window of consecutive periods, from the difference of two prefix sums
+    :param counts: Output of count_series
+    :param window: Number of periods per window
+    :param prefix: Prefix sums of counts, computed when None
+    :return : returns a DataFrame indexed by the first period of every window
+    """
+    prefix = _prefix_sums(counts) if prefix is None else prefix
+    sums = prefix[window:] - prefix[:-window]
+    return pd.DataFrame(sums, index=counts.index[:len(sums)].rename("START"), columns=counts.columns)
+
+
+def max_windows(counts, window, prefix=None):
+    """
+    The window of consecutive periods with the most crashes for every group
+    :param counts: Output of count_series
+    :param window: Number of periods per window
+    :param prefix: Prefix sums of counts, computed when None
+    :return : returns one row per group with START, END (the last period, inclusive) and CRASHES, no
+              rows when the series is shorter than the window
+    """
+    sums = window_sums(counts, window, prefix)
+    if sums.empty:
+        return pd.DataFrame(columns=["START", "END", "CRASHES"], index=counts.columns[:0])
+    best = sums.to_numpy().argmax(axis=0)
+    starts = sums.index[best]
+    return pd.DataFrame({
+        "START": starts,
+        "END": starts + (window - 1) * pd.Timedelta(1, unit=counts.index.freqstr),
+        "CRASHES": sums.to_numpy()[best, np.arange(sums.shape[1])],
+    }, index=counts.columns)
+
+
+def sweep_windows(counts, windows=range(1, 366)):
+    """
+    max_windows for many window lengths, the prefix sums are computed once
+    :param counts: Output of count_series
+    :param windows: Window lengths in periods
+    :return : returns one row per window length and group with START, END and CRASHES
+    """
+    prefix = _prefix_sums(counts)
+    results = [max_windows(counts, window, prefix).assign(WINDOW=window)
+               for window in windows if window <= len(counts)]
+    if not results:
+        return pd.DataFrame(columns=["GROUP", "WINDOW", "START", "END", "CRASHES"])
+    return pd.concat(results).reset_index()[["GROUP", "WINDOW", "START", "END", "CRASHES"]]
+
+
+def top_windows(counts, k=12, window=1, by_year=False):
+    """
+    The k windows with the most crashes of every group, and of every year when by_year is True.
+    Windows longer than one period may overlap.
+    :param counts: Output of count_series
+    :param k: Number of windows to keep
+    :param window: Number of periods per window, 1 for the top days or hours
+    :param by_year: Rank the windows of every year (of their first period) separately
+    :return : returns GROUP, YEAR (with by_year), START, END and CRASHES ordered by rank
+    """
+    sums = window_sums(counts, window)
+    long = sums.stack().rename("CRASHES").reset_index()
+    keys = ["GROUP"]
+    if by_year:
+        long["YEAR"] = long["START"].dt.year
+        keys.append("YEAR")
+    # Stable sort on the count, then on the keys, keeps the earlier window first among ties
+    long = long.sort_values("CRASHES", ascending=False, kind="stable").sort_values(keys, kind="stable")
+    long = long.groupby(keys, sort=False).head(k)
+    long["END"] = long["START"] + (window - 1) * pd.Timedelta(1, unit=counts.index.freqstr)
+    return long[keys + ["START", "END", "CRASHES"]].reset_index(drop=True)
@@ -1,13 +1,9 @@
-import pandas as pd
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import inspect
 import matplotlib.pyplot as plt
-
-
-def create_connection(host_name, user_name, user_password, db_name):
-    """Create a database connection."""
-    connection_str = f"mysql+pymysql://{user_name}:{user_password}@{host_name}/{db_name}"
-    engine = create_engine(connection_str)
-    return engine
+from aggregations import DAY_NAMES, crash_counts
+from concurrent_queries import engine_workers, gather
+from db_operations import create_connection
+from plotting import finish_figure
 
 
 def get_table_columns(engine, table_name):
@@ -17,96 +13,94 @@ def get_table_columns(engine, table_name):
     return columns
 
 
-def fetch_day_of_week_data(engine):
-    query = """
-    SELECT 
-        `CRASH_DATE`
-    FROM 
-        `crash_data`
-    WHERE 
-        `CRASH_DATE` BETWEEN '2019-01-01' AND '2020-10-31' AND `BOROUGH` = 'BROOKLYN';
+def fetch_day_of_week_data(engine, borough="BROOKLYN", start_date="2019-01-01", end_date="2020-11-01",
+                           table_name="crash_data"):
+    """
+    Fetch the number of crashes per year and day of the week, grouped by the database.
+    Shares its query with fetch_hourly_crash_data.
+    """
+    counts = crash_counts(engine, ["YEAR", "DAY_OF_WEEK", "HOUR"], borough, start_date, end_date,
+                          table_name=table_name)
+    return counts.groupby(["YEAR", "DAY_OF_WEEK"], as_index=False)["CRASHES"].sum()
+
+
+def fetch_hourly_crash_data(engine, borough="BROOKLYN", start_date="2019-01-01", end_date="2020-11-01",
+                            table_name="crash_data"):
     """
-    return pd.read_sql(query, engine)
-
-
-def fetch_hourly_crash_data(engine):
-    query = """
-    SELECT 
-        `CRASH_DATE`
-    FROM 
-        `crash_data`
-    WHERE 
-        `CRASH_DATE` BETWEEN '2019-01-01' AND '2020-10-31'
-        AND `BOROUGH` = 'BROOKLYN';
+    Fetch the number of crashes per hour of the day, grouped by the database.
+    Shares its query with fetch_day_of_week_data.
     """
-    return pd.read_sql(query, engine)
+    counts = crash_counts(engine, ["YEAR", "DAY_OF_WEEK", "HOUR"], borough, start_date, end_date,
+                          table_name=table_name)
+    return counts.groupby("HOUR", as_index=False)["CRASHES"].sum()
 
 
-def analyze_day_of_the_week(data):
+def fetch_borough_charts(engine, boroughs=("BROOKLYN",), start_date="2019-01-01", end_date="2020-11-01",
+                         table_name="crash_data"):
     """
-    Analyze and plot crashes by day of the week.
+    Fetches the day of the week and hourly data of several boroughs, the queries run concurrently
+    :return : returns a dict of borough -> (day of the week data, hourly data)
     """
-    data['CRASH_DATE'] = pd.to_datetime(data['CRASH_DATE'])
-    data['YEAR'] = data['CRASH_DATE'].dt.year
-    data['DAY_OF_WEEK'] = data['CRASH_DATE'].dt.day_name()
+    tasks = {}
+    for borough in boroughs:
+        tasks[(borough, "day_of_week")] = lambda borough=borough: fetch_day_of_week_data(
+            engine, borough, start_date, end_date, table_name)
+        tasks[(borough, "hourly")] = lambda borough=borough: fetch_hourly_crash_data(
+            engine, borough, start_date, end_date, table_name)
+    results = gather(tasks, engine_workers(engine))
+    return {borough: (results[(borough, "day_of_week")], results[(borough, "hourly")]) for borough in boroughs}
 
-    # Filter data for 2019 and 2020
-    data = data[data['YEAR'].isin([2019, 2020])]
 
-    # Group by year and day of the week
-    daily_crashes = data.groupby(['DAY_OF_WEEK', 'YEAR']).size().unstack()
+def analyze_day_of_the_week(data, borough="BROOKLYN"):
+    """
+    Plot crashes by day of the week.
+    :param data: Crash counts per YEAR and DAY_OF_WEEK from fetch_day_of_week_data
+    """
+    data = data.assign(DAY_OF_WEEK=data['DAY_OF_WEEK'].map(DAY_NAMES))
+
+    # One column per year
+    daily_crashes = data.pivot(index='DAY_OF_WEEK', columns='YEAR', values='CRASHES')
 
     # Reorder the days for plotting
     ordered_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     daily_crashes = daily_crashes.reindex(ordered_days)
 
     # Plot
+    years = " vs ".join(str(year) for year in daily_crashes.columns)
     daily_crashes.plot(kind='bar', figsize=(15, 8))
     plt.xlabel('Day of the Week')
     plt.ylabel('Number of Crashes')
-    plt.title('Brooklyn - Day of the Week Crash Comparison (2019 vs 2020)')
+    plt.title(f'{borough.title()} - Day of the Week Crash Comparison ({years})')
     plt.legend(title='Year')
-    plt.show()
+    finish_figure(f"{borough.lower()}_day_of_week")
 
 
-def analyze_hourly_crashes(data):
+def analyze_hourly_crashes(data, borough="BROOKLYN"):
     """
-    Analyze and plot crashes by hour of the day.
+    Plot crashes by hour of the day.
+    :param data: Crash counts per HOUR from fetch_hourly_crash_data
     """
-    data['CRASH_DATE'] = pd.to_datetime(data['CRASH_DATE'])
-    if data['CRASH_DATE'].dt.hour.isnull().all():
-        print("The CRASH_DATE column does not contain time information.")
+    if data.empty:
+        print("No crashes found for the hourly comparison.")
         return
 
-    data['HOUR'] = data['CRASH_DATE'].dt.hour
-
-    # Extract the year and hour
-    data['YEAR'] = data['CRASH_DATE'].dt.year
-
-    # Filter data for 2019 and 2020
-    data = data[data['YEAR'].isin([2019, 2020])]
-
-    # Group by hour
-    hourly_crashes = data.groupby('HOUR').size()
+    hourly_crashes = data.set_index('HOUR')['CRASHES'].reindex(range(0, 24), fill_value=0)
 
     # Plot
     hourly_crashes.plot(kind='bar', figsize=(15, 8))
     plt.xlabel('Hour of Day')
     plt.ylabel('Number of Crashes')
-    plt.title('Brooklyn - Hourly Crash Comparison')
+    plt.title(f'{borough.title()} - Hourly Crash Comparison')
     plt.xticks(range(0, 24), range(0, 24))  # Setting x-ticks to show every hour
-    plt.show()
+    finish_figure(f"{borough.lower()}_hourly")
 
 
 if __name__ == "__main__":
-    # MySQL database connection details
-    host_name = "localhost"
-    user_name = "root"
-    user_password = "nc8121"
-    db_name = "nyc_crash_data"
+    boroughs = ["BROOKLYN"]  # Add more boroughs to chart them too, their queries run concurrently
+    start_date = "2019-01-01"
+    end_date = "2020-11-01"  # exclusive, covers the whole of October 2020
 
-    # Create a connection to the MySQL database
-    engine = create_connection(host_name, user_name, user_password, db_name)
+    engine = create_connection()
 
     # Check column names
     table_columns = get_table_columns(engine, 'crash_data')
@@ -114,9 +108,10 @@ if __name__ == "__main__":
 
     # Fetch data
     if 'CRASH_DATE' in table_columns:
-        day_of_week_data = fetch_day_of_week_data(engine)
-        analyze_day_of_the_week(day_of_week_data)
-        hourly_crash_data = fetch_hourly_crash_data(engine)
-        analyze_hourly_crashes(hourly_crash_data)
+        # The queries run at the same time, the charts are drawn once all are back
+        borough_data = fetch_borough_charts(engine, boroughs, start_date, end_date)
+        for borough, (day_of_week_data, hourly_crash_data) in borough_data.items():
+            analyze_day_of_the_week(day_of_week_data, borough)
+            analyze_hourly_crashes(hourly_crash_data, borough)
     else:
         print("'CRASH_DATE' column not found in 'crash_data' table.")